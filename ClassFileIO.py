@@ -0,0 +1,378 @@
+import io
+import os
+import mmap
+import queue
+import tempfile
+import threading
+
+import StigmaMetrics
+
+
+# Reading and writing class (.smali) files off the instrumentation thread.
+#
+# ReadAhead reads the next few class files in a background thread while
+# the current one is being instrumented, WriteBehind writes finished
+# classes in a background thread.  Both are connected to the instrumenter
+# by bounded queues, so at most a few classes are held in memory.  On
+# slow (e.g., network) disks the instrumenter then rarely waits on I/O.
+#
+# Every class is written with a single write to a temporary file in the
+# same folder which then replaces the class file (os.replace is atomic),
+# so a crash never leaves a half-written class behind.  It also means the
+# file is a new file, not modified in place, which DecodedApkCache needs
+# (the class file might be a hard link into the cache).
+#
+# MappedClassFile maps a class file into memory instead of reading it and
+# finds the methods as byte offsets, so a method is only decoded to text
+# if somebody asks for it (see SmaliClassDef.from_mapped_file()).
+
+metrics = StigmaMetrics.StigmaMetrics.get_instance()
+
+# how many classes may wait in each queue
+QUEUE_SIZE = 16
+
+# how long (seconds) a blocked thread waits before checking if it was stopped
+_POLL_SECONDS = 0.1
+
+
+def read_class_file(path):
+    with open(path, "r") as fh:
+        return fh.readlines()
+
+
+def write_class_file(path, text):
+    # atomically replaces path with text
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".stigma-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            fh.write(text)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_class_chunks(path, chunks):
+    # like write_class_file() but the text is a list of str and bytes-like
+    # (e.g., memoryview) parts, the bytes-like parts are written as they are
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".stigma-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            text = []
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    text.append(chunk)
+                    continue
+                if text:
+                    fh.write("".join(text).encode("utf-8"))
+                    text = []
+                fh.write(chunk)
+            fh.write("".join(text).encode("utf-8"))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _find_methods(data):
+    # [(start, end), ...] of every method in data: from a ".method" line
+    # up to and including the next ".end method" line (which may be
+    # indented), the same methods SmaliClassDef finds in the lines
+    methods = []
+    start = _find_line(data, b".method", 0)
+    while start != -1:
+        end = data.find(b".end method", start)
+        # only white space in front of it
+        while end != -1 and data[data.rfind(b"\n", start, end) + 1:end].strip() != b"":
+            end = data.find(b".end method", end + 1)
+        if end == -1:
+            break # not a complete method
+        end = data.find(b"\n", end)
+        end = len(data) if end == -1 else end + 1
+        methods.append((start, end))
+        start = _find_line(data, b".method", end)
+    return methods
+
+
+def _find_line(data, prefix, pos):
+    # the offset of the first line at or after pos (pos is the start of a
+    # line) starting with prefix, -1 if there is none
+    if data[pos:pos + len(prefix)] == prefix:
+        return pos
+    idx = data.find(b"\n" + prefix, pos)
+    return -1 if idx == -1 else idx + 1
+
+
+class MappedClassFile:
+    # a class file mapped into memory (read only)
+    #
+    #     mapped = MappedClassFile(path)
+    #     mapped.method_index    [(start, end), ...] byte offsets of every method
+    #     mapped.get_lines(start, end)    decoded, like read_class_file()
+    #     mapped.get_view(start, end)     the bytes, not copied
+    #     mapped.close()
+    #
+    # The file can be replaced (write_class_file()) while it is mapped,
+    # the old contents stay mapped until close()
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                # an empty file can't be mapped
+                self.data = b""
+            else:
+                self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        self.method_index = _find_methods(self.data)
+
+    def get_num_lines(self):
+        # the number of lines read_class_file() would give
+        num_lines = 0
+        for pos in range(0, len(self.data), 1 << 20):
+            num_lines += self.data[pos:pos + (1 << 20)].count(b"\n")
+        if len(self.data) > 0 and self.data[-1:] != b"\n":
+            num_lines += 1 # the last line has no line break
+        return num_lines
+
+    def get_lines(self, start=0, end=None):
+        if end is None:
+            end = len(self.data)
+        text = str(self.view[start:end], "utf-8")
+        # newline=None: the same line endings as reading the file in text mode
+        return io.StringIO(text, newline=None).readlines()
+
+    def get_view(self, start, end):
+        return self.view[start:end]
+
+    def outline(self):
+        # generator, the lines outside of the methods (str) and the
+        # methods ((start, end) from method_index) in the order of the file
+        pos = 0
+        for start, end in self.method_index:
+            yield from self.get_lines(pos, start)
+            yield (start, end)
+            pos = end
+        yield from self.get_lines(pos)
+
+    def close(self):
+        # every view from get_view() must be gone by now
+        if self.data is not None:
+            self.view.release()
+            if isinstance(self.data, mmap.mmap):
+                self.data.close()
+            self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class ReadAhead:
+    # iterates over (path, lines) in the order of paths, the files are read
+    # by a background thread up to queue_size files ahead
+    #
+    #     with ReadAhead(paths) as reader:
+    #         for path, lines in reader:
+    #             ...
+
+    def __init__(self, paths, queue_size=QUEUE_SIZE):
+        self.paths = paths
+        self.queue = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read_all, name="stigma-read-ahead", daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # returns False if the reader was closed in the meantime
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read_all(self):
+        for path in self.paths:
+            try:
+                with metrics.stage("read"):
+                    item = (path, read_class_file(path), None)
+            except Exception as e:
+                # handed to the consumer, which raises it
+                item = (path, None, e)
+            if not self._put(item):
+                return
+
+    def __iter__(self):
+        for i in range(len(self.paths)):
+            path, lines, error = self.queue.get()
+            if error is not None:
+                raise error
+            yield path, lines
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class WriteBehind:
+    # writes (path, text) with write_class_file() in a background thread
+    #
+    #     with WriteBehind() as writer:
+    #         writer.write(path, text)
+    #
+    # An error in the writer thread is raised by the next write() or by close()
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._write_all, name="stigma-write-behind", daemon=True)
+        self.thread.start()
+
+    def _write_all(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue # drain the queue, nothing more is written
+            path, text = item
+            try:
+                with metrics.stage("write", True):
+                    write_class_file(path, text)
+            except Exception as e:
+                self.error = e
+
+    def _raise_error(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def write(self, path, text):
+        self._raise_error()
+        self.queue.put((path, text))
+
+    def close(self):
+        # waits until everything is written
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # already failing, just stop the thread
+            try:
+                self.close()
+            except Exception:
+                pass
+        return False
+
+
+
+def main():
+    print("Testing ClassFileIO...")
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        paths = []
+        for i in range(50):
+            path = os.path.join(test_dir, "Class" + str(i) + ".smali")
+            with open(path, "w") as fh:
+                fh.write(".class LClass" + str(i) + ";\n.super Ljava/lang/Object;\n")
+            paths.append(path)
+
+        print("\tread ahead tests...")
+        with ReadAhead(paths, 4) as reader:
+            read = list(reader)
+        assert([path for path, lines in read] == paths)
+        assert(read[7][1] == [".class LClass7;\n", ".super Ljava/lang/Object;\n"])
+
+        # stopping early doesn't hang
+        with ReadAhead(paths, 2) as reader:
+            for path, lines in reader:
+                break
+
+        try:
+            with ReadAhead(paths[:3] + [os.path.join(test_dir, "missing.smali")]) as reader:
+                list(reader)
+            assert(False)
+        except FileNotFoundError:
+            pass
+
+        print("\twrite behind tests...")
+        # a hard link must not be changed when the file is written
+        os.link(paths[0], os.path.join(test_dir, "link.smali"))
+        with WriteBehind(4) as writer:
+            for i, path in enumerate(paths):
+                writer.write(path, "instrumented " + str(i) + "\n")
+        for i, path in enumerate(paths):
+            assert(read_class_file(path) == ["instrumented " + str(i) + "\n"])
+        assert(read_class_file(os.path.join(test_dir, "link.smali"))[0] == ".class LClass0;\n")
+        # no temporary files left
+        assert(len(os.listdir(test_dir)) == len(paths) + 1)
+
+        try:
+            with WriteBehind() as writer:
+                writer.write(os.path.join(test_dir, "no_such_dir", "A.smali"), "text")
+            assert(False)
+        except FileNotFoundError:
+            pass
+
+        print("\tmapped file tests...")
+        path = os.path.join(test_dir, "Mapped.smali")
+        text = ".class LMapped;\n\n# direct methods\n.method public a()V\n    .locals 0\n\n    return-void\n.end method\n\n" + \
+            ".method public b()V\r\n    return-void\r\n    .end method\n# end\n"
+        with open(path, "w", newline="") as fh:
+            fh.write(text)
+        with MappedClassFile(path) as mapped:
+            assert(len(mapped.method_index) == 2)
+            start, end = mapped.method_index[1]
+            assert(bytes(mapped.get_view(start, end)) == b".method public b()V\r\n    return-void\r\n    .end method\n")
+            assert(mapped.get_lines(start, end) == [".method public b()V\n", "    return-void\n", "    .end method\n"])
+            outline = list(mapped.outline())
+            assert(outline[:3] == [".class LMapped;\n", "\n", "# direct methods\n"])
+            assert(outline[3] == mapped.method_index[0] and outline[-1] == "# end\n")
+            assert(mapped.get_lines() == read_class_file(path))
+
+            # replacing the file doesn't change what is mapped
+            chunks = ["# start\n", mapped.get_view(start, end), "# end\n"]
+            write_class_chunks(path, chunks)
+            chunks = None
+            with open(path, "rb") as fh:
+                assert(fh.read() == b"# start\n.method public b()V\r\n    return-void\r\n    .end method\n# end\n")
+            assert(mapped.get_lines(0, 16) == [".class LMapped;\n"])
+            
+        for text in ["", "\n", "a\nb", "a\r\nb\n"]:
+            with open(path, "w", newline="") as fh:
+                fh.write(text)
+            with MappedClassFile(path) as mapped:
+                assert(mapped.get_lines() == read_class_file(path))
+                assert(mapped.get_num_lines() == len(read_class_file(path)))
+                assert(mapped.method_index == [])
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
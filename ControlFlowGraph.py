@@ -1,9 +1,13 @@
 
 '''
-This class builds a control flow graph for a given method text using the networkX library.
+This class builds a control flow graph for a given method text.
 This graph generates nodes for each block of code (list of all contingunous instructions) until
 it sees an if, cond, goto, switch, or return and in that cases it branches out, creating a new node.
 Then it creates an edge from existing blocks of code to this new branching node.  
+
+The blocks are BasicBlock objects in a list (the node counter is the index)
+and the edges are arrays of node counters, networkx is only used to draw
+the graph (show(), to_networkx()) and imported when it is.
 https://networkx.org/documentation/stable/index.html
 
 
@@ -35,151 +39,171 @@ goto :goto_4
 
 import StigmaStringParsingLib
 import re
-import networkx as nx
-import matplotlib.pyplot as plt
-from networkx.drawing.nx_pydot import graphviz_layout
-import time
+import array
+import heapq
+
+
+class BasicBlock:
+    # a node of the graph, can be used like the attribute dict of a
+    # networkx node: block["text"], block["visited"] = True, "type_list" in block
+    __slots__ = ["text", "node_counter", "visited", "is_in_try_block", "type_list"]
+
+    def __init__(self, text, node_counter, is_in_try_block):
+        self.text = text
+        self.node_counter = node_counter
+        self.visited = False
+        self.is_in_try_block = is_in_try_block
+        # type_list is only set once the block has been type checked
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in BasicBlock.__slots__ and hasattr(self, key)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in BasicBlock.__slots__ if hasattr(self, key)]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
 
 class ControlFlowGraph:
 
     def __init__(self, text):
         # text should be a list of lines of code (e.g., [""    .locals 6", "    add v1, v2, v3", "    const v3, 0x1", ])
-        self.G = nx.DiGraph()   
-        self.label_list = []    #this contains a list of hashmaps, where each hashmap has key:label (e.g ':cond_3') and value: nodecounter for corresponding if parent (e.g 3)
-        self.visited_lines = [] #this contains all the line index which have been visited 
-        self.label_dict = {}    #this dictionary has labels for nodes to display when u show the graph. (only for our visualization no real purpose)
+        self.blocks = []        #the nodes of the graph (BasicBlock), the index of a block is its node counter
+        self.successors = []    #for each node, an array of the node counters of its successors
+        self.predecessor_lists = [] #for each node, an array of the node counters of its predecessors
+        self.branch_nodes = {}  #label (e.g ':cond_3') => node counters of the branches to it (e.g [3]), the parents of the label's node
+        self.visited_lines = set() #this contains all the line index which have been visited 
         self.contingous_region = [] #this is a list of lines of code 
         self.node_counter = 0   #this is the current node counter where we create a new node in the graph
         self.text = text        #this is a instance of the actual method text
-        self.switch_label_list = [] #this list should store all the pswitch and sswitch labels and their parent attached to them
-        self.looping_label_list = [] #this contains a list of hashmap, where each hashmap is a key label, which cannot find a parent to connect to, so we store and to retreive and connect if we see a parent later
+        self.switch_labels = {} #switch label (e.g ':pswitch_1') => the data label of its switch (e.g ':pswitch_data_0'), see index_lines()
+        self.next_label = []    #line index => index of the first label at or after it, see index_lines()
+        self.looping_labels = {} #label => node counters of labels which could not find a parent to connect to, so we store and to retreive and connect if we see a parent later
         self.try_start_flag = False
         line_index = 0
         
         
         #create a dummy head node at start of the graph, so 
-        self.G.add_node(self.node_counter, text = text[line_index], node_counter = self.node_counter, visited = False, is_in_try_block = self.try_start_flag )
+        self.add_node(text[line_index])
         line_index+=1
-        self.label_dict[self.node_counter] = str(self.node_counter) + ". Method Sitgnature"
         self.node_counter+=1
         
-        #this will go to the end of the method and store all the packed-switch and sparse-switch labels in a list of hashmaps
-        start_time = time.time()
-        self.store_switch_labels()
+        #this will go to the end of the method and store all the packed-switch and sparse-switch labels and where the labels are
+        self.index_lines()
         
         line_str = str(text[line_index])
         line_obj = text[line_index]
         
         #some of the lines can be SMALI ASSEMBLY OBJECTS, because we call grow_locals before building the control flow graph, so we convert each line to a string before processing it. 
-        while (re.search(StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD, line_str) is None and re.search(StigmaStringParsingLib.BEGINS_WITH_PSWITCH_DATA, line_str) is None and re.search(StigmaStringParsingLib.BEGINS_WITH_SSWITCH_DATA, line_str) is None):
+        while (not StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD) and not StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_PSWITCH_DATA) and not StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_SSWITCH_DATA)):
             
             line_str = str(text[line_index])
             line_obj = text[line_index]
             
             if (line_index not in self.visited_lines):  
                 #print(" univisted line in cfg", line, "not branching: ", ControlFlowGraph.is_not_branching(line))
-                tokens = StigmaStringParsingLib.break_into_tokens(line_str)
+                tokens = StigmaStringParsingLib.lex_line(line_str).tokens
                 
                 if ControlFlowGraph.is_not_branching(line_str):
                     self.contingous_region.append(line_obj)
 
                 #e.g line_str: if-eqz vx :cond_8
-                elif re.search(StigmaStringParsingLib.BEGINS_WITH_IF, line_str) is not None or re.search(StigmaStringParsingLib.BEGINS_WITH_CMP, line_str) is not None: 
+                elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_IF) or StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_CMP): 
                     #create a node for the existing lines of code in the continguous region and empty the contigious_region_list
                     self.bundle_contingous_region()
 
                     # store label, and node_counter since this node will be the parent when we see the label    
                     dest_label = tokens[-1]
-                    label_map = {}
-                    label_map[dest_label] = self.node_counter
-                    self.label_list.append(label_map)
+                    self.branch_nodes.setdefault(dest_label, []).append(self.node_counter)
                     
                     #create a new node of the if statement, and connect the edge from previous continious regiion node to this node
-                    self.G.add_node(self.node_counter, text = [line_obj], node_counter = self.node_counter, visited = False , is_in_try_block = self.try_start_flag )
-                    self.G.add_edge(self.node_counter-1, self.node_counter)
-                    self.label_dict[self.node_counter] = str(self.node_counter) + ". " + line_str.strip()     
+                    self.add_node([line_obj])
+                    self.add_edge(self.node_counter-1, self.node_counter)
                     
                     #if this destination was already seen, we connect it
-                    for label_map in self.looping_label_list:
-                        if dest_label in label_map:
-                            self.G.add_edge(self.node_counter, label_map[dest_label])
+                    for label_node in self.looping_labels.get(dest_label, ()):
+                        self.add_edge(self.node_counter, label_node)
                     
                     self.node_counter+=1
 
                 #e.g line: :catch_1
-                elif re.search(StigmaStringParsingLib.BEGINS_WITH_CATCH_LABEL, line_str) is not None:
+                elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_CATCH_LABEL):
                     self.bundle_contingous_region()
                     
-                    self.G.add_node(self.node_counter, text = [line_obj], node_counter = self.node_counter, visited = False , is_in_try_block = self.try_start_flag )
+                    self.add_node([line_obj])
                     #create a new node of the catch statement, and connect the edge from corresponding if statement node to this node
-                    self.label_dict[self.node_counter] = str(self.node_counter) + ". " + line_str.strip()     
 
                     self.node_counter+=1
 
                 #e.g line-> :cond_8 or line-> :goto_8 , :pswitch_1 or :sswitch_1
-                elif re.search(StigmaStringParsingLib.BEGINS_WITH_COLON, str(line_str)) is not None:
+                elif StigmaStringParsingLib.begins_with(str(line_str), StigmaStringParsingLib.BEGINS_WITH_COLON):
                     #create a node for the existing lines of code in the continguous region and empty the contigious_region_list
                     #add an edge for this block of code, to the previous node in graph
                     
                     #if we see a try start label, we raise a flag to indicate we are inside a try block and if we see a try_end, it should make the label false 
                     
                     #this must be done before bundling, otherwise the node counter would change once u bundle it returning the wrong previous line
-                    prev_prev_line = str(self.G.nodes[self.node_counter-1]["text"][0])
+                    prev_prev_line = str(self.blocks[-1].text[0])
                     self.bundle_contingous_region()
-                    prev_line = str(self.G.nodes[self.node_counter-1]["text"][0])
+                    prev_line = str(self.blocks[-1].text[0])
                     
                     #flip the try flag after u have bundled
-                    if re.search(StigmaStringParsingLib.BEGINS_WITH_TRY, line_str) is not None:
+                    if StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_TRY):
                         #print("found try statement: ", line.strip(), " flag: ", self.try_start_flag)
                         self.try_start_flag = not self.try_start_flag
                     
-                    self.G.add_node(self.node_counter, text = [line_obj], node_counter = self.node_counter, visited = False, is_in_try_block = self.try_start_flag )  #create a new node of the label statement, and connect the edge from corresponding if statement node to this node
-                    self.label_dict[self.node_counter] = str(self.node_counter) + ". " + line_str.strip()     
+                    self.add_node([line_obj])  #create a new node of the label statement, and connect the edge from corresponding if statement node to this node
 
-                    if(StigmaStringParsingLib.extract_opcode(prev_line) != "goto" and re.search(StigmaStringParsingLib.BEGINS_WITH_RETURN, prev_line) is None and re.search(StigmaStringParsingLib.BEGINS_WITH_CATCH_LABEL, prev_prev_line) is None):
-                        self.G.add_edge(self.node_counter-1, self.node_counter)
+                    if(StigmaStringParsingLib.extract_opcode(prev_line) != "goto" and not StigmaStringParsingLib.begins_with(prev_line, StigmaStringParsingLib.BEGINS_WITH_RETURN) and not StigmaStringParsingLib.begins_with(prev_prev_line, StigmaStringParsingLib.BEGINS_WITH_CATCH_LABEL)):
+                        self.add_edge(self.node_counter-1, self.node_counter)
                     
                     cur_label = tokens[0]
                     
                     #e.g line-> :pswitch_1 or :sswitch_1, in this case we need to find the matching label parent from our switch label list
-                    if re.search(StigmaStringParsingLib.BEGINS_WITH_PSWITCH_LABEL, line_str) is not None or  re.search(StigmaStringParsingLib.BEGINS_WITH_SSWITCH_LABEL, line_str) is not None:
-                        cur_label = ControlFlowGraph.get_key(cur_label, self.switch_label_list)
+                    if StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_PSWITCH_LABEL) or  StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_SSWITCH_LABEL):
+                        cur_label = self.switch_labels.get(cur_label, "key doesn't exist")
                     
                     #get all the corresponding if statement nodes for this condition, and create an edge from all those if statements to this condition
                     parent_found = False
-                    for label in self.label_list:
-                        if cur_label in label:
-                            self.G.add_edge(label[cur_label], self.node_counter)
-                            parent_found = True
+                    for parent in self.branch_nodes.get(cur_label, ()):
+                        self.add_edge(parent, self.node_counter)
+                        parent_found = True
 
                     #incase this label has not seen a parent before and has nothing to connect, we store it so we can connect later when we see the parent
                     if not parent_found:
-                        label_map = {}
-                        label_map[cur_label] = self.node_counter
-                        self.looping_label_list.append(label_map)
+                        self.looping_labels.setdefault(cur_label, []).append(self.node_counter)
                         
                     self.node_counter+=1
 
                 #e.g line: goto :goto_8
-                elif re.search(StigmaStringParsingLib.BEGINS_WITH_GOTO, line_str) is not None:
+                elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_GOTO):
                     self.bundle_contingous_region()
                     
                     #create a lable for :goto_8 and store current node counter to connect the label later
                     dest_label = tokens[-1]
-                    label_map = {}
-                    label_map[dest_label] = self.node_counter
-                    self.label_list.append(label_map)
+                    self.branch_nodes.setdefault(dest_label, []).append(self.node_counter)
                     
                     #add the current line as a node and make a edge with previous node in tree. 
-                    self.G.add_node(self.node_counter, text = [line_obj], node_counter = self.node_counter, visited = False , is_in_try_block = self.try_start_flag )
-                    self.label_dict[self.node_counter] = str(self.node_counter) + ". " + line_str.strip()     
-                    self.G.add_edge(self.node_counter-1, self.node_counter)
+                    self.add_node([line_obj])
+                    self.add_edge(self.node_counter-1, self.node_counter)
                     
                     
                     #if this destination was already seen, we connect it
-                    for label_map in self.looping_label_list:
-                        if dest_label in label_map:
-                            self.G.add_edge(self.node_counter, label_map[dest_label])
+                    for label_node in self.looping_labels.get(dest_label, ()):
+                        self.add_edge(self.node_counter, label_node)
                     
                     self.node_counter+=1
                                         
@@ -188,12 +212,11 @@ class ControlFlowGraph:
                     line_index = self.find_label(line_index)-1
 
                 #e.g line: return-object vx or throw v1
-                elif re.search(StigmaStringParsingLib.BEGINS_WITH_RETURN, line_str) is not None or re.search(StigmaStringParsingLib.BEGINS_WITH_THROW, line_str) is not None:
+                elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_RETURN) or StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_THROW):
                     self.bundle_contingous_region()
                     
-                    self.G.add_node(self.node_counter, text = [line_obj], node_counter = self.node_counter, visited = False , is_in_try_block = self.try_start_flag )
-                    self.label_dict[self.node_counter] = str(self.node_counter) + ". " + line_str.strip()     
-                    self.G.add_edge(self.node_counter-1, self.node_counter)
+                    self.add_node([line_obj])
+                    self.add_edge(self.node_counter-1, self.node_counter)
                     self.node_counter+=1
 
                     new_line_index = self.find_label(line_index)                  
@@ -201,26 +224,23 @@ class ControlFlowGraph:
                         line_index= new_line_index - 1
                 
                 #when u see a parse-switch statement, go down, store all relevant switch cases
-                elif re.search(StigmaStringParsingLib.BEGINS_WITH_PACKED_SWITCH, line_str) is not None or re.search(StigmaStringParsingLib.BEGINS_WITH_SPARSE_SWITCH, line_str) is not None:
+                elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_PACKED_SWITCH) or StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_SPARSE_SWITCH):
                     self.bundle_contingous_region()
                     
                     #store the data label in list with current counter, dest_label = ':pswitch_data_0'
                     dest_label = tokens[-1]
-                    label_map = {}
-                    label_map[dest_label] = self.node_counter
-                    self.label_list.append(label_map)
+                    self.branch_nodes.setdefault(dest_label, []).append(self.node_counter)
                     
                     #create a new node of the switch statement, and connect the edge from previous continious regiion node to this node
-                    self.G.add_node(self.node_counter, text = [line_obj], node_counter = self.node_counter, visited = False , is_in_try_block = self.try_start_flag )
-                    self.G.add_edge(self.node_counter-1, self.node_counter)
-                    self.label_dict[self.node_counter] = str(self.node_counter) + ". " + line_str.strip()     
+                    self.add_node([line_obj])
+                    self.add_edge(self.node_counter-1, self.node_counter)
                     self.node_counter+=1
                                         
                 #catch an invalid line, which doesnt fit any of the if statements above    
                 else:
                     raise Exception("Invalid line: ", line);                
                 
-                self.visited_lines.append(line_index)      
+                self.visited_lines.add(line_index)      
         
 
             line_index+=1
@@ -230,46 +250,17 @@ class ControlFlowGraph:
         self.tail = self.text[line_index:]
     
         
+    # opcodes (prefixes) that end a contiguous region, see is_not_branching()
+    BRANCHING_OPCODE_PREFIXES = ("if-", "cmp", "return", "goto", "packed-switch", "sparse-switch")
+
     @staticmethod
     def is_not_branching(line):
-        if (re.search(StigmaStringParsingLib.BEGINS_WITH_IF, line) is not None):
+        # one lexer lookup instead of a regex search per kind of branch
+        lexed = StigmaStringParsingLib.lex_line(line)
+        if (lexed.kind == StigmaStringParsingLib.KIND_LABEL): # begins with colon indicates a label
             return False
             
-        if (re.search(StigmaStringParsingLib.BEGINS_WITH_CMP, line) is not None):
-            return False
-
-        if (re.search(StigmaStringParsingLib.BEGINS_WITH_COLON, line) is not None): # begins with colon indicates a label
-            return False
-            
-        if (re.search(StigmaStringParsingLib.BEGINS_WITH_RETURN, line) is not None):
-            return False
-            
-        if (re.search(StigmaStringParsingLib.BEGINS_WITH_GOTO, line) is not None):
-            return False
-        
-        if (re.search(StigmaStringParsingLib.BEGINS_WITH_PACKED_SWITCH, line) is not None):
-            return False
-            
-        if (re.search(StigmaStringParsingLib.BEGINS_WITH_SPARSE_SWITCH, line) is not None):
-            return False
-            
-
-        return True
-
-    @staticmethod
-    def get_key(val, label_list):
-        '''
-        This method takes in a list of hashmaps, and looks for a value matching in any of those hashmaps
-        and returns the related key. 
-        '''
-        
-        for label_map in label_list:
-            for key, value in label_map.items():
-                if val in value:
-                    return key
-            
-        return "key doesn't exist"        
-
+        return not lexed.opcode.startswith(ControlFlowGraph.BRANCHING_OPCODE_PREFIXES)
 
     def bundle_contingous_region(self):
         ''' 
@@ -282,80 +273,139 @@ class ControlFlowGraph:
             if(self.contingous_region[0] == ''):
                 return
         
-        self.G.add_node(self.node_counter, text = self.contingous_region, node_counter = self.node_counter, visited = False , is_in_try_block = self.try_start_flag )
-        self.G.add_edge(self.node_counter-1, self.node_counter)
-        self.label_dict[self.node_counter] = str(self.node_counter) + ". BLOCK OF CODE"  #+ self.contingous_region[-1]     
+        self.add_node(self.contingous_region)
+        self.add_edge(self.node_counter-1, self.node_counter)
         self.contingous_region = []
         self.node_counter+=1
         
     
     def find_label(self,line_index):    
         '''
-        This method takes a starting line index and keeps looking forward in the method text until it finds a valid label and returns that index
+        This method takes a starting line index and returns the index of the next valid label in the method text (looked up in next_label)
         '''
-        for i in range(line_index, len(self.text)):
-            if re.search(StigmaStringParsingLib.BEGINS_WITH_COLON, self.text[i]):
-                return i
+        if line_index < len(self.next_label) and self.next_label[line_index] != -1:
+            return self.next_label[line_index]
         return line_index+1
     
     
-    def store_switch_labels(self):
+    def index_lines(self):
         '''
-        This function loops through the whole method text before building the control flow graph.
-        It looks for any :pswitch_data_x or :sswitch_data_x and store there corresponding labels in a map.
-        This map is then stored in a label list of switch statements, which can be used later to connect switch labels
-        to their correct parent nodes. 
-        e.g [ {':pswitch_data_0': [':pswitch_1', ':pswitch_0']}, {':sswitch_data_2': [':sswitch_4', ':pswitch_5']} ]
-        '''   
-  
-        if(len(self.text) < 3):
-            return
+        This function loops through the whole method text once before building the control flow graph.
+        It looks for any :pswitch_data_x or :sswitch_data_x and maps each of their labels to the data label,
+        which can be used later to connect switch labels to their correct parent nodes (the switch statement).
+        e.g {':pswitch_1': ':pswitch_data_0', ':pswitch_0': ':pswitch_data_0', ':sswitch_4': ':sswitch_data_2'}
+        It also stores, for every line, where the next label is, which find_label() returns.
+        '''
+        self.next_label = array.array("i", [-1]) * len(self.text)
+        label_indices = []
+        data_label = None   #the switch data we are in, if any
+        end_pattern = None
+        end_of_method = False
         
-        index = 0 
-        while(re.search(StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD, str(self.text[index])) is None):
-            
-            if(re.search(StigmaStringParsingLib.BEGINS_WITH_PSWITCH_DATA, str(self.text[index])) is not None):
-                switch_label_map = {}
-                data_label = StigmaStringParsingLib.extract_opcode(self.text[index])
-                index+=1
-                label_list = []
-                while(re.search(StigmaStringParsingLib.BEGINS_WITH_DOT_END_PACKED_SWITCH, str(self.text[index])) is None):
-                    if(re.search(StigmaStringParsingLib.BEGINS_WITH_PSWITCH_LABEL, str(self.text[index])) is not None):
-                        label_list.append(self.text[index].strip())
-                    index+=1            
-                switch_label_map[data_label] = label_list
-                self.switch_label_list.append(switch_label_map)
+        for index in range(len(self.text)):
+            line_str = str(self.text[index])
+            if StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_COLON):
+                label_indices.append(index)
+            if end_of_method:
+                continue
                 
+            if data_label is not None:
+                if StigmaStringParsingLib.begins_with(line_str, end_pattern):
+                    data_label = None
+                elif end_pattern == StigmaStringParsingLib.BEGINS_WITH_DOT_END_PACKED_SWITCH:
+                    if StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_PSWITCH_LABEL):
+                        self.switch_labels.setdefault(line_str.strip(), data_label)
+                else:
+                    tokens = StigmaStringParsingLib.lex_line(line_str).tokens
+                    if StigmaStringParsingLib.begins_with(tokens[-1], StigmaStringParsingLib.BEGINS_WITH_SSWITCH_LABEL):
+                        self.switch_labels.setdefault(tokens[-1].strip(), data_label)
+                
+            elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD):
+                end_of_method = True
+            
+            elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_PSWITCH_DATA):
+                data_label = StigmaStringParsingLib.extract_opcode(line_str)
+                end_pattern = StigmaStringParsingLib.BEGINS_WITH_DOT_END_PACKED_SWITCH
                 
-            elif(re.search(StigmaStringParsingLib.BEGINS_WITH_SSWITCH_DATA, str(self.text[index])) is not None):
-                switch_label_map = {}
-                data_label = StigmaStringParsingLib.extract_opcode(self.text[index])
-                index+=1
-                label_list = []
-                while(re.search(StigmaStringParsingLib.BEGINS_WITH_DOT_END_SPARSE_SWITCH, str(self.text[index])) is None):
-                    tokens = StigmaStringParsingLib.break_into_tokens(self.text[index])
-                    if(re.search(StigmaStringParsingLib.BEGINS_WITH_SSWITCH_LABEL, tokens[-1]) is not None):
-                        label_list.append(tokens[-1].strip())
-                    index+=1            
-                switch_label_map[data_label] = label_list
-                self.switch_label_list.append(switch_label_map)
+            elif StigmaStringParsingLib.begins_with(line_str, StigmaStringParsingLib.BEGINS_WITH_SSWITCH_DATA):
+                data_label = StigmaStringParsingLib.extract_opcode(line_str)
+                end_pattern = StigmaStringParsingLib.BEGINS_WITH_DOT_END_SPARSE_SWITCH
+        
+        #every line before a label (and after the one before it) finds that label
+        start = 0
+        for label_index in label_indices:
+            self.next_label[start:label_index+1] = array.array("i", [label_index]) * (label_index + 1 - start)
+            start = label_index + 1
             
-            index+=1
-                                
+
+    def add_node(self, text):
+        # the new node is self.node_counter (the next index in self.blocks)
+        self.blocks.append(BasicBlock(text, self.node_counter, self.try_start_flag))
+        self.successors.append(array.array("i"))
+        self.predecessor_lists.append(array.array("i"))
+
+
+    def add_edge(self, source, destination):
+        # like networkx, adding an edge twice keeps one edge.  A switch has
+        # many successors and a loop head many predecessors, look in the shorter list
+        successors = self.successors[source]
+        predecessors = self.predecessor_lists[destination]
+        if len(successors) <= len(predecessors):
+            exists = destination in successors
+        else:
+            exists = source in predecessors
+        if not exists:
+            successors.append(destination)
+            predecessors.append(source)
+
+
+    def get_label(self, node_counter):
+        # what show() writes on a node
+        if node_counter == 0:
+            return "0. Method Sitgnature"
+        line_str = str(self.blocks[node_counter].text[0])
+        if ControlFlowGraph.is_not_branching(line_str):
+            return str(node_counter) + ". BLOCK OF CODE"
+        return str(node_counter) + ". " + line_str.strip()
+
+
+    def to_networkx(self):
+        # the graph as a networkx DiGraph, the nodes have the attributes of the blocks
+        import networkx as nx
+        G = nx.DiGraph()
+        for block in self.blocks:
+            G.add_node(block.node_counter, **dict(block.items()))
+        G.add_edges_from(self.edges())
+        return G
+
 
     def show(self):
+        import networkx as nx
+        import matplotlib.pyplot as plt
+        from networkx.drawing.nx_pydot import graphviz_layout
         
         #this position is to avoid the random rotation of graph each time
         # random_pos = nx.random_layout(self.G, seed=180)
         # pos = nx.spring_layout(self.G, pos=random_pos)
         
-        pos = graphviz_layout(self.G, prog="dot")
-        nx.draw(self.G, pos, font_size = 6, labels=self.label_dict, with_labels = True)
+        G = self.to_networkx()
+        labels = {node_counter: self.get_label(node_counter) for node_counter in range(len(self))}
+        pos = graphviz_layout(G, prog="dot")
+        nx.draw(G, pos, font_size = 6, labels=labels, with_labels = True)
         plt.show()
         
         
     def generate_adjlist(self):
-        return nx.generate_adjlist(self.G)
+        # the same lines as networkx.generate_adjlist()
+        for node_counter, successors in enumerate(self.successors):
+            yield " ".join([str(node_counter)] + [str(successor) for successor in successors])
+
+
+    def edges(self):
+        # generator, (source, destination) in the order networkx would give them
+        for node_counter, successors in enumerate(self.successors):
+            for successor in successors:
+                yield (node_counter, successor)
 
                
     @staticmethod
@@ -369,25 +419,79 @@ class ControlFlowGraph:
         return smallest_node
     
     
+    def visit_order(self):
+        '''
+        The node counters of all nodes, every node after all of its predecessors except the ones that jump back to
+        it (e.g., from the end of a loop).  A worklist: a node is ready once its last (non back edge) predecessor
+        is done and the ready node with the smallest node counter goes next, so the order stays as close to the
+        order of the code as it can.  Nodes without predecessors (e.g., :catch blocks) are ready from the start.
+        Back edges are the edges to a node on the stack of a depth first search, like for a reverse post-order.
+        '''
+        num_nodes = len(self.blocks)
+        
+        # the number of predecessors of every node which are not at the end of a back edge
+        waiting_for = array.array("i", [len(predecessors) for predecessors in self.predecessor_lists])
+        seen = bytearray(num_nodes)
+        on_stack = bytearray(num_nodes)
+        for root in range(num_nodes):
+            if seen[root]:
+                continue
+            seen[root] = on_stack[root] = 1
+            stack = [(root, 0)] #(node, index of the next successor to look at)
+            while stack:
+                node_counter, idx = stack[-1]
+                successors = self.successors[node_counter]
+                if idx < len(successors):
+                    stack[-1] = (node_counter, idx + 1)
+                    successor = successors[idx]
+                    if on_stack[successor]:
+                        waiting_for[successor] -= 1 # a back edge
+                    elif not seen[successor]:
+                        seen[successor] = on_stack[successor] = 1
+                        stack.append((successor, 0))
+                else:
+                    stack.pop()
+                    on_stack[node_counter] = 0
+        
+        order = []
+        done = bytearray(num_nodes)
+        ready = [node_counter for node_counter in range(num_nodes) if waiting_for[node_counter] == 0]
+        while ready:
+            node_counter = heapq.heappop(ready)
+            done[node_counter] = 1
+            order.append(node_counter)
+            for successor in self.successors[node_counter]:
+                # a successor which is done already is at the end of a back edge
+                if not done[successor]:
+                    waiting_for[successor] -= 1
+                    if waiting_for[successor] == 0:
+                        heapq.heappush(ready, successor)
+        return order
+    
+    
     def nodes_left_to_visit(self):
         '''If any node in cfg is not marked visited yet, return True meaning keep processing the graph''' 
-        for i in range(len(self.G)):
-            node = self.G.nodes[i]
-            if(node["visited"] == False):
+        for block in self.blocks:
+            if(block.visited == False):
                 return True
         return False
     
     
     def neighbors(self, node_counter):
-        return self.G.neighbors(node_counter) 
+        return iter(self.successors[node_counter])
+
+
+    def predecessors(self, node_counter):
+        return iter(self.predecessor_lists[node_counter])
     
     
     def __getitem__(self, node_counter):
-        #print("node counter: ", node_counter)
-        #print("node: ", self.G.nodes[node_counter])
-        return self.G.nodes[node_counter]  
+        return self.blocks[node_counter]
+
+
+    def __len__(self):
+        return len(self.blocks)
          
             
     def __str__(self):
-        return str(self.G.nodes.data())
-            
+        return str([(block.node_counter, dict(block.items())) for block in self.blocks])
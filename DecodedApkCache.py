@@ -0,0 +1,224 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+
+# A cache of "apktool d" results.  Decoding a large APK takes a long time
+# and the result only depends on the APK file itself (and the version of
+# apktool) so re-instrumenting the same APK (e.g., with different plugin
+# settings) can skip the decode step completely.
+#
+# cache_dir/
+#     <key>/        the decoded apk (exactly as apktool wrote it)
+#     <key>.size    its size in bytes (so eviction doesn't walk every tree)
+#
+# key: sha256 of the APK file + the apktool version
+# The modification time of <key>/ is its "last used" time (LRU eviction)
+#
+# clone() hard-links the files of an entry into the working directory.
+# So files in the working directory must be replaced (written to a new
+# file or removed first), never modified in place, or the cache entry is
+# changed as well.  If hard links are not possible (e.g., the cache is on
+# a different file system than the working directory) files are copied.
+
+
+class DecodedApkCache:
+
+    def __init__(self, cache_dir, max_bytes, tool_version=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # computed on first use, see get_tool_version()
+        self.tool_version = tool_version
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get_tool_version(self):
+        if self.tool_version is None:
+            completed_process = subprocess.run(["apktool", "--version"], capture_output=True, text=True)
+            completed_process.check_returncode()
+            self.tool_version = completed_process.stdout.strip()
+        return self.tool_version
+
+
+    def key(self, apk_path):
+        h = hashlib.sha256()
+        with open(apk_path, "rb") as fh:
+            chunk = fh.read(1024 * 1024)
+            while chunk:
+                h.update(chunk)
+                chunk = fh.read(1024 * 1024)
+        h.update(self.get_tool_version().encode())
+        return h.hexdigest()
+
+
+    def lookup(self, key):
+        # returns the directory of the cached entry or None
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry_dir):
+            self.misses += 1
+            return None
+
+        os.utime(entry_dir)
+        self.hits += 1
+        return entry_dir
+
+
+    def add(self, key, decode_function):
+        # decode_function(output_dir) must decode the apk into output_dir
+        # returns the directory of the new entry
+        entry_dir = os.path.join(self.cache_dir, key)
+
+        # decode into a staging directory and rename it once complete,
+        # so an interrupted decode never looks like a valid entry
+        staging_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix="tmp-")
+        try:
+            decode_function(staging_dir)
+            size = DecodedApkCache._tree_size(staging_dir)
+            with open(entry_dir + ".size", "w") as fh:
+                fh.write(str(size))
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # another run added the same entry in the meantime
+            if not os.path.isdir(entry_dir):
+                raise
+        finally:
+            if os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir)
+
+        return entry_dir
+
+
+    @staticmethod
+    def clone(entry_dir, dest_dir):
+        # dest_dir may already exist (e.g., an empty temporary directory)
+        link_failed = []
+
+        def _link_or_copy(src, dst):
+            if not link_failed:
+                try:
+                    os.link(src, dst)
+                    return dst
+                except OSError:
+                    link_failed.append(True)
+            return shutil.copy2(src, dst)
+
+        shutil.copytree(entry_dir, dest_dir, copy_function=_link_or_copy, dirs_exist_ok=True)
+
+
+    @staticmethod
+    def _tree_size(path):
+        total = 0
+        for dir_path, dir_names, file_names in os.walk(path):
+            for name in file_names:
+                total += os.path.getsize(os.path.join(dir_path, name))
+        return total
+
+
+    def _list_entries(self):
+        # [(last used time, size, key), ...]
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith("tmp-") or not os.path.isdir(entry_dir):
+                continue
+            try:
+                with open(entry_dir + ".size", "r") as fh:
+                    size = int(fh.read())
+            except (OSError, ValueError):
+                size = DecodedApkCache._tree_size(entry_dir)
+            entries.append((os.stat(entry_dir).st_mtime, size, name))
+        return entries
+
+
+    def get_size(self):
+        return sum(size for mtime, size, key in self._list_entries())
+
+
+    def evict(self):
+        # remove the least recently used entries until
+        # the cache is no larger than max_bytes
+        entries = self._list_entries()
+        total = sum(size for mtime, size, key in entries)
+        entries.sort()
+        for mtime, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            entry_dir = os.path.join(self.cache_dir, key)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            if os.path.exists(entry_dir + ".size"):
+                os.remove(entry_dir + ".size")
+            total -= size
+            self.evictions += 1
+        return total
+
+
+    def __str__(self):
+        return "%d hits, %d misses, %d evicted" % (self.hits, self.misses, self.evictions)
+
+
+
+def main():
+    print("Testing DecodedApkCache...")
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        cache_dir = os.path.join(test_dir, "cache")
+        cache = DecodedApkCache(cache_dir, 10 ** 6, "2.5.0")
+
+        apk_path = os.path.join(test_dir, "app.apk")
+        with open(apk_path, "wb") as fh:
+            fh.write(b"not really an apk")
+
+        decode_calls = []
+        def fake_decode(output_dir):
+            decode_calls.append(output_dir)
+            os.makedirs(os.path.join(output_dir, "smali", "com"))
+            with open(os.path.join(output_dir, "smali", "com", "Foo.smali"), "w") as fh:
+                fh.write(".class public Lcom/Foo;\n")
+            with open(os.path.join(output_dir, "apktool.yml"), "w") as fh:
+                fh.write("version: 2.5.0\n")
+
+        print("\tbasic tests...")
+        key = cache.key(apk_path)
+        assert(key != DecodedApkCache(cache_dir, 10 ** 6, "2.6.0").key(apk_path))
+        assert(cache.lookup(key) is None)
+        entry_dir = cache.add(key, fake_decode)
+        assert(len(decode_calls) == 1)
+        assert(cache.lookup(key) == entry_dir)
+        assert(cache.hits == 1 and cache.misses == 1)
+
+        print("\tclone tests...")
+        work_dir = tempfile.mkdtemp(dir=test_dir)
+        DecodedApkCache.clone(entry_dir, work_dir)
+        cloned_file = os.path.join(work_dir, "smali", "com", "Foo.smali")
+        with open(cloned_file, "r") as fh:
+            assert(fh.read() == ".class public Lcom/Foo;\n")
+
+        # replacing a cloned file must not change the cache entry
+        os.remove(cloned_file)
+        with open(cloned_file, "w") as fh:
+            fh.write("instrumented\n")
+        with open(os.path.join(entry_dir, "smali", "com", "Foo.smali"), "r") as fh:
+            assert(fh.read() == ".class public Lcom/Foo;\n")
+
+        print("\teviction tests...")
+        os.utime(entry_dir, (1, 1))
+        other_key = "0" * 64
+        cache.add(other_key, fake_decode)
+        cache.max_bytes = cache.get_size() - 1
+        cache.evict()
+        assert(cache.evictions == 1)
+        assert(not os.path.exists(entry_dir))
+        assert(os.path.isdir(os.path.join(cache_dir, other_key)))
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
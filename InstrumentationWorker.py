@@ -0,0 +1,269 @@
+import os
+import copy
+import collections
+import multiprocessing
+
+import SmaliClassDef
+import ClassFileIO
+import Instrumenter
+import StigmaMetrics
+import StigmaStringParsingLib
+from StringPool import StringPool
+from TaintStorageHandler import TaintStorageHandler
+
+
+# Instrumenting one class only needs the class itself, the names of all
+# the internal classes of the app and the registered plugins.  So classes
+# can be instrumented independently (and in parallel, one worker process
+# per core).  The only state shared between classes is the
+# TaintStorageHandler: the StorageClassN a taint location lands in
+# depends on every location added before it.  While a class is being
+# instrumented the handler is "deferred", it just records the locations
+# the class asked for.  Afterwards commit() replays those locations in
+# the original (serial) order of the classes and fills in the real
+# storage classes, so the output is identical to a serial run.
+#
+# Memory: a class is parsed, instrumented, turned into text and released
+# before the next one, and the internal class names are one set shared
+# by every class, so memory does not grow with the number of classes.
+# A class the worker reads itself (no lines from ClassFileIO.ReadAhead)
+# is mapped, its untouched methods go from the mapping into the text
+# without being split into lines.
+# With several jobs the number of classes "in flight" (finished by a
+# worker but not yet written in serial order) is bounded, by
+# ORDERED_WINDOW or, with streaming=True, by the smaller STREAMING_WINDOW.
+
+storage_handler = TaintStorageHandler.get_instance()
+metrics = StigmaMetrics.StigmaMetrics.get_instance()
+internal_class_name_set = frozenset()
+class_cache = None # an InstrumentedClassCache or None
+in_worker_process = False # metrics are sent back to the parent with each result
+
+
+class InstrumentedClass:
+    def __init__(self, index, path, text, taint_locations, comparison_count, not_enough_registers_count, constant_pool_counts):
+        self.index = index # position of this class in the serial order
+        self.path = path
+        self.text = text # instrumented smali, with deferred storage accessors
+        self.taint_locations = taint_locations # every add_taint_location(), in order
+
+        # analytics stuff
+        self.comparison_count = comparison_count
+        self.not_enough_registers_count = not_enough_registers_count
+        
+        # (fields, methods) after instrumentation, used by Stigma.splitSmali()
+        self.constant_pool_counts = constant_pool_counts
+        
+        self.cache_hit = False
+        self.cache_stored = False
+
+        # StigmaMetrics snapshot (only from worker processes)
+        self.metrics = None
+        
+    def to_cache_entry(self):
+        return {"text": self.text, "taint_locations": self.taint_locations,
+            "comparison_count": self.comparison_count,
+            "not_enough_registers_count": self.not_enough_registers_count,
+            "constant_pool_counts": list(self.constant_pool_counts)}
+            
+    @staticmethod
+    def from_cache_entry(index, path, entry):
+        ans = InstrumentedClass(index, path, entry["text"], entry["taint_locations"], 
+            entry["comparison_count"], entry["not_enough_registers_count"], 
+            tuple(entry["constant_pool_counts"]))
+        ans.cache_hit = True
+        return ans
+
+
+def init_worker(class_names, plugin_loader=None, cache=None, worker_process=False):
+    global internal_class_name_set, class_cache, in_worker_process
+    internal_class_name_set = frozenset(class_names)
+    in_worker_process = worker_process
+    # a new app, the strings of the previous one are not needed anymore
+    StringPool.get_instance().erase()
+    if worker_process:
+        # don't send back numbers inherited from the parent
+        metrics.erase()
+    
+    if cache is not None:
+        # each worker counts on its own copy, instrument_classes()
+        # adds up the totals from the results
+        class_cache = copy.copy(cache)
+    else:
+        class_cache = None
+
+    # with the "fork" start method the plugins registered in the parent
+    # process are inherited, with "spawn" they need to be registered again
+    if plugin_loader is not None and Instrumenter.instrumentation_map == {}:
+        plugin_loader()
+
+
+def instrument_class(index, path, lines=None):
+    # lines: the lines of the file if the caller already read them,
+    # otherwise the file is mapped (ClassFileIO.MappedClassFile)
+    result = _instrument_class(index, path, lines)
+    if in_worker_process:
+        result.metrics = metrics.take_snapshot()
+    return result
+
+
+def _instrument_class(index, path, lines):
+    mapped_file = None
+    if lines is None:
+        # the file is mapped, the methods no handler touches are never
+        # split into lines (see SmaliClassDef.from_mapped_file())
+        with metrics.stage("read"):
+            mapped_file = ClassFileIO.MappedClassFile(path)
+        num_lines = mapped_file.get_num_lines()
+    else:
+        num_lines = len(lines)
+    metrics.add_count("files")
+    metrics.add_count("lines", num_lines)
+    
+    if class_cache is not None:
+        with metrics.stage("class_cache"):
+            if mapped_file is None:
+                key = class_cache.key(lines)
+            else:
+                key = class_cache.key_bytes(mapped_file.data)
+            entry = class_cache.get(key, internal_class_name_set)
+        if entry is not None:
+            if mapped_file is not None:
+                mapped_file.close()
+            return InstrumentedClass.from_cache_entry(index, path, entry)
+    
+    storage_handler.set_deferred(True)
+    try:
+        with metrics.stage("parse", True):
+            scd = SmaliClassDef.SmaliClassDef(path, lines, internal_class_name_set, mapped_file)
+        del lines
+        metrics.add_count("verbatim_methods", sum(1 for m in scd.methods if m.verbatim))
+
+        with metrics.stage("instrumentation", True):
+            # analytics stuff
+            comparison_count = scd.get_num_comparison_instructions()
+            not_enough_registers_count = 0
+            for every_method in scd.methods:
+                not_enough_registers_count += every_method.not_enough_free_registers_count
+
+            # actual instrumentation
+            scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+            scd.instrument()
+            text = scd.get_text()
+            
+            # counted now, while the class is still parsed, so that 
+            # splitSmali() does not have to parse every file again
+            constant_pool_counts = scd.get_constant_pool_counts()
+            scd.release()
+
+    finally:
+        storage_handler.set_deferred(False)
+        taint_locations = storage_handler.take_deferred_locations()
+        # how often a line was parsed and how often a parse was saved
+        # (see StigmaStringParsingLib.parse_line())
+        for name, count in StigmaStringParsingLib.take_parse_counts().items():
+            metrics.add_count("line_" + name, count)
+
+    result = InstrumentedClass(index, path, text, taint_locations, comparison_count, not_enough_registers_count, constant_pool_counts)
+    
+    if class_cache is not None:
+        entry = result.to_cache_entry()
+        entry["internal_class_queries"] = scd.internal_class_queries
+        with metrics.stage("class_cache"):
+            class_cache.put(key, entry)
+        result.cache_stored = True
+    
+    return result
+
+
+def commit(result):
+    # must be called for every class in the serial order (index 0, 1, 2 ...)
+    if result.metrics is not None:
+        metrics.merge(result.metrics)
+    storage_handler.replay_locations(result.taint_locations)
+    return storage_handler.resolve_deferred_accessors(result.text)
+
+
+def _count_cache_result(cache, result):
+    if cache is None:
+        return
+    if result.cache_hit:
+        cache.hits += 1
+    else:
+        cache.misses += 1
+    if result.cache_stored:
+        cache.stores += 1
+
+
+def instrument_classes(paths, class_names, jobs=1, plugin_loader=None, cache=None, streaming=False):
+    # Generator, yields (InstrumentedClass, final smali text) for every
+    # path in the order of paths, no matter which class finishes first.
+    # cache is an optional InstrumentedClassCache
+    # at most ORDERED_WINDOW classes per job are in flight (largest first),
+    # streaming=True keeps at most STREAMING_WINDOW (serial order)
+    if jobs <= 1:
+        init_worker(class_names, None, cache)
+        # the next files are read while this one is instrumented
+        with ClassFileIO.ReadAhead(paths) as reader:
+            for index, (path, lines) in enumerate(reader):
+                result = instrument_class(index, path, lines)
+                _count_cache_result(cache, result)
+                yield result, commit(result)
+        return
+
+    if streaming:
+        yield from _instrument_classes_streaming(paths, class_names, jobs, plugin_loader, cache)
+        return
+
+    # largest classes first, otherwise a few huge classes picked up
+    # at the very end keep one worker busy while the rest sit idle
+    paths = list(paths)
+    schedule = sorted(range(len(paths)), key=lambda index: os.path.getsize(paths[index]), reverse=True)
+    position = 0 # next class in the schedule
+
+    # index -> AsyncResult, classes handed out but not written yet.
+    # Never more than jobs * ORDERED_WINDOW, otherwise (largest first)
+    # the whole app could pile up waiting for one small class.
+    pending = {}
+    next_index = 0
+    with multiprocessing.Pool(jobs, init_worker, (class_names, plugin_loader, cache, True)) as pool:
+        while next_index < len(paths):
+            while position < len(schedule) and len(pending) < jobs * ORDERED_WINDOW:
+                index = schedule[position]
+                position += 1
+                if index >= next_index and index not in pending:
+                    pending[index] = pool.apply_async(instrument_class, (index, paths[index]))
+            if next_index not in pending:
+                # the next class to write is further down the schedule,
+                # hand it out now so the window can move on
+                pending[next_index] = pool.apply_async(instrument_class, (next_index, paths[next_index]))
+            result = pending.pop(next_index).get()
+            _count_cache_result(cache, result)
+            yield result, commit(result)
+            next_index += 1
+
+
+# classes per job handed out ahead of the last one written, largest first
+ORDERED_WINDOW = 16
+
+# classes per job in flight with streaming=True
+STREAMING_WINDOW = 4
+
+def _instrument_classes_streaming(paths, class_names, jobs, plugin_loader, cache):
+    # classes are handed out in serial order, never more than
+    # jobs * STREAMING_WINDOW ahead of the last one written.  Unlike the
+    # largest-first order of instrument_classes() a slow class can hold
+    # up the others, but memory stays flat no matter how big the app is.
+    pending = collections.deque()
+    with multiprocessing.Pool(jobs, init_worker, (class_names, plugin_loader, cache, True)) as pool:
+        for index, path in enumerate(paths):
+            pending.append(pool.apply_async(instrument_class, (index, path)))
+            if len(pending) >= jobs * STREAMING_WINDOW:
+                result = pending.popleft().get()
+                _count_cache_result(cache, result)
+                yield result, commit(result)
+
+        while pending:
+            result = pending.popleft().get()
+            _count_cache_result(cache, result)
+            yield result, commit(result)
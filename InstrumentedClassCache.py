@@ -0,0 +1,286 @@
+import os
+import glob
+import json
+import zlib
+import hashlib
+import tempfile
+
+import Instrumenter
+
+
+# A persistent, on-disk cache of instrumented classes.  Most apps ship the
+# same library classes (androidx, okhttp, play services, ...) so a class
+# that was instrumented for one app can usually be re-used for the next.
+#
+# key: sha256 of the stigma fingerprint (source code of stigma and its
+# plugins) and the original smali text of the class.
+#
+# An entry holds everything InstrumentationWorker would have produced:
+# the instrumented text (with deferred storage class accessors, so it is
+# independent of the app), the taint locations in the order they were
+# added, and the analytics / constant pool counts.
+#
+# The only other input to instrumentation is the set of internal classes
+# of the app.  An entry remembers every is_internal_class() question the
+# class asked and is only used if the current app gives the same answers.
+
+
+class InstrumentedClassCache:
+
+    ENTRY_VERSION = 1
+
+    def __init__(self, cache_dir, max_bytes, fingerprint=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        if fingerprint is None:
+            fingerprint = InstrumentedClassCache.compute_fingerprint()
+        self.fingerprint = fingerprint
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+
+    @staticmethod
+    def get_fingerprint_sources(stigma_dir=None):
+        # Every *.py in the stigma directory and in the directories of
+        # the plugins listed in plugins.txt.  A fixed list, not whatever
+        # happens to be imported (a module imported later, or run as
+        # __main__, would otherwise be left out).
+        if stigma_dir is None:
+            stigma_dir = os.path.dirname(os.path.abspath(__file__))
+        directories = {os.path.abspath(stigma_dir)}
+        sources = set()
+        plugins_path = os.path.join(stigma_dir, "plugins.txt")
+        if os.path.isfile(plugins_path):
+            sources.add(os.path.abspath(plugins_path))
+            with open(plugins_path, "r") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if line != "" and not line.startswith("#"):
+                        directories.add(os.path.dirname(os.path.abspath(os.path.join(stigma_dir, line))))
+        for directory in directories:
+            sources.update(glob.glob(os.path.join(directory, "*.py")))
+        return sorted(sources)
+
+
+    @staticmethod
+    def compute_fingerprint(stigma_dir=None):
+        # Should be called after the plugins are registered.
+        # The source code of stigma and its plugins (see
+        # get_fingerprint_sources()) is part of the fingerprint,
+        # any change to the code invalidates the cache
+        sources = InstrumentedClassCache.get_fingerprint_sources(stigma_dir)
+
+        h = hashlib.sha256()
+        h.update(str(InstrumentedClassCache.ENTRY_VERSION).encode())
+        for path in sources:
+            h.update(os.path.basename(path).encode())
+            with open(path, "rb") as fh:
+                h.update(fh.read())
+
+        # the registered handlers and their register needs
+        h.update(str(Instrumenter.MAX_DESIRED_NUM_REGISTERS).encode())
+        for opcode in sorted(Instrumenter.instrumentation_map):
+            bundle = Instrumenter.instrumentation_map[opcode]
+            h.update((opcode + bundle.handler.__module__ + bundle.handler.__name__ +
+                str(bundle.num_regs_necessary) + str(bundle.handler_reinserts_original_lines)).encode())
+        if Instrumenter.start_of_method_handler is not None:
+            h.update(Instrumenter.start_of_method_handler.__name__.encode())
+
+        return h.hexdigest()
+
+
+    def key(self, lines):
+        return self.key_bytes("".join(lines).encode("utf-8", "surrogateescape"))
+
+
+    def key_bytes(self, data):
+        # the key of a class from the bytes of its file (e.g., a
+        # ClassFileIO.MappedClassFile), the same as key() of its lines
+        # unless the file has "\r\n" line breaks
+        h = hashlib.sha256(self.fingerprint.encode())
+        h.update(data)
+        return h.hexdigest()
+
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json.z")
+
+
+    def get(self, key, internal_class_names):
+        # returns the cached entry (a dict) or None
+        # internal_class_names should be a set
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as fh:
+                entry = json.loads(zlib.decompress(fh.read()))
+        except (OSError, ValueError, zlib.error):
+            # missing, or damaged / half-written by a crashed run
+            self.misses += 1
+            return None
+
+        for class_name, answer in entry["internal_class_queries"].items():
+            if (class_name in internal_class_names) != answer:
+                self.misses += 1
+                return None
+
+        # LRU: the modification time is the "last used" time
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return entry
+
+
+    def put(self, key, entry):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(json.dumps(entry).encode("utf-8", "surrogateescape"))
+
+        # several worker processes share the cache, write a temporary
+        # file and rename it so no one ever reads a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.stores += 1
+
+
+    def _list_entries(self):
+        # [(last used time, size, path), ...]
+        entries = []
+        for sub_dir in os.listdir(self.cache_dir):
+            sub_path = os.path.join(self.cache_dir, sub_dir)
+            if not os.path.isdir(sub_path):
+                continue
+            for name in os.listdir(sub_path):
+                path = os.path.join(sub_path, name)
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat_result.st_mtime, stat_result.st_size, path))
+        return entries
+
+
+    def get_size(self):
+        return sum(size for mtime, size, path in self._list_entries())
+
+
+    def evict(self):
+        # remove the least recently used entries until
+        # the cache is no larger than max_bytes
+        entries = self._list_entries()
+        total = sum(size for mtime, size, path in entries)
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        return total
+
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = 0.0
+        if lookups > 0:
+            hit_rate = self.hits / lookups
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate,
+            "stores": self.stores, "evictions": self.evictions}
+
+
+    def __str__(self):
+        stats = self.get_stats()
+        return "%d hits, %d misses (%.1f%% hit rate), %d stored, %d evicted" % (stats["hits"],
+            stats["misses"], stats["hit_rate"] * 100, stats["stores"], stats["evictions"])
+
+
+
+def main():
+    print("Testing InstrumentedClassCache...")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        print("\tbasic tests...")
+        cache = InstrumentedClassCache(cache_dir, 10 ** 6, "fingerprint1")
+        lines = [".class public LFoo;\n", ".super Ljava/lang/Object;\n"]
+        key = cache.key(lines)
+        assert(key != InstrumentedClassCache(cache_dir, 10 ** 6, "fingerprint2").key(lines))
+        assert(cache.get(key, set()) is None)
+        assert(cache.key_bytes("".join(lines).encode()) == key)
+
+        entry = {"text": "instrumented", "taint_locations": ["Foo_bar_v1", "Foo_bar_v1"],
+            "internal_class_queries": {"LFoo;": True, "LBar;": False}}
+        cache.put(key, entry)
+        assert(cache.get(key, {"LFoo;"}) == entry)
+
+        # a different app, in which LBar; is internal, can't use the entry
+        assert(cache.get(key, {"LFoo;", "LBar;"}) is None)
+        assert(cache.hits == 1 and cache.misses == 2)
+
+        print("\teviction tests...")
+        for i in range(10):
+            other_key = cache.key(["class number " + str(i)])
+            cache.put(other_key, {"text": "x" * 1000 + str(i), "internal_class_queries": {}})
+            os.utime(cache._entry_path(other_key), (i, i))
+        os.utime(cache._entry_path(key), (100, 100))
+
+        cache.max_bytes = cache.get_size() // 2
+        assert(cache.evict() <= cache.max_bytes)
+        assert(cache.evictions > 0)
+        # the most recently used entry survives
+        assert(cache.get(key, {"LFoo;"}) == entry)
+        assert(cache.get(cache.key(["class number 0"]), set()) is None)
+
+    print("\tfingerprint tests...")
+    with tempfile.TemporaryDirectory() as stigma_dir, tempfile.TemporaryDirectory() as plugin_dir:
+        def write(path, text):
+            with open(path, "w") as fh:
+                fh.write(text)
+
+        write(os.path.join(stigma_dir, "Core.py"), "x = 1\n")
+        write(os.path.join(stigma_dir, "notes.txt"), "a\n")
+        write(os.path.join(plugin_dir, "MyPlugin.py"), "y = 1\n")
+        write(os.path.join(plugin_dir, "Helper.py"), "z = 1\n")
+        write(os.path.join(stigma_dir, "plugins.txt"), "#comment\n" + os.path.join(plugin_dir, "MyPlugin.py") + "\n")
+        sources = InstrumentedClassCache.get_fingerprint_sources(stigma_dir)
+        assert(sorted(os.path.basename(path) for path in sources) == ["Core.py", "Helper.py", "MyPlugin.py", "plugins.txt"])
+
+        # the same files give the same fingerprint, imported or not
+        fingerprint = InstrumentedClassCache.compute_fingerprint(stigma_dir)
+        assert(fingerprint == InstrumentedClassCache.compute_fingerprint(stigma_dir))
+        write(os.path.join(stigma_dir, "notes.txt"), "b\n")
+        assert(fingerprint == InstrumentedClassCache.compute_fingerprint(stigma_dir))
+
+        # any change to stigma or to the plugin directory invalidates it
+        write(os.path.join(plugin_dir, "Helper.py"), "z = 2\n")
+        assert(fingerprint != InstrumentedClassCache.compute_fingerprint(stigma_dir))
+        fingerprint = InstrumentedClassCache.compute_fingerprint(stigma_dir)
+        write(os.path.join(stigma_dir, "New.py"), "\n")
+        assert(fingerprint != InstrumentedClassCache.compute_fingerprint(stigma_dir))
+
+    # this stigma: every module, loaded or not
+    sources = InstrumentedClassCache.get_fingerprint_sources()
+    assert(os.path.abspath(__file__) in sources)
+    assert(any(os.path.basename(path) == "TaintTrackingInstrumentationPlugin.py" for path in sources))
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
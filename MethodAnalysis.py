@@ -0,0 +1,253 @@
+import re
+import array
+import collections
+
+import StigmaStringParsingLib
+from StringPool import StringPool
+from ControlFlowGraph import ControlFlowGraph
+
+
+# What the analyses of one method need to know about its lines, worked out
+# in one pass and shared by all of them (see SmaliMethodDef.get_analysis()).
+#
+# Before, instrument() built the ControlFlowGraph and afterwards
+# _fix_larger_if_offsets(), get_num_comparison_instructions() and the
+# constant pool counting (SmaliClassDef.get_constant_pool_counts()) each
+# went over raw_text again with their own loops.  A MethodAnalysis keeps
+#     kinds               what every line is (KIND_*), one byte per line
+#     labels              label (e.g., ":cond_3") => line index
+#     num_comparisons     the number of if-* and cmp* lines
+#     field_references    field reference => the number of lines using it
+#     method_references   method reference => the number of lines using it
+#     cfg                 the ControlFlowGraph (see get_cfg())
+# When lines are embedded into the method, insert() / replace() / extend()
+# patch it instead of going over all the lines again.
+#
+# ByteAnalysis has the same num_comparisons / field_references /
+# method_references for lines that are still bytes (an untouched method of
+# a ClassFileIO.MappedClassFile), so counting them does not decode them.
+
+KIND_OTHER = 0
+KIND_IF = 1
+KIND_CMP = 2
+KIND_GOTO = 3
+KIND_BRANCH_LABEL = 4 # :cond_* and :goto_* labels
+KIND_LABEL = 5 # every other label
+
+BRANCH_KINDS = (KIND_IF, KIND_GOTO)
+
+
+def classify(lexed):
+    # the KIND_* of a line (its StigmaStringParsingLib.LexedLine), the
+    # same as the StigmaStringParsingLib.BEGINS_WITH_* checks on the line
+    opcode = lexed.opcode
+    if opcode.startswith(":"):
+        if opcode.startswith(":cond_") or opcode.startswith(":goto_"):
+            return KIND_BRANCH_LABEL
+        return KIND_LABEL
+    if opcode.startswith("if-"):
+        return KIND_IF
+    if opcode.startswith("cmp"):
+        return KIND_CMP
+    if opcode.startswith("goto"):
+        return KIND_GOTO
+    return KIND_OTHER
+
+
+class MethodAnalysis:
+
+    def __init__(self, lines=()):
+        # lines: strings and / or SmaliAssemblyInstruction objects
+        self.kinds = array.array("B")
+        self.labels = {}
+        self.num_comparisons = 0
+        self.field_references = collections.Counter()
+        self.method_references = collections.Counter()
+        self.cfg = None
+        self.extend(lines)
+
+    def _add(self, lines, position, sign=1):
+        # counts (sign=1) or un-counts (sign=-1) lines which are / were at
+        # position, returns their kinds
+        kinds = array.array("B")
+        pool = StringPool.get_instance()
+        for offset, line in enumerate(lines):
+            lexed = StigmaStringParsingLib.lex_line(str(line)) # instrumented methods contain SmaliAssemblyInstruction objects
+            kind = classify(lexed)
+            kinds.append(kind)
+            if kind == KIND_BRANCH_LABEL or kind == KIND_LABEL:
+                label = lexed.opcode
+                if sign > 0:
+                    self.labels.setdefault(label, position + offset)
+                elif self.labels.get(label) == position + offset:
+                    del self.labels[label]
+            elif kind == KIND_IF or kind == KIND_CMP:
+                self.num_comparisons += sign
+            elif lexed.opcode[:4] in ("sput", "sget", "iput", "iget"): # StigmaStringParsingLib.is_field_instruction()
+                self._count(self.field_references, pool.canonical(lexed.tokens[-1]), sign)
+            elif lexed.opcode.startswith("invoke-"): # StigmaStringParsingLib.is_method_call_instruction()
+                self._count(self.method_references, pool.canonical(lexed.tokens[-1]), sign)
+        return kinds
+
+    @staticmethod
+    def _count(counter, reference, sign):
+        counter[reference] += sign
+        if counter[reference] == 0:
+            del counter[reference]
+
+    def _shift_labels(self, position, amount):
+        # the lines from position on moved by amount
+        if amount == 0:
+            return
+        for label, idx in self.labels.items():
+            if idx >= position:
+                self.labels[label] = idx + amount
+
+    def extend(self, lines):
+        # lines were appended to the method
+        self.kinds.extend(self._add(lines, len(self.kinds)))
+        self.cfg = None
+
+    def insert(self, position, block):
+        # block was put just before the line at position (SmaliMethodDef.embed_block())
+        self._shift_labels(position, len(block))
+        self.kinds[position:position] = self._add(block, position)
+        self.cfg = None
+
+    def replace(self, position, old_line, block):
+        # old_line, the line at position, was replaced by block
+        # (SmaliMethodDef.embed_block_with_replace())
+        self._add([old_line], position, -1)
+        self._shift_labels(position + 1, len(block) - 1)
+        self.kinds[position:position + 1] = self._add(block, position)
+        self.cfg = None
+
+    def get_cfg(self, lines):
+        # the ControlFlowGraph of lines (the lines this analysis is of),
+        # built the first time it is asked for
+        if self.cfg is None:
+            self.cfg = ControlFlowGraph(lines)
+        return self.cfg
+
+    def get_branches(self):
+        # the line indexes of every if-* and goto
+        return [idx for idx, kind in enumerate(self.kinds) if kind in BRANCH_KINDS]
+
+    def find_target(self, label, branch_idx):
+        # the line index of the label a branch at branch_idx jumps to, None
+        # if it is not found.  Labels before the branch must be :cond_* or
+        # :goto_* labels (like _fix_larger_if_offsets() always did)
+        label_idx = self.labels.get(label)
+        if label_idx is None:
+            return None
+        if label_idx < branch_idx and self.kinds[label_idx] != KIND_BRANCH_LABEL:
+            return None
+        return label_idx
+
+    def __len__(self):
+        return len(self.kinds)
+
+
+
+# the first token of a line is its opcode (StigmaStringParsingLib.lex_line()),
+# the last one the reference of field instructions and invokes
+_BYTES_COMPARISON = re.compile(rb"^[ \t\r\f\v]*(?:if-|cmp)", re.M)
+_BYTES_FIELD = re.compile(rb"^[ \t\r\f\v]*(?:sput|sget|iput|iget)\S*(?:[^\n]*[ \t\r\f\v](\S+))?[ \t\r\f\v]*$", re.M)
+_BYTES_METHOD = re.compile(rb"^[ \t\r\f\v]*invoke-\S*(?:[^\n]*[ \t\r\f\v](\S+))?[ \t\r\f\v]*$", re.M)
+
+
+class ByteAnalysis:
+
+    def __init__(self, data):
+        # data: bytes-like, utf-8 lines
+        pool = StringPool.get_instance()
+        self.num_comparisons = len(_BYTES_COMPARISON.findall(data))
+        self.field_references = ByteAnalysis._count_references(_BYTES_FIELD, data, pool)
+        self.method_references = ByteAnalysis._count_references(_BYTES_METHOD, data, pool)
+
+    @staticmethod
+    def _count_references(pattern, data, pool):
+        counter = collections.Counter()
+        for match in pattern.finditer(data):
+            # no operands: the opcode is the last token
+            reference = match.group(1) if match.group(1) is not None else match.group(0).split()[0]
+            counter[pool.canonical(str(reference, "utf-8"))] += 1
+        return counter
+
+
+
+def main():
+    import SmaliAssemblyInstructions as smali
+
+    print("Testing MethodAnalysis...")
+
+    print("\tclassification tests...")
+    with open("./test/control_flow_test.smali", "r") as fh:
+        lines = fh.readlines()
+    analysis = MethodAnalysis(lines)
+    assert(len(analysis) == len(lines))
+    assert(analysis.num_comparisons == sum(1 for line in lines if
+        StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_IF) or
+        StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_CMP)))
+    for label, idx in analysis.labels.items():
+        assert(lines[idx].strip().startswith(label))
+    for idx in analysis.get_branches():
+        target = StigmaStringParsingLib.break_into_tokens(lines[idx])[-1]
+        assert(analysis.find_target(target, idx) == analysis.labels[target])
+
+    cfg = analysis.get_cfg(lines)
+    assert(analysis.get_cfg(lines) is cfg)
+
+    print("\tpatching tests...")
+    lines = [".method public a()V\n", "    .locals 1\n", "    if-eqz v0, :cond_0\n", "    sget v0, LA;->b:I\n",
+        "    :cond_0\n", "    invoke-static {}, LA;->c()V\n", "    return-void\n", ".end method\n"]
+    analysis = MethodAnalysis(lines[:4])
+    analysis.extend(lines[4:])
+    assert(analysis.labels == {":cond_0": 4})
+    assert(analysis.get_branches() == [2])
+    assert(analysis.field_references == {"LA;->b:I": 1})
+    assert(analysis.method_references == {"LA;->c()V": 1})
+
+    block = [smali.COMMENT("hi"), smali.BLANK_LINE()]
+    analysis.insert(2, block)
+    lines[2:2] = block
+    assert(analysis.labels == {":cond_0": 6})
+    assert(analysis.get_branches() == [4])
+
+    block = [smali.IF_NEZ("v0", ":jump_0"), smali.GOTO_32(":cond_0"), ":jump_0\n"]
+    analysis.replace(4, lines[4], block)
+    lines[4:5] = block
+    assert(analysis.labels == {":cond_0": 8, ":jump_0": 6})
+    assert(analysis.get_branches() == [4, 5])
+    assert(analysis.find_target(":cond_0", 5) == 8)
+    assert(analysis.num_comparisons == 1)
+    assert(list(analysis.kinds) == list(MethodAnalysis(lines).kinds))
+
+    analysis.replace(7, lines[7], [])
+    assert(analysis.field_references == {})
+    assert(analysis.labels == {":cond_0": 7, ":jump_0": 6})
+
+    print("\tbyte analysis tests...")
+    lines += ["    iget-object v0, p0, LA;->d:LB;  \n", "\tinvoke-virtual {v0}, LB;->e()V\r\n", "    sput\n",
+        "    cmp-long v0, v1, v2\n", "    # iget v0, p0, LA;->f:I\n", "    const-string v0, \"invoke-static\"\n"]
+    for data in ["".join(str(line) for line in lines).encode("utf-8"), b"", b"    iget v0, p0, LA;->b:I"]:
+        byte_analysis = ByteAnalysis(data)
+        analysis = MethodAnalysis(str(data, "utf-8").splitlines(keepends=True))
+        assert(byte_analysis.num_comparisons == analysis.num_comparisons)
+        assert(byte_analysis.field_references == analysis.field_references)
+        assert(byte_analysis.method_references == analysis.method_references)
+    assert(ByteAnalysis("".join(str(line) for line in lines).encode("utf-8")).method_references == {"LA;->c()V": 1, "LB;->e()V": 1})
+
+    with open("./test/Main.smali", "rb") as fh:
+        data = fh.read()
+    byte_analysis = ByteAnalysis(data)
+    analysis = MethodAnalysis(str(data, "utf-8").splitlines(keepends=True))
+    assert(byte_analysis.num_comparisons == analysis.num_comparisons > 0)
+    assert(byte_analysis.field_references == analysis.field_references)
+    assert(byte_analysis.method_references == analysis.method_references)
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import fnmatch
+
+
+# Decides which classes of an app are instrumented.  Most of the smali
+# code in a typical app is libraries (androidx, kotlin, play services ...)
+# and not "the code the developer actually wrote", instrumenting it makes
+# stigma slower and the tracked app bigger and slower.
+#
+# Patterns are java package / class names, either
+#     a prefix:  "com.google"   matches com.google.Foo, com.google.ads.Bar
+#                               (but not com.googlex.Foo)
+#     a glob:    "com.*.ads.*"  (fnmatch, matched against the whole name)
+#
+# A class is instrumented if it matches one of the include patterns (or
+# there are none) and none of the exclude patterns.  Excluded classes are
+# left exactly as apktool wrote them and are treated as external classes
+# (like the android framework) when the other classes are instrumented.
+
+# well-known libraries, excluded by exclude_libraries=True (--exclude-libraries)
+KNOWN_LIBRARY_PACKAGES = [
+    "android", "androidx", "dalvik", "java", "javax",
+    "kotlin", "kotlinx", "org.jetbrains", "org.intellij",
+    "com.android", "com.google.android", "com.google.firebase",
+    "com.google.gson", "com.google.common", "com.google.protobuf",
+    "com.google.ads", "com.google.crypto", "com.google.errorprone",
+    "com.facebook", "com.squareup", "okhttp3", "okio", "retrofit2",
+    "io.reactivex", "rx", "dagger", "javax.inject",
+    "org.apache", "org.json", "org.xmlpull", "org.slf4j",
+    "com.bumptech.glide", "com.airbnb.lottie", "com.crashlytics",
+    "io.fabric", "com.unity3d", "com.applovin", "com.mopub",
+]
+
+
+class PackageFilter:
+
+    def __init__(self, include=None, exclude=None, exclude_libraries=False):
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        if exclude_libraries:
+            self.exclude.extend(KNOWN_LIBRARY_PACKAGES)
+
+    @staticmethod
+    def from_strings(include_string=None, exclude_string=None, exclude_libraries=False):
+        # "com.foo,com.bar.*" (as given on the command line)
+        return PackageFilter(PackageFilter._split(include_string),
+            PackageFilter._split(exclude_string), exclude_libraries)
+
+    @staticmethod
+    def _split(patterns_string):
+        if patterns_string is None:
+            return []
+        return [pattern.strip() for pattern in patterns_string.split(",") if pattern.strip() != ""]
+
+    @staticmethod
+    def to_java_name(class_name):
+        # Lcom/google/Foo; => com.google.Foo
+        if class_name.startswith("L") and class_name.endswith(";"):
+            class_name = class_name[1:-1]
+        return class_name.replace("/", ".")
+
+    @staticmethod
+    def matches(pattern, java_name):
+        if any(c in pattern for c in "*?["):
+            return fnmatch.fnmatchcase(java_name, pattern)
+        return java_name == pattern or java_name.startswith(pattern + ".")
+
+    def is_active(self):
+        # False if every class is instrumented anyway
+        return self.include != [] or self.exclude != []
+
+    def should_instrument(self, class_name):
+        # class_name as in the .class line (Lcom/google/Foo;)
+        java_name = PackageFilter.to_java_name(class_name)
+        if self.include != [] and not any(PackageFilter.matches(p, java_name) for p in self.include):
+            return False
+        return not any(PackageFilter.matches(p, java_name) for p in self.exclude)
+
+    def __str__(self):
+        return "include: " + str(self.include) + " exclude: " + str(self.exclude)
+
+
+
+def main():
+    print("Testing PackageFilter...")
+
+    print("\tprefix tests...")
+    package_filter = PackageFilter(exclude=["com.google"])
+    assert(not package_filter.should_instrument("Lcom/google/Foo;"))
+    assert(not package_filter.should_instrument("Lcom/google/ads/Foo$1;"))
+    assert(package_filter.should_instrument("Lcom/googlex/Foo;"))
+    assert(package_filter.should_instrument("Ledu/fandm/enovak/leaks/Main;"))
+
+    print("\tglob tests...")
+    package_filter = PackageFilter(include=["edu.fandm.*"], exclude=["*$*"])
+    assert(package_filter.should_instrument("Ledu/fandm/enovak/leaks/Main;"))
+    assert(not package_filter.should_instrument("Ledu/fandm/enovak/leaks/Main$1;"))
+    assert(not package_filter.should_instrument("Lcom/google/Foo;"))
+
+    print("\tlibrary and command line tests...")
+    package_filter = PackageFilter.from_strings(None, "com.example.ads, ", True)
+    assert(package_filter.is_active())
+    assert(not package_filter.should_instrument("Landroidx/appcompat/app/AppCompatActivity;"))
+    assert(not package_filter.should_instrument("Lkotlin/jvm/internal/Intrinsics;"))
+    assert(not package_filter.should_instrument("Lcom/example/ads/Banner;"))
+    assert(package_filter.should_instrument("Lcom/example/app/MainActivity;"))
+    assert(not PackageFilter.from_strings().is_active())
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
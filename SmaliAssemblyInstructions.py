@@ -20,6 +20,11 @@
 #           only has ONE parameter; a register that serves as a destination.
 # Should the new class be a child of CONST?
 # Should the new class be a child of MOVE-RESULT?
+#
+# Every class (the "mixin" classes too) needs a __slots__ with the
+# attributes it adds, or [] if it adds none.  There is an instruction
+# object per line being type checked, a __dict__ for each is a lot of
+# memory.  One class without __slots__ gives all its children a __dict__.
 
 # Here are some of the "abstract" parent classes
 # _SINGLE_REGISTER_INSTRUCTION
@@ -38,6 +43,7 @@
 
 import StigmaStringParsingLib
 import SmaliTypes
+import ValidSmaliInstructions
 
 from SmaliRegister import SmaliRegister
 
@@ -45,6 +51,8 @@ from SmaliRegister import SmaliRegister
 class SmaliAssemblyInstruction():
 
     
+    __slots__ = []
+
     @staticmethod
     def from_line(raw_line_string):
         #print("constructing SmaliAssemblyInstruction From: " + str(raw_line_string))
@@ -60,7 +68,7 @@ class SmaliAssemblyInstruction():
 
 
         
-        tokens = StigmaStringParsingLib.break_into_tokens(line)
+        tokens = StigmaStringParsingLib.lex_line(line).tokens
         #tokens = list(filter(lambda x: x != "", tokens)) # removes ""
         #print("tokens: " + str(tokens))
         if(len(tokens) == 0):
@@ -69,52 +77,29 @@ class SmaliAssemblyInstruction():
 
         opcode = tokens[0]
 
+        if(opcode == "const-string" or opcode == "const-string/jumbo"):
+            return SmaliAssemblyInstruction._build_const_string(_class_name(opcode), line)
+
+        instruction_class = INSTRUCTION_CLASSES.get(opcode)
+        if instruction_class is None:
+            instruction_class = _find_instruction_class(opcode)
+            if instruction_class is None:
+                raise ValueError("Unknown instruction: " + line)
+
+        # example input line: "    move/from16 v1, v25"
+        # becomes: MOVE_FROM16("v1", "v25")
         if(opcode_has_parameter_list(opcode) or opcode_has_parameter_range(opcode)):
-            start = line.index("{")
-            end = line.index("}")
-            args = line[start+1:end]
-            #print("HERE")
-            #print(args)
+            # "invoke-static {v0, v1}, Lfoo;->bar(II)V"
+            # becomes: INVOKE_STATIC(["v0", "v1"], "Lfoo;->bar(II)V")
+            # and "{v10 .. v16}" becomes ["v10", "..", "v16"]
+            args = line[line.index("{")+1:line.index("}")]
             if args == "":
-                args = "[]"
+                register_list = []
             else:
-                args = args.split(" ")
-                args = str(list(map(lambda x : x.strip(","), args)))
-            
-            args = [ args ]
-            args.append("\"" + tokens[-1] + "\"")
-            #print("args before: " + str(args))
-            
-            
-        else:
-            args = tokens[1:]
-            #print("args before: " + str(args))
-            args = list(map(lambda x : "\"" + str(x.strip(",")) + "\"", args))
-            
-        #print("args: " + str(args))
+                register_list = [arg.strip(",") for arg in args.split(" ")]
+            return instruction_class(register_list, tokens[-1])
 
-
-        opcode = opcode.upper()
-        opcode = opcode.replace("/", "_")
-        opcode = opcode.replace("-", "_")
-        
-        
-        if(opcode == "CONST_STRING" or opcode == "CONST_STRING_JUMBO"):
-            smali_assembly_instruction = SmaliAssemblyInstruction._build_const_string(opcode, line)
-            return smali_assembly_instruction
-        else:
-            eval_string = opcode + "(" + ", ".join(args) + ")"
-        # example input line: "    move/from16 v1, v25"
-        # output eval_string: "MOVE_FROM16("v1", "v25")"    
-        #print("eval_string: " + eval_string)
-            
-            
-        # this next part is very very technical and feels
-        # pretty hacky
-        # https://www.programiz.com/python-programming/methods/built-in/eval
-        # https://stackoverflow.com/questions/3941517/converting-list-to-args-when-calling-function#3941529
-        smali_assembly_instruction_obj = eval(eval_string)
-        return smali_assembly_instruction_obj
+        return instruction_class(*[token.strip(",") for token in tokens[1:]])
 
     
     def __str__(self):
@@ -186,6 +171,7 @@ class _ImplicitRegistersInstruction():
     # instructions that have implicit registers
     # all such cases are "wide" instructions that 
     # work with 64-bit types Long, or Double
+    __slots__ = []
     def get_implicit_registers(self):
         ans = []
         for reg in self.get_registers():
@@ -196,6 +182,7 @@ class _ImplicitRegistersInstruction():
 class _ImplicitFirstRegisterInstruction():
     # the first register (and only that register)
     # specifies a "wide" type such as Long or Double
+    __slots__ = []
     def get_implicit_registers(self):
         regs = self.get_registers()
         return [regs[0] + 1]
@@ -205,6 +192,7 @@ class _ThirtyTwoBit_Parameters():
     # instruction classes that extend this type
     # are those in which ALL the registers/parameters
     # are 32-bit types
+    __slots__ = []
     def get_register_type_implications(self):
         ans = {}
         for reg in self.get_registers():
@@ -215,6 +203,7 @@ class _Object_Parameters():
     # instruction classes that extend this type
     # are those in which ALL the registers/parameters
     # are object types
+    __slots__ = []
     def get_register_type_implications(self):
         ans = {}
         for reg in self.get_registers():
@@ -225,6 +214,7 @@ class _SixtyFourBit_Dest():
     # instruction classes that extend this type
     # are those in which ALL the registers/parameters
     # are wide / "64-bit" types
+    __slots__ = []
     def get_register_type_implications(self):
         
         # consider the follow example
@@ -254,6 +244,7 @@ class _SixtyFourBit_Dest():
 
 
 class NOP(SmaliAssemblyInstruction):
+    __slots__ = []
     def __repr__(self):
         return self.opcode()
         
@@ -268,16 +259,19 @@ class INVOKE_DIRECT_EMPTY(NOP):
     #   "Stands as a placeholder for pruned empty methods 
     #   like Object.<init>. This acts as nop during 
     #   normal execution."
+    __slots__ = []
     def opcode(self):
         return "invoke-direct-empty"
 
 
 class BLANK_LINE(SmaliAssemblyInstruction):
+    __slots__ = []
     def __repr__(self):
         return ""
 
 
 class COMMENT(SmaliAssemblyInstruction):
+    __slots__ = ["l"]
     def __init__(self, line):
         self.l = line
 
@@ -286,6 +280,7 @@ class COMMENT(SmaliAssemblyInstruction):
 
 
 class MOVE(_ThirtyTwoBit_Parameters, SmaliAssemblyInstruction):
+    __slots__ = ["reg1", "reg2"]
     def __init__(self, reg1, reg2):
         self.reg1 = SmaliRegister(reg1)
         self.reg2 = SmaliRegister(reg2)
@@ -308,6 +303,7 @@ class MOVE_16(MOVE):
     # this might not exist
     # I couldn't find any occurrences in the smali of leaks
     
+    __slots__ = []
     def opcode(self):
         return "move/16"
     
@@ -320,6 +316,7 @@ class MOVE_16(MOVE):
 # but "/" is not a valid character in a class name
 class MOVE_FROM16(MOVE):
     
+    __slots__ = []
     def opcode(self):
         return "move/from16"
     
@@ -330,30 +327,37 @@ class MOVE_FROM16(MOVE):
 # I need the class name to be MOVE-WIDE
 # but "-" is not a valid character in a class name
 class MOVE_WIDE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, MOVE):
+    __slots__ = []
     def opcode(self):
         return "move-wide"
     
 class MOVE_WIDE_FROM16(MOVE_WIDE):
+    __slots__ = []
     def opcode(self):
         return "move-wide/from16"
 
 class MOVE_WIDE_16(MOVE_WIDE):
+    __slots__ = []
     def opcode(self):
         return "move-wide/16"
 
 class MOVE_OBJECT(_Object_Parameters, MOVE):
+    __slots__ = []
     def opcode(self):
         return "move-object"
         
 class MOVE_OBJECT_FROM16(MOVE_OBJECT):
+    __slots__ = []
     def opcode(self):
         return "move-object/from16"
 
 class MOVE_OBJECT_16(MOVE_OBJECT):
+    __slots__ = []
     def opcode(self):
         return "move-object/16"
 
 class _SINGLE_REGISTER_INSTRUCTION(SmaliAssemblyInstruction):
+    __slots__ = ["rd"]
     def __init__(self, reg_dest):
         self.rd = SmaliRegister(reg_dest)
 
@@ -368,6 +372,7 @@ class _SINGLE_DEST_REGISTER_INSTRUCTION(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly.
     #   * Note: _SINGLE_DEST_REGISTER_INSTRUCTION is any instruction that
     #   only has ONE parameter; a register that serves as a destination.
+    __slots__ = ["rd", "value_arg"]
     def __init__(self, reg_dest, value_arg):
         self.rd = SmaliRegister(reg_dest)
         self.value_arg = value_arg
@@ -380,22 +385,27 @@ class _SINGLE_DEST_REGISTER_INSTRUCTION(SmaliAssemblyInstruction):
 
 
 class MOVE_RESULT(_ThirtyTwoBit_Parameters, _SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "move-result"
 
 class MOVE_RESULT_WIDE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "move-result-wide"
 
 class MOVE_RESULT_OBJECT(_Object_Parameters, _SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "move-result-object"
 
 class MOVE_EXCEPTION(_Object_Parameters, _SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "move-exception"
 
 class RETURN_VOID(SmaliAssemblyInstruction):
+    __slots__ = []
     def opcode(self):
         return "return-void"
         
@@ -403,14 +413,17 @@ class RETURN_VOID(SmaliAssemblyInstruction):
         return self.opcode()
 
 class RETURN(_ThirtyTwoBit_Parameters, _SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "return"
 
 class RETURN_WIDE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "return-wide"
 
 class RETURN_OBJECT(_Object_Parameters, _SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "return-object"
 
@@ -418,35 +431,43 @@ class RETURN_OBJECT(_Object_Parameters, _SINGLE_REGISTER_INSTRUCTION):
 
 class CONST(_ThirtyTwoBit_Parameters, _SINGLE_DEST_REGISTER_INSTRUCTION):
         
+    __slots__ = []
     def opcode(self):
         return "const"
 
 
 class CONST_4(CONST):
+    __slots__ = []
     def opcode(self):
         return "const/4"
 
 class CONST_16(CONST):
+    __slots__ = []
     def opcode(self):
         return "const/16"
 
 class CONST_HIGH16(CONST):
+    __slots__ = []
     def opcode(self):
         return "const/high16"
 
 class CONST_WIDE(_ImplicitRegistersInstruction, _SixtyFourBit_Dest, CONST):
+    __slots__ = []
     def opcode(self):
         return "const-wide"
 
 class CONST_WIDE_16(CONST_WIDE):
+    __slots__ = []
     def opcode(self):
         return "const-wide/16"
 
 class CONST_WIDE_32(CONST_WIDE):
+    __slots__ = []
     def opcode(self):
         return "const-wide/32"
 
 class CONST_WIDE_HIGH16(CONST_WIDE):
+    __slots__ = []
     def opcode(self):
         return "const-wide/high16"
 
@@ -458,6 +479,7 @@ class CONST_STRING(SmaliAssemblyInstruction):
     # const-string/jumbo v1, "unrated"\n'
     # const-string/jumbo v2, "yyyy-MM-dd\'T\'HH:mm:ss.SSS\'Z\'"
     
+    __slots__ = ["rd", "str"]
     def __init__(self, reg = "", new_string = ""):
         # this constructor is invoked in the instrumenters
         # that write explicit const-string instructions
@@ -503,6 +525,7 @@ class CONST_STRING_JUMBO(CONST_STRING):
     #       const-string/jumbo v5, "stackTrace"
     #       const-string/jumbo v1, "unrated"
 
+    __slots__ = []
     def opcode(self):
         return "const-string/jumbo"
         
@@ -512,6 +535,7 @@ class CONST_STRING_JUMBO(CONST_STRING):
 
 class CONST_CLASS(_Object_Parameters, _SINGLE_DEST_REGISTER_INSTRUCTION):
 
+    __slots__ = []
     def opcode(self):
         return "const-class"
         
@@ -520,15 +544,18 @@ class CONST_CLASS(_Object_Parameters, _SINGLE_DEST_REGISTER_INSTRUCTION):
 
 
 class MONITOR_ENTER(_SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "monitor-enter"
         
 class MONITOR_EXIT(_SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "monitor-exit"
     
     
 class CHECK_CAST( _Object_Parameters, _SINGLE_DEST_REGISTER_INSTRUCTION): 
+    __slots__ = []
     def opcode(self):
         return "check-cast"
         
@@ -537,6 +564,7 @@ class CHECK_CAST( _Object_Parameters, _SINGLE_DEST_REGISTER_INSTRUCTION):
          
         
 class INSTANCE_OF(SmaliAssemblyInstruction):
+    __slots__ = ["rr", "ra", "type_id"]
     def __init__(self, reg_res, reg_arg, type_id):
         self.rr = SmaliRegister(reg_res)
         self.ra = SmaliRegister(reg_arg)
@@ -558,6 +586,7 @@ class INSTANCE_OF(SmaliAssemblyInstruction):
         
 
 class NEW_INSTANCE(SmaliAssemblyInstruction):
+    __slots__ = ["rd", "type_id"]
     def __init__(self, reg_dest, type_id):
         self.rd = SmaliRegister(reg_dest)
         self.type_id = type_id
@@ -577,6 +606,7 @@ class NEW_INSTANCE(SmaliAssemblyInstruction):
 
 
 class ARRAY_LENGTH(SmaliAssemblyInstruction):
+    __slots__ = ["rd", "rar"]
     def __init__(self, reg_dest, reg_array_ref):
         self.rd = SmaliRegister(reg_dest)
         self.rar = SmaliRegister(reg_array_ref)
@@ -597,6 +627,7 @@ class ARRAY_LENGTH(SmaliAssemblyInstruction):
     
         
 class NEW_ARRAY(SmaliAssemblyInstruction):
+    __slots__ = ["rd", "rs", "type_id"]
     def __init__(self, reg_dest, reg_size, type_id):
         self.rd = SmaliRegister(reg_dest)
         self.rs = SmaliRegister(reg_size)
@@ -620,6 +651,7 @@ class NEW_ARRAY(SmaliAssemblyInstruction):
 class _PARAMETER_LIST_INSTRUCTION(SmaliAssemblyInstruction):
     # Not an ImplicitRegistersInstruction because both registers
     # for a wide-type will be explicitly listed in the parameter list
+    __slots__ = ["register_list", "type_id"]
     def __init__(self, element_list, type_id):
         self.register_list = [SmaliRegister(r) for r in element_list]
         self.type_id = type_id
@@ -636,6 +668,7 @@ class _PARAMETER_LIST_INSTRUCTION(SmaliAssemblyInstruction):
 class _PARAMETER_RANGE_INSTRUCTION(SmaliAssemblyInstruction):
     # Not an ImplicitRegistersInstruction because both registers
     # for a wide-type will be explicitly listed in the parameter list
+    __slots__ = ["begin_reg", "end_reg", "sig"]
     def __init__(self, element_list, signature):
         self.begin_reg = SmaliRegister(element_list[0])
         self.end_reg = SmaliRegister(element_list[-1])
@@ -659,6 +692,7 @@ class _PARAMETER_RANGE_INSTRUCTION(SmaliAssemblyInstruction):
 
 
 class FILLED_NEW_ARRAY(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "filled-new-array"
         
@@ -670,6 +704,7 @@ class FILLED_NEW_ARRAY(_PARAMETER_LIST_INSTRUCTION):
         
 
 class FILLED_NEW_ARRAY_RANGE(_PARAMETER_RANGE_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "filled-new-array/range"
         
@@ -682,6 +717,7 @@ class FILLED_NEW_ARRAY_RANGE(_PARAMETER_RANGE_INSTRUCTION):
         
 
 class FILL_ARRAY_DATA(_SINGLE_DEST_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "fill-array-data"
     
@@ -689,6 +725,7 @@ class FILL_ARRAY_DATA(_SINGLE_DEST_REGISTER_INSTRUCTION):
         return {self.rd: SmaliTypes.NonSpecificArray()}
 
 class THROW(_SINGLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "throw"
     
@@ -697,6 +734,7 @@ class THROW(_SINGLE_REGISTER_INSTRUCTION):
 
 
 class GOTO(SmaliAssemblyInstruction):
+    __slots__ = ["target"]
     def __init__(self, target):
         self.target = target
         
@@ -707,10 +745,12 @@ class GOTO(SmaliAssemblyInstruction):
         return self.opcode() + " " + str(self.target)
 
 class GOTO_16(GOTO):
+    __slots__ = []
     def opcode(self):
         return "goto/16"
 
 class GOTO_32(GOTO):
+    __slots__ = []
     def opcode(self):
         return "goto/32"
 
@@ -721,16 +761,19 @@ class PACKED_SWITCH(_SINGLE_DEST_REGISTER_INSTRUCTION):
     # e.g., .packed-switch -0x9
     # this object implements the instruction packed-switch vX, :pswitch_data_Y
     # I'm not sure what type vX holds, maybe int?
+    __slots__ = []
     def opcode(self):
         return "packed-switch"
 
 class SPARSE_SWITCH(_SINGLE_DEST_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sparse-switch"
 
 
 class _TRIPLE_REGISTER_INSTRUCTION(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
+    __slots__ = ["rd", "ra1", "ra2"]
     def __init__(self, reg_dest, reg_arg1, reg_arg2):
         self.rd = SmaliRegister(reg_dest)
         self.ra1 = SmaliRegister(reg_arg1)
@@ -744,14 +787,17 @@ class _TRIPLE_REGISTER_INSTRUCTION(SmaliAssemblyInstruction):
         
         
 class CMPL_FLOAT( _ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "cmpl-float"
         
 class CMPG_FLOAT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "cmpg-float"
         
 class CMPL_DOUBLE(_TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "cmpl-double"
         
@@ -775,6 +821,7 @@ class CMPL_DOUBLE(_TRIPLE_REGISTER_INSTRUCTION):
         return ans
         
 class CMPG_DOUBLE(_TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "cmpg-double"
     
@@ -798,6 +845,7 @@ class CMPG_DOUBLE(_TRIPLE_REGISTER_INSTRUCTION):
         return ans
         
 class CMP_LONG(_TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "cmp-long"
         
@@ -822,6 +870,7 @@ class CMP_LONG(_TRIPLE_REGISTER_INSTRUCTION):
         
 class _TWO_REG_EQ(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
+    __slots__ = ["ra1", "ra2", "target"]
     def __init__(self, reg_arg1, reg_arg2, target):
         self.ra1 = SmaliRegister(reg_arg1)
         self.ra2 = SmaliRegister(reg_arg2)
@@ -834,32 +883,39 @@ class _TWO_REG_EQ(SmaliAssemblyInstruction):
         return self.opcode() + " " + str(self.ra1) + ", " + str(self.ra2) + ", " + str(self.target)
         
 class IF_EQ(_TWO_REG_EQ):
+    __slots__ = []
     def opcode(self):
         return "if-eq"
         
 class IF_NE(_TWO_REG_EQ):
+    __slots__ = []
     def opcode(self):
         return "if-ne"
         
 class IF_LT(_TWO_REG_EQ):
+    __slots__ = []
     def opcode(self):
         return "if-lt"
         
 class IF_GE(_TWO_REG_EQ):
+    __slots__ = []
     def opcode(self):
         return "if-ge"
         
 class IF_GT(_TWO_REG_EQ):
+    __slots__ = []
     def opcode(self):
         return "if-gt"
         
 class IF_LE(_TWO_REG_EQ):
+    __slots__ = []
     def opcode(self):
         return "if-le"
         
         
 class _ONE_REG_EQ_ZERO(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
+    __slots__ = ["ra", "target"]
     def __init__(self, reg_arg, target):
         self.ra = SmaliRegister(reg_arg)
         self.target = target
@@ -884,104 +940,118 @@ class _ONE_REG_EQ_ZERO(SmaliAssemblyInstruction):
         
 
 class IF_EQZ(_ONE_REG_EQ_ZERO):
+    __slots__ = []
     def opcode(self):
         return "if-eqz"
         
 class IF_NEZ(_ONE_REG_EQ_ZERO):
+    __slots__ = []
     def opcode(self):
         return "if-nez"
 
 class IF_LTZ(_ONE_REG_EQ_ZERO):
+    __slots__ = []
     def opcode(self):
         return "if-ltz"
         
 class IF_GEZ(_ONE_REG_EQ_ZERO):
+    __slots__ = []
     def opcode(self):
         return "if-gez"
         
 class IF_GTZ(_ONE_REG_EQ_ZERO):
+    __slots__ = []
     def opcode(self):
         return "if-gtz"
         
 class IF_LEZ(_ONE_REG_EQ_ZERO):
+    __slots__ = []
     def opcode(self):
         return "if-lez"     
 
         
 class _Array_Parameters_Type_Pattern():
+    __slots__ = []
     def get_register_type_implications(self):
         # aget vX, vY, vZ
         # vX dest (or src for aput-* instructions)
         # vY a reference to an array
         # vZ index / offset into array (I think this must be a 32-bit int)
     
-        self.ans = {}
-        self.ans[self.ra1] = SmaliTypes.NonSpecificArray()
-        self.ans[self.ra2] = SmaliTypes.Int()
+        ans = {}
+        ans[self.ra1] = SmaliTypes.NonSpecificArray()
+        ans[self.ra2] = SmaliTypes.Int()
         
         # this should be done last for situations such as
         # aget v4, v4, v6
         # where self.rd should definitely have final decision
         # about the type of v4
-        self._set_first_param_type() 
-        return self.ans
+        self._set_first_param_type(ans) 
+        return ans
         
         
 class AGET(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aget"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.ThirtyTwoBit()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.ThirtyTwoBit()
 
 class AGET_WIDE(_Array_Parameters_Type_Pattern, _ImplicitFirstRegisterInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aget-wide"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.SixtyFourBit()
-        self.ans[self.rd + 1] = SmaliTypes.SixtyFourBit_2()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.SixtyFourBit()
+        ans[self.rd + 1] = SmaliTypes.SixtyFourBit_2()
 
 class AGET_OBJECT(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aget-object"
         
-    def _set_first_param_type(self):
+    def _set_first_param_type(self, ans):
         # this is a special case and should be treated as such!
         # it really should check the type of vY and do an unwrap_layer()
         # but that's not possible in this class / context
         # because we don't have a register_type_map
         #
         # NonSpecificObjectReference as a very low specificity level
-        self.ans[self.rd] = SmaliTypes.NonSpecificObjectReference()
+        ans[self.rd] = SmaliTypes.NonSpecificObjectReference()
 
 class AGET_BOOLEAN(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aget-boolean"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Boolean()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Boolean()
 
 class AGET_BYTE(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aget-byte"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Byte()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Byte()
 
 class AGET_CHAR(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aget-char"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Char()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Char()
 
 class AGET_SHORT(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aget-short"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Short()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Short()
 
 
 class APUT(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
@@ -989,54 +1059,61 @@ class APUT(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
     # vX is a value to be put into the array
     # vY is an array reference
     # vZ is an index into that array
+    __slots__ = []
     def opcode(self):
         return "aput"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Int()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Int()
 
 class APUT_WIDE(_Array_Parameters_Type_Pattern, _ImplicitFirstRegisterInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aput-wide"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.SixtyFourBit()
-        self.ans[self.rd + 1] = SmaliTypes.SixtyFourBit_2()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.SixtyFourBit()
+        ans[self.rd + 1] = SmaliTypes.SixtyFourBit_2()
 
 class APUT_OBJECT(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aput-object"
 
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.NonSpecificObjectReference()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.NonSpecificObjectReference()
 
 class APUT_BOOLEAN(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aput-boolean"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Boolean()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Boolean()
 
 class APUT_BYTE(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aput-byte"
 
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Byte()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Byte()
 
 class APUT_CHAR(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aput-char"
 
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Char()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Char()
 
 class APUT_SHORT(_Array_Parameters_Type_Pattern, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "aput-short"
         
-    def _set_first_param_type(self):
-        self.ans[self.rd] = SmaliTypes.Short()
+    def _set_first_param_type(self, ans):
+        ans[self.rd] = SmaliTypes.Short()
 
 
 
@@ -1046,6 +1123,7 @@ class _I_INSTRUCTION(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
     #   Backward compatibility with how we call IGET() in Instrument
     # instance_field_name
+    __slots__ = ["rd", "rci", "class_name", "ifn", "class_and_field_name"]
     def __init__(self, reg_dest, reg_calling_instance, class_name , instance_field_name = ""): 
         #print("reg dest: ", reg_dest, "  reg_calling_instance", reg_calling_instance, "  class name", class_name, "  instance_field_name:", instance_field_name)
         self.rd = SmaliRegister(reg_dest)
@@ -1069,23 +1147,25 @@ class _I_INSTRUCTION(SmaliAssemblyInstruction):
         # vY a reference to an object
         # vZ index / offset into array (I think this must be a 32-bit int)
     
-        self.ans = {}
-        self.ans[self.rci] = SmaliTypes.from_string(self.class_name)
+        ans = {}
+        ans[self.rci] = SmaliTypes.from_string(self.class_name)
         
         tmp = self.class_and_field_name.split(":")[1]
         first_reg_type = SmaliTypes.from_string(tmp)  
-        self.ans[self.rd] = first_reg_type
-        return self.ans
+        ans[self.rd] = first_reg_type
+        return ans
 
     def __repr__(self):
         return self.opcode() + " " + str(self.rd) + ", " + str(self.rci) + ", " + self.class_and_field_name
 
 class IGET(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iget"
 
         
 class IGET_WIDE(_ImplicitFirstRegisterInstruction, _I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iget-wide"
         
@@ -1096,30 +1176,37 @@ class IGET_WIDE(_ImplicitFirstRegisterInstruction, _I_INSTRUCTION):
         return ans
         
 class IGET_OBJECT(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iget-object"
 
 class IGET_BOOLEAN(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iget-boolean"
 
 class IGET_BYTE(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iget-byte"
 
 class IGET_CHAR(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iget-char"
 
 class IGET_SHORT(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iget-short"
 
 class IPUT(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iput"
 
 class IPUT_WIDE(_ImplicitFirstRegisterInstruction, _I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iput-wide"
         
@@ -1130,22 +1217,27 @@ class IPUT_WIDE(_ImplicitFirstRegisterInstruction, _I_INSTRUCTION):
         return ans
         
 class IPUT_OBJECT(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iput-object"
 
 class IPUT_BOOLEAN(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iput-boolean"
 
 class IPUT_BYTE(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iput-byte"
 
 class IPUT_CHAR(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iput-char"
 
 class IPUT_SHORT(_I_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "iput-short"
 
@@ -1153,6 +1245,7 @@ class IPUT_SHORT(_I_INSTRUCTION):
 class _S_INSTRUCTION(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
     #   Backward compatibility with how we call IGET() in Instrument
+    __slots__ = ["field_fqn", "rd", "class_name", "class_and_field_name"]
     def __init__(self, reg_dest, class_name , instance_field_name = ""): 
         self.field_fqn = ""
         self.rd = SmaliRegister(reg_dest)
@@ -1172,22 +1265,24 @@ class _S_INSTRUCTION(SmaliAssemblyInstruction):
         # vY a reference to an object
         # vZ index / offset into array (I think this must be a 32-bit int)
     
-        self.ans = {}
+        ans = {}
         
         tmp = self.class_and_field_name.split(":")[1]
         first_reg_type = SmaliTypes.from_string(tmp)  
-        self.ans[self.rd] = first_reg_type
-        return self.ans
+        ans[self.rd] = first_reg_type
+        return ans
 
     def __repr__(self):
         if self.field_fqn == "":
             return self.opcode() + " " + str(self.rd) + ", " + self.class_and_field_name
 
 class SGET(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sget"
 
 class SGET_WIDE(_ImplicitRegistersInstruction, _S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sget-wide"
 
@@ -1198,30 +1293,37 @@ class SGET_WIDE(_ImplicitRegistersInstruction, _S_INSTRUCTION):
         return ans
         
 class SGET_OBJECT(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sget-object"
 
 class SGET_BOOLEAN(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sget-boolean"
 
 class SGET_BYTE(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sget-byte"
 
 class SGET_CHAR(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sget-char"
 
 class SGET_SHORT(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sget-short"
 
 class SPUT(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sput"
         
 class SPUT_WIDE(_ImplicitRegistersInstruction, _S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sput-wide"
         
@@ -1232,22 +1334,27 @@ class SPUT_WIDE(_ImplicitRegistersInstruction, _S_INSTRUCTION):
         return ans
         
 class SPUT_OBJECT(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sput-object"
 
 class SPUT_BOOLEAN(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sput-boolean"
 
 class SPUT_BYTE(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sput-byte"
 
 class SPUT_CHAR(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sput-char"
 
 class SPUT_SHORT(_S_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sput-short"
 
@@ -1256,52 +1363,64 @@ class INVOKE_VIRTUAL(_PARAMETER_LIST_INSTRUCTION):
     # I was too lazy to implement the get_register_type_implications
     # function for the below instructions
     # It could be done with the SmaliSignature class from SmaliMethodDef.py
+    __slots__ = []
     def opcode(self):
         return "invoke-virtual"
 
 class INVOKE_SUPER(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-super"
 
 class INVOKE_DIRECT(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-direct"
 
 class INVOKE_STATIC(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-static"
 
 class INVOKE_INTERFACE(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-interface"
 
 class INVOKE_VIRTUAL(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-virtual"
 
 class INVOKE_VIRTUAL_RANGE(_PARAMETER_RANGE_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-virtual/range"
 
 class INVOKE_SUPER_RANGE(_PARAMETER_RANGE_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-virtual/range"
 
 class INVOKE_DIRECT_RANGE(_PARAMETER_RANGE_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-direct/range"
 
 class INVOKE_STATIC_RANGE(_PARAMETER_RANGE_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-static/range"
 
 class INVOKE_INTERFACE_RANGE(_PARAMETER_RANGE_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "invoke-interface/range"
 
 
 class _TWO_REGISTER_UNARY_INSTRUCTION(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
+    __slots__ = ["rd", "ra"]
     def __init__(self, reg_dest, reg_arg):
         super().__init__()
         self.rd = SmaliRegister(reg_dest)
@@ -1315,30 +1434,37 @@ class _TWO_REGISTER_UNARY_INSTRUCTION(SmaliAssemblyInstruction):
 
 
 class NEG_INT(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "neg-int"
 
 class NOT_INT(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "not-int"
         
 class NOT_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "neg-long"
 
 class NEG_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "neg-long"
 
 class NEG_FLOAT(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "neg-float"
 
 class NEG_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "neg-double"
 
 class INT_TO_LONG(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "int-to-long"
         
@@ -1351,10 +1477,12 @@ class INT_TO_LONG(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INSTRUC
         
 
 class INT_TO_FLOAT(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "int-to-float"
 
 class INT_TO_DOUBLE(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "int-to-double"
         
@@ -1365,6 +1493,7 @@ class INT_TO_DOUBLE(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INSTR
         return ans
 
 class LONG_TO_INT(_TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "long-to-int"
 
@@ -1379,6 +1508,7 @@ class LONG_TO_INT(_TWO_REGISTER_UNARY_INSTRUCTION):
         return ans
 
 class LONG_TO_FLOAT(_TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "long-to-float"
         
@@ -1393,15 +1523,18 @@ class LONG_TO_FLOAT(_TWO_REGISTER_UNARY_INSTRUCTION):
         return ans
 
 class LONG_TO_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "long-to-double"
 
 
 class FLOAT_TO_INT(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "float-to-int"
 
 class FLOAT_TO_LONG(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "float-to-long"
         
@@ -1412,6 +1545,7 @@ class FLOAT_TO_LONG(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INSTR
         return ans
 
 class FLOAT_TO_DOUBLE(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "float-to-double"
         
@@ -1422,6 +1556,7 @@ class FLOAT_TO_DOUBLE(_ImplicitFirstRegisterInstruction, _TWO_REGISTER_UNARY_INS
         return ans
 
 class DOUBLE_TO_INT(_TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "double-to-int"
         
@@ -1436,10 +1571,12 @@ class DOUBLE_TO_INT(_TWO_REGISTER_UNARY_INSTRUCTION):
         return ans
 
 class DOUBLE_TO_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "double-to-long"
 
 class DOUBLE_TO_FLOAT(_TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "double-to-float"
         
@@ -1454,142 +1591,177 @@ class DOUBLE_TO_FLOAT(_TWO_REGISTER_UNARY_INSTRUCTION):
         return ans
 
 class INT_TO_BYTE(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "int-to-byte"
 
 class INT_TO_CHAR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "int-to-char"
 
 class INT_TO_SHORT(_ThirtyTwoBit_Parameters, _TWO_REGISTER_UNARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "int-to-short"
 
 class ADD_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-int"
 
 class SUB_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-int"
 
 class MUL_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-int"
 
 class DIV_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-int"
 
 class REM_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-int"
 
 class AND_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "and-int"
 
 class OR_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "or-int"
 
 class XOR_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "xor-int"
 
 class SHL_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shl-int"
 
 class SHR_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shr-int"
 
 class USHR_INT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "ushr-int"
 
 class ADD_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-long"
 
 class SUB_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-long"
 
 class MUL_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-long"
 
 class DIV_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-long"
 
 class REM_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-long"
 
 class AND_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "and-long"
 
 class OR_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "or-long"
 
 class XOR_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "xor-long"
 
 class SHL_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shl-long"
 
 class SHR_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction,_TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shr-long"
 
 class USHR_LONG(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "ushr-long"
 
 class ADD_FLOAT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-float"
 
 class SUB_FLOAT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-float"
 
 class MUL_FLOAT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-float"
 
 class DIV_FLOAT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-float"
 
 class REM_FLOAT(_ThirtyTwoBit_Parameters, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-float"
 
 class ADD_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-double"
 
 class SUB_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-double"
 
 class MUL_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-double"
 
 class DIV_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-double"
 
 class REM_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGISTER_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-double"
 
@@ -1597,6 +1769,7 @@ class REM_DOUBLE(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TRIPLE_REGI
 class _TWO_REGISTER_BINARY_INSTRUCTION(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
     
+    __slots__ = ["rd", "ra1", "ra2"]
     def __init__(self, reg_dest_and_arg1, reg_arg2):
         super().__init__()
         self.rd = SmaliRegister(reg_dest_and_arg1)
@@ -1611,130 +1784,162 @@ class _TWO_REGISTER_BINARY_INSTRUCTION(SmaliAssemblyInstruction):
     
     
 class ADD_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-int/2addr"
 
 class SUB_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-int/2addr"
 
 class MUL_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-int/2addr"
 
 class DIV_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-int/2addr"
         
 class REM_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-int/2addr"
 
 class AND_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "and-int/2addr"
         
 class OR_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "or-int/2addr"
 
 class XOR_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "xor-int/2addr"
 
 class SHL_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shl-int/2addr"
 
 class SHR_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shr-int/2addr"
 
 class USHR_INT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "ushr-int/2addr"
             
 class ADD_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-long/2addr"
 
 class SUB_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-long/2addr"
 
 class MUL_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-long/2addr"
 
 class DIV_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-long/2addr"
         
 class REM_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-long/2addr"
 
 class AND_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "and-long/2addr"
         
 class OR_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "or-long/2addr"
 
 class XOR_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "xor-long/2addr"
 
 class SHL_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shl-long/2addr"
 
 class SHR_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shr-long/2addr"
 
 class USHR_LONG_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "ushr-long/2addr"
 
 class ADD_FLOAT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-float/2addr"
         
 class SUB_FLOAT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-float/2addr"
         
 class MUL_FLOAT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-float/2addr"
         
 class DIV_FLOAT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-float/2addr"
         
 class REM_FLOAT_2ADDR(_ThirtyTwoBit_Parameters, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-float/2addr"
         
 class ADD_DOUBLE_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-double/2addr"
         
 class SUB_DOUBLE_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-double/2addr"
         
 class MUL_DOUBLE_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-double/2addr"
         
 class DIV_DOUBLE_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-double/2addr"
         
 class REM_DOUBLE_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_REGISTER_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-double/2addr"
         
@@ -1742,6 +1947,7 @@ class REM_DOUBLE_2ADDR(_SixtyFourBit_Dest, _ImplicitRegistersInstruction, _TWO_R
 class _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
     
+    __slots__ = ["rd", "ra1", "ra2", "lit"]
     def __init__(self, reg_dest_and_arg1, reg_arg2, literal):
         self.rd = SmaliRegister(reg_dest_and_arg1)
         self.ra1 = SmaliRegister(reg_dest_and_arg1)
@@ -1756,34 +1962,42 @@ class _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION(SmaliAssemblyInstruction):
 
 
 class ADD_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-int/lit16"
         
 class SUB_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-int/lit16"
 
 class MUL_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-int/lit16"
         
 class DIV_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-int/lit16"
         
 class REM_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-int/lit16"
 
 class AND_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "and-int/lit16"
 
 class OR_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "or-int/lit16"
         
 class XOR_INT_LIT16(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "xor-int/lit16"
         
@@ -1791,54 +2005,67 @@ class RSUB_INT(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRU
     # this is a weird instruction, apparently there is rsub-int and rsub-int/lit8
     # rsub-int should actually be named rsub-int/lit16, but it's not and there
     # are not other variants such as rsub-long or radd-float, etc.
+    __slots__ = []
     def opcode(self):
         return "rsub-int"
         
 class ADD_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "add-int/lit8"
         
 class SUB_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "sub-int/lit8"
         
 class RSUB_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rsub-int/lit8"
         
 class MUL_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "mul-int/lit8"
         
 class DIV_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "div-int/lit8"
         
 class REM_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "rem-int/lit8"
         
 class AND_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "and-int/lit8"
         
 class OR_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "or-int/lit8"
         
 class XOR_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "xor-int/lit8"
         
 class SHL_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shl-int/lit8"
         
 class SHR_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "shr-int/lit8"
         
 class USHR_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_INSTRUCTION):
+    __slots__ = []
     def opcode(self):
         return "ushr-int/lit8"
         
@@ -1848,6 +2075,7 @@ class USHR_INT_LIT8(_ThirtyTwoBit_Parameters, _TWO_REGISTER_AND_LITERAL_BINARY_I
 class _I_INSTRUCTION_QUICK(SmaliAssemblyInstruction):
     # A parent class that should never be instantiated directly
     # No instances of any "quick" instruction found in our APKs
+    __slots__ = ["rd", "rci", "offset"]
     def __init__(self, reg_dest, reg_calling_instance, offset): 
         self.rd = SmaliRegister(reg_dest)
         self.rci = SmaliRegister(reg_calling_instance)
@@ -1868,30 +2096,37 @@ class _I_INSTRUCTION_QUICK(SmaliAssemblyInstruction):
         return self.opcode() + " " + str(self.rd) + ", " + str(self.rci) + ", " + str(self.offset)
 
 class IGET_QUICK(_I_INSTRUCTION_QUICK):
+    __slots__ = []
     def opcode(self):
         return "iget-quick"
 
 class IGET_WIDE_QUICK(_SixtyFourBit_Dest, _ImplicitFirstRegisterInstruction, _I_INSTRUCTION_QUICK):
+    __slots__ = []
     def opcode(self):
         return "iget-wide-quick"
         
 class IGET_OBJECT_QUICK(_Object_Parameters, _I_INSTRUCTION_QUICK):
+    __slots__ = []
     def opcode(self):
         return "iget-object-quick"
         
 class IPUT_QUICK(_I_INSTRUCTION_QUICK):
+    __slots__ = []
     def opcode(self):
         return "iput-quick"
         
 class IPUT_WIDE_QUICK(_SixtyFourBit_Dest, _ImplicitFirstRegisterInstruction, _I_INSTRUCTION_QUICK):
+    __slots__ = []
     def opcode(self):
         return "iput-wide-quick"
         
 class IPUT_OBJECT_QUICK(_Object_Parameters, _I_INSTRUCTION_QUICK):
+    __slots__ = []
     def opcode(self):
         return "iput-object-quick"
 
 class INVOKE_VIRTUAL_QUICK(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = ["vtable", "calling_object"]
     def __init__(self, element_list, vtable):
         super().__init__(element_list, None)
         self.vtable = vtable
@@ -1905,6 +2140,7 @@ class INVOKE_VIRTUAL_QUICK(_PARAMETER_LIST_INSTRUCTION):
         return self.opcode() + " {" + reg_string + "}, " + str(self.vtable)
 
 class INVOKE_SUPER_QUICK(_PARAMETER_LIST_INSTRUCTION):
+    __slots__ = ["vtable", "calling_object"]
     def __init__(self, element_list, vtable):
         super().__init__(element_list, None)
         self.vtable = vtable
@@ -1925,6 +2161,7 @@ class INVOKE_SUPER_QUICK(_PARAMETER_LIST_INSTRUCTION):
 # class INVOKE_SUPER_QUICK_RANGE
         
 class LABEL(SmaliAssemblyInstruction):
+    __slots__ = ["n"]
     def __init__(self, num):
         self.n = num
 
@@ -1938,6 +2175,7 @@ class LOG_D(INVOKE_STATIC):
     # Not actually an assembly instruction!  More 
     # of a short-cut to quickly create an instance
     # of invoke-static for a Log.d() call
+    __slots__ = ["rt", "rm"]
     def __init__(self, reg_tag, reg_msg):
         self.rt = SmaliRegister(reg_tag)
         self.rm = SmaliRegister(reg_msg)
@@ -1996,6 +2234,27 @@ def opcode_has_parameter_range(opcode):
     return opcode.endswith("/range")
 
 
+def _class_name(opcode):
+    # "move/from16" => "MOVE_FROM16"
+    return opcode.upper().replace("/", "_").replace("-", "_")
+
+
+def _find_instruction_class(opcode):
+    # "move/from16" => MOVE_FROM16 (the class), None if there is no such class
+    instruction_class = globals().get(_class_name(opcode))
+    if isinstance(instruction_class, type) and issubclass(instruction_class, SmaliAssemblyInstruction):
+        INSTRUCTION_CLASSES[opcode] = instruction_class
+        return instruction_class
+    return None
+
+
+# opcode => instruction class, used by SmaliAssemblyInstruction.from_line()
+# (instead of eval()-ing a constructor call for every line)
+INSTRUCTION_CLASSES = {}
+for _opcode in ValidSmaliInstructions.LIST + ["nop"]:
+    _find_instruction_class(_opcode)
+
+
 def main():
 
     # One test for every isntruction in SmaliAssemblyInstructions.py
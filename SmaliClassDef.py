@@ -1,7 +1,9 @@
 import StigmaStringParsingLib
 import re
+import ClassFileIO
+from StringPool import StringPool
 import SmaliAssemblyInstructions as smali
-from SmaliMethodDef import SmaliMethodDef
+from SmaliMethodDef import SmaliMethodDef, VerbatimMethodDef
 
 
 class SmaliClassDef:
@@ -10,12 +12,13 @@ class SmaliClassDef:
     # self.static_fields: a list of strings, the static fields in this class
     # self.instance_fields: a list of strings, the instance fields in this class
     # self.methods: a list of SmaliMethodDef objects in this class
+    #       (VerbatimMethodDef objects for methods instrumentation leaves alone)
     # self.file_name: the (absolute?) path to the file
     # self.class_name: extracted from the first line of the smali file
     #       example: Lcom/google/android/material/animation/AnimationUtils;
 
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, lines=None, shared_internal_class_names=None, mapped_file=None):
         # These are just lists of strings
         # Should be filled in before instrument
         self.header = []
@@ -26,71 +29,124 @@ class SmaliClassDef:
         # should probably be a set
         self.internal_class_names = []
         
+        # a set of internal class names shared by all the classes of an app
+        # (not copied into every class like internal_class_names)
+        if shared_internal_class_names is None:
+            shared_internal_class_names = frozenset()
+        self.shared_internal_class_names = shared_internal_class_names
+        
+        # every is_internal_class() question asked and its answer
+        # (key: class name, value: bool), see InstrumentedClassCache
+        self.internal_class_queries = {}
+        
 
         # This is a list of SmaliMethodDef (as seen above) which aids instrumentation later
         self.methods = []
         self.file_name = file_name
         
-        self.class_name = SmaliClassDef.extract_class_name(file_name)
+        # a ClassFileIO.MappedClassFile (see from_mapped_file()) the
+        # methods are taken from, closed by release()
+        self.mapped_file = mapped_file
+        
+        if mapped_file is not None:
+            parts = list(mapped_file.outline())
+        else:
+            # lines can be passed in by a caller that already read the file
+            if lines is None:
+                fh = open(file_name, "r")
+                lines = fh.readlines()
+                fh.close()
+            parts = SmaliClassDef._split_methods(lines)
+        
+        self.class_name = StringPool.get_instance().canonical(SmaliClassDef.class_name_from_line(parts[0]))
         self.internal_class_names.append(self.class_name)
         #print("self.class_name created: ", self.class_name)
-        
-        fh = open(file_name, "r")
-        lines = fh.readlines()
-        fh.close()
 
 
         cur_dest = self.header
         pre_methods = True
+        for part in parts:
+            if not isinstance(part, str):
+                self.methods.append(self._make_method(part))
+                continue
+                
+            if "# static fields\n" == part:
+                cur_dest = self.static_fields
+
+            if "# instance fields\n" == part:
+                cur_dest = self.instance_fields
+
+            if "# direct methods\n" == part:
+                pre_methods = False
+
+            if pre_methods:
+                cur_dest.append(part)
+            
+            
+    @staticmethod
+    def from_mapped_file(file_name, shared_internal_class_names=None):
+        # Parses the class from a memory mapped file: the methods that
+        # no handler touches (see VerbatimMethodDef) are never decoded and
+        # are written by write_to_file() straight from the mapped file
+        return SmaliClassDef(file_name, None, shared_internal_class_names, ClassFileIO.MappedClassFile(file_name))
+    
+    
+    @staticmethod
+    def _split_methods(lines):
+        # the lines outside of the methods (str) and the methods (lists
+        # of lines, from ".method" to ".end method") in the order of the file
+        parts = []
         idx = 0
         while idx < len(lines):
             #print("processing line: " + str(lines[idx]))
-            match_object = re.match(StigmaStringParsingLib.BEGINS_WITH_DOT_METHOD, lines[idx])
-            if match_object is not None:  # This is the start of a method defintion
+            if StigmaStringParsingLib.begins_with(lines[idx], StigmaStringParsingLib.BEGINS_WITH_DOT_METHOD):  # This is the start of a method defintion
                 #print(str(match_object) + " in line: " + lines[idx])
                 method_code = []
 
-                match_object = re.match(StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD, lines[idx])
-                while match_object is None:
+                end_of_method = StigmaStringParsingLib.begins_with(lines[idx], StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD)
+                while not end_of_method:
                     #print(str(idx))
                     method_code.append(lines[idx])
-                    match_object = re.match(StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD, lines[idx])
+                    end_of_method = StigmaStringParsingLib.begins_with(lines[idx], StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD)
                     idx += 1
 
-                #print(str(match_object) + " in line: " + lines[idx])
-                smd = SmaliMethodDef(method_code, self)
-                self.methods.append(smd)
+                parts.append(method_code)
             
             #if all file is eaten up (eating last method)
             if idx >= len(lines):
                 #print("stopping!")
                 break
                 
-            if "# static fields\n" == lines[idx]:
-                cur_dest = self.static_fields
-
-            if "# instance fields\n" == lines[idx]:
-                cur_dest = self.instance_fields
-
-            if "# direct methods\n" == lines[idx]:
-                pre_methods = False
-
-            if pre_methods:
-                cur_dest.append(lines[idx])
-            #debugging left in
-            #print("\n")
-            #print(lines)
-            #print("len(lines): " + str(len(lines)))
-            #
-            #print("idx: " + str(idx))
+            parts.append(lines[idx])
             idx = idx + 1
-            
+        return parts
+        
+        
+    def _make_method(self, part):
+        # part: a list of lines or the (start, end) of a method in self.mapped_file
+        # methods that no handler will touch are not parsed (and not
+        # grown) at all, see VerbatimMethodDef
+        if isinstance(part, list):
+            if SmaliMethodDef.needs_instrumentation(part):
+                return SmaliMethodDef(part, self)
+            return VerbatimMethodDef(part, self)
+
+        start, end = part
+        if SmaliMethodDef.needs_instrumentation_in(self.mapped_file.data, start, end):
+            return SmaliMethodDef(self.mapped_file.get_lines(start, end), self)
+        return VerbatimMethodDef(None, self, self.mapped_file, start, end)
+        
         
     @staticmethod
     def extract_class_name(filename):
-        fh = open(filename, 'r')
-        line = fh.readline()
-        return line.split()[-1].strip("\n")
+        # only reads the first line (.class directive) of the file
+        with open(filename, 'r') as fh:
+            line = fh.readline()
+        return SmaliClassDef.class_name_from_line(line)
+        
+    @staticmethod
+    def class_name_from_line(class_directive_line):
+        return class_directive_line.split()[-1].strip("\n")
     
     @staticmethod
     def is_function(line):
@@ -209,24 +265,37 @@ class SmaliClassDef:
 
         #this will signup our methods for instrumentation with their related opcodes
         for m in self.methods:
-            if(m.signature.is_abstract == False):           
+            if(not m.verbatim and m.signature.is_abstract == False):           
                 m.instrument()
 
 
     def write_to_file(self, class_smali_file):
         # Write new "program" out to file
-        fh = open(class_smali_file, "w")
-
-        for line in self.header + self.static_fields + self.instance_fields:
-            fh.write(line)
-
-        fh.write("# methods\n")
+        # one write, and the file is replaced atomically (see ClassFileIO)
+        if self.mapped_file is None:
+            ClassFileIO.write_class_file(class_smali_file, self.get_text())
+        else:
+            ClassFileIO.write_class_chunks(class_smali_file, self.get_chunks())
+        
+        
+    def get_text(self):
+        # The text that write_to_file() writes, as a single string
+        return "".join(part if isinstance(part, str) else str(part, "utf-8") for part in self.get_chunks())
+        
+        
+    def get_chunks(self):
+        # The text that write_to_file() writes, as a list of str and, for
+        # the untouched methods of a mapped file, memoryview (bytes) parts
+        parts = self.header + self.static_fields + self.instance_fields
+        parts.append("# methods\n")
         for m in self.methods:
-            for line in m.raw_text:
-                fh.write(str(line))  # because we're converting to str, SmaliAssemblyInstruction object's repr() called
-            fh.write("\n")
-
-        fh.close()
+            view = m.get_view() if m.verbatim else None
+            if view is not None:
+                parts.append(view)
+            else:
+                parts.append("".join(map(str, m.raw_text)))
+            parts.append("\n")
+        return parts
         
         
     def overwrite_to_file(self):
@@ -266,28 +335,76 @@ class SmaliClassDef:
         return len(self.methods)
 
 
-    def _count_references(self, filter_function):
+    def _count_references(self, attribute):
         # this should be computed here and not computed else-where 
         # and cached.  The reasoning is because the number of field
-        # references changes drastically after the instrumentation
+        # references changes drastically after the instrumentation.
+        # The references of each method are kept by its MethodAnalysis
+        # (patched while the method is instrumented), untouched mapped
+        # methods count them from their bytes
         ref_set = set()
         for m in self.methods:
-            for line in m.raw_text:
-                if filter_function(line):
-                    name = StigmaStringParsingLib.break_into_tokens(line)[-1]
-                    ref_set.add(name)
-        #print(field_ref_set)
+            ref_set.update(getattr(m.get_reference_counts(), attribute))
         return len(ref_set)
         
 
     def get_num_field_references(self):
-        return self._count_references(StigmaStringParsingLib.is_field_instruction)
+        return self._count_references("field_references")
 
         
     def get_num_method_references(self):
-        return self._count_references(StigmaStringParsingLib.is_method_call_instruction)
-                    
-                
+        return self._count_references("method_references")
+        
+        
+    def get_constant_pool_counts(self):
+        # (fields, methods) as counted by Stigma.splitSmali() 
+        # should be called after instrumentation
+        field_num = self.get_num_field_declarations() + self.get_num_field_references()
+        method_num = self.get_num_method_declarations() + self.get_num_method_references()
+        return (field_num, method_num)
+
+    @staticmethod
+    def count_constant_pools(lines):
+        # same (fields, methods) as get_constant_pool_counts() but from
+        # a single pass over the lines, without building a SmaliClassDef
+        # (for classes stigma did not instrument, see Stigma.splitSmali())
+        # the loop mirrors the parsing loop in _split_methods() and __init__()
+        field_declarations = 0
+        method_declarations = 0
+        field_refs = set()
+        method_refs = set()
+        in_fields = False
+        pre_methods = True
+        idx = 0
+        while idx < len(lines):
+            if StigmaStringParsingLib.begins_with(lines[idx], StigmaStringParsingLib.BEGINS_WITH_DOT_METHOD):
+                method_declarations += 1
+                end_of_method = False
+                while not end_of_method and idx < len(lines):
+                    line = lines[idx]
+                    if StigmaStringParsingLib.is_field_instruction(line):
+                        field_refs.add(StigmaStringParsingLib.lex_line(line).tokens[-1])
+                    if StigmaStringParsingLib.is_method_call_instruction(line):
+                        method_refs.add(StigmaStringParsingLib.lex_line(line).tokens[-1])
+                    end_of_method = StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD)
+                    idx += 1
+
+            if idx >= len(lines):
+                break
+
+            if "# static fields\n" == lines[idx] or "# instance fields\n" == lines[idx]:
+                in_fields = True
+
+            if "# direct methods\n" == lines[idx]:
+                pre_methods = False
+
+            if pre_methods and in_fields and re.search(r"^\s*.field", lines[idx]) is not None:
+                field_declarations += 1
+            idx = idx + 1
+
+        return (field_declarations + len(field_refs), method_declarations + len(method_refs))
+
+
     @staticmethod
     def _count_fields(fieldsList):
         regexBeginsWithField = r"^\s*.field"
@@ -308,13 +425,29 @@ class SmaliClassDef:
         #print("\nis_internal_class(" + str(other_class_name) + ")")
         #print("self.class_name:" + str(self.class_name))
         # print("self.internal_class_names:", self.internal_class_names)
-        if other_class_name in self.internal_class_names:
+        if other_class_name in self.shared_internal_class_names or other_class_name in self.internal_class_names:
             #print("\tTRUE!")
+            self.internal_class_queries[other_class_name] = True
             return True
         
         #print("\tFALSE!")
+        self.internal_class_queries[other_class_name] = False
         return False
         
+    def release(self):
+        # drops the parsed class (the methods refer back to the class, so
+        # without this the whole model waits for the cyclic garbage collector)
+        # only file_name and class_name are left
+        for m in self.methods:
+            m.release()
+        self.methods = []
+        self.header = []
+        self.static_fields = []
+        self.instance_fields = []
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
+        
     def __str__(self):
         return str(self.file_name)
         
@@ -331,12 +464,14 @@ class MockSmaliClassDef(SmaliClassDef):
         self.class_name = "LMockClass;"
         
         self.internal_class_names = [self.class_name]
+        self.internal_class_queries = {}
         
         self.header = []
         self.static_fields = []
         self.instance_fields = []
         
         self.methods = []
+        self.mapped_file = None
         
     def is_internal_class(self, other):
         return False
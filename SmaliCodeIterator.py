@@ -76,7 +76,7 @@ class SmaliCodeIterator():
 			next_line_as_string = str(next_line)
 			#middle = []
 			while(not StigmaStringParsingLib.is_valid_instruction(next_line_as_string) \
-			and re.search(StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT, next_line_as_string) is None): # and start < len(text)):
+			and not StigmaStringParsingLib.begins_with(next_line_as_string, StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT)): # and start < len(text)):
 				
 				unit.append(next_line)
 				self.iter_idx += 1
@@ -86,7 +86,7 @@ class SmaliCodeIterator():
 				next_line = self.raw_text[self.iter_idx]
 				next_line_as_string = str(next_line)
 
-			if(re.search(StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT, next_line_as_string) is not None):
+			if(StigmaStringParsingLib.begins_with(next_line_as_string, StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT)):
 				unit.append(next_line)
 			else:
 				self.iter_idx -= 1
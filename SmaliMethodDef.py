@@ -1,17 +1,22 @@
 import re
+import time
 
 import SmaliTypes
 import SmaliAssemblyInstructions as smali
 import StigmaStringParsingLib
 import Instrumenter
+import StigmaMetrics
 
 from SmaliRegister import SmaliRegister
 from ControlFlowGraph import ControlFlowGraph
+from MethodAnalysis import MethodAnalysis, ByteAnalysis
 from TypeSafetyChecker import TypeSafetyChecker
 from SafeRegisterCollection import SafeRegisterCollection
 from SmaliCodeIterator import SmaliCodeIterator
 
 import inspect
+
+metrics = StigmaMetrics.StigmaMetrics.get_instance()
 		
 class SmaliMethodSignature:
 
@@ -157,6 +162,9 @@ class SmaliMethodSignature:
 
 class SmaliMethodDef:
 
+	# see VerbatimMethodDef
+	verbatim = False
+
 	def __init__(self, text, scd):
 		# text should be a list of strings (lines)
 		# starting from ".method..." and ending in "... .end method"
@@ -181,6 +189,8 @@ class SmaliMethodDef:
 		self.reg_number_float = self.ORIGINAL_LOCAL_NUMBER_REGS
 		
 		self.instrumented_code = [] #this is a list containing new instrumented code
+		self.analysis = None # MethodAnalysis of raw_text, see get_analysis()
+		self.instrumented_analysis = None # MethodAnalysis of instrumented_code
 		
 		self.moves_before = []
 		self.moves_after = []
@@ -196,6 +206,28 @@ class SmaliMethodDef:
 		self.first_new_free_reg_num = 0  
 		
 		
+	@staticmethod
+	def needs_instrumentation(text):
+		# A quick scan of the lines of a method (before it is parsed).
+		# False if instrument() would not change the method because none
+		# of its opcodes has a handler in Instrumenter.instrumentation_map
+		# (so the plugins must sign up before the classes are parsed).
+		# The start of method handler is not considered: it exists for
+		# the parameter moves written by grow_locals(), and a method
+		# without handlers is not grown (see VerbatimMethodDef)
+		for line in text:
+			tokens = line.split(None, 1)
+			if tokens and tokens[0] in Instrumenter.instrumentation_map:
+				return True
+		return False
+
+	@staticmethod
+	def needs_instrumentation_in(buffer, start, end):
+		# needs_instrumentation() for a method that is still bytes,
+		# buffer[start:end] (e.g., of a ClassFileIO.MappedClassFile)
+		return _get_opcode_pattern().search(buffer, start, end) is not None
+
+
 	def get_register_meta_data(self):
 		num_locals = self.get_locals_directive_num()
 		num_params = self.signature.num_of_parameter_registers
@@ -429,25 +461,22 @@ class SmaliMethodDef:
 		
 
 	def get_num_comparison_instructions(self):
-		count = 0
-		
-		# this could be improved in two ways
-		#   1) we could cache the value of count, but that would require
-		#      cache invalidation
-		#   2) we could join the strings in the list raw_text into
-		#      one large string and use the regular expression matching
-		#      to find _ALL_ matches in one call.
-		#      The challenge with this approach is that comments and 
-		#      other extraneous text might contain "if-eqz" and others 
-		#      by coincidnence
-		for cur_line in self.raw_text:
-		
-			search_object = re.search(StigmaStringParsingLib.BEGINS_WITH_IF, cur_line)
-			search_object2 = re.search(StigmaStringParsingLib.BEGINS_WITH_CMP, cur_line)
-			if (search_object is not None) or (search_object2 is not None):
-				# of course the line can't be both an if and a cmp
-				count = count + 1
-		return count
+		# counted once by the MethodAnalysis and kept up to date
+		# when lines are embedded
+		return self.get_reference_counts().num_comparisons
+
+
+	def get_analysis(self):
+		# the MethodAnalysis of raw_text, built the first time it is asked for
+		if self.analysis is None:
+			self.analysis = MethodAnalysis(self.raw_text)
+		return self.analysis
+
+
+	def get_reference_counts(self):
+		# num_comparisons, field_references and method_references
+		# (only these, see VerbatimMethodDef)
+		return self.get_analysis()
 
 	
 
@@ -483,15 +512,21 @@ class SmaliMethodDef:
 		
 		
 	def embed_line(self, position, line):
+		if self.analysis is not None:
+			self.analysis.insert(position, [line])
 		self.raw_text.insert(position, line)
 
 
 	def embed_block_with_replace(self, position, block):
+		if self.analysis is not None:
+			self.analysis.replace(position, self.raw_text[position], block)
 		self.raw_text = self.raw_text[:position] + block + self.raw_text[position + 1:]
 
 
 	def embed_block(self, position, block):
 		# put the code in this block just before the position
+		if self.analysis is not None:
+			self.analysis.insert(position, block)
 		self.raw_text = self.raw_text[:position] + block + self.raw_text[position:]
 
 				
@@ -507,7 +542,9 @@ class SmaliMethodDef:
 		# insert the lines at the beginning
 		method_beginning_instrumentation_method = Instrumenter.start_of_method_handler
 		if(method_beginning_instrumentation_method is not None):
+			start_time = time.perf_counter()
 			result_block = method_beginning_instrumentation_method(self.scd, self)
+			metrics.add_handler_call("<method start>", method_beginning_instrumentation_method, time.perf_counter() - start_time)
 			insert_idx = self.find_first_valid_instruction()
 			#print("'METHOD START'  insert idx:", insert_idx, "  line:", self.raw_text[insert_idx])
 			self.embed_block(insert_idx, result_block)
@@ -515,64 +552,58 @@ class SmaliMethodDef:
 
 		#create the control flow graph for the method text and pass it to the type safety checker
 		#this will check and track types of each register on each line 
-		self.cfg = ControlFlowGraph(self.raw_text) # maybe needs to be NOT self?
-		self.tsc = TypeSafetyChecker(self.signature, self.cfg) 
+		with metrics.stage("cfg"):
+			self.cfg = self.get_analysis().get_cfg(self.raw_text)
+		with metrics.stage("type_checking"):
+			self.tsc = TypeSafetyChecker(self.signature, self.cfg) 
 		
 		#incase the graph is empty, we dont instrument
-		if(len(self.cfg.G)) == 1:
+		if(len(self.cfg)) == 1:
 			return
 			
 		
-		# start walking the graph at node 1 and go in ascending order
-		# this counter starts at 1, becuase when we initialize the type safety checker we already updated the types of the signautre line so we dont do it again
-		# as the signature line never shows up in our walk of the graph, we add it to our new instrumented code here
-		counter = 1
-		self.instrumented_code.append(self.raw_text[0])
+		# type check the graph until the types settle (see TypeSafetyChecker.solve()), so a block is
+		# type checked after the blocks that lead to it and again if one jumping back to it changes, then
+		# instrument the blocks in ascending order (the order of the code).  Node 0 was already visited
+		# when we initialized the type safety checker (it updated the types of the signature line), as the
+		# signature line never shows up in our walk of the graph, we add it to our new instrumented code here
+		self.instrumented_analysis = MethodAnalysis()
+		self._emit([self.raw_text[0]])
 		
 		#print("class:", self.scd, " method:", self)
 		#print("\t", self.get_register_meta_data())
 		#self.cfg.show()
 		#input("continue?")
 		
-		while(self.cfg.nodes_left_to_visit()):
+		# the code units of every block (but node 0)
+		block_units = [None] + [list(SmaliCodeIterator(node["text"])) for node in self.cfg.blocks[1:]]
+		with metrics.stage("type_checking"):
+			self.tsc.solve(block_units)
+		
+		for counter in range(1, len(self.cfg)):
 			node = self.cfg[counter]
-			#print("\nprocessing counter: ", counter)
-			#print("body: ", node["text"])
-
-			if(not node["visited"]):
-				node["visited"] = True 
-				
-				smali_code_iterator = SmaliCodeIterator(node["text"])
-				is_first_line = True
-				for unit in smali_code_iterator:
-					#print("\nclass:", self.scd, " method:", self)
-					#print("unit:", unit)
-					self.tsc.type_update(unit, is_first_line, counter)
-					#print("map after update:", self.tsc.node_type_list[-1])
-					self._do_instrumentation_plugins(node, unit, self.tsc.most_recent_type_map)
-					is_first_line = False
-					
-				#call type_update on each line of code inside the node. 
-				#for index in range(len(node["text"])):
-				#	line = node["text"][index]        
-					#print(type(line), ": " + str(line))         
-				#	self.tsc.type_update(str(line), index, counter)
-				#	node["type_list"] = self.tsc.node_type_list
-				#	self._do_instrumentation_plugins(node, line, index)
-				
-				# store the entire list of type hash-maps into the node
-				#print("storing type_list for node", counter);
-				node["type_list"] = self.tsc.node_type_list
-				self.tsc.node_type_list = []
-						
-			counter+=1  
+			# the type map after each code unit
+			for unit, type_map in zip(block_units[counter], node["type_list"]):
+				#print("\nclass:", self.scd, " method:", self)
+				#print("unit:", unit)
+				#print("map after update:", type_map)
+				self._do_instrumentation_plugins(node, unit, type_map)
 
 		# # assign the newly instrumented code to the orignal raw text of the method, 
 		# # and add the tail from teh cfg, which contains the ending lines of the method
 		# # such as the .end method and the pswitch data and the sswitch data. 
+		# # The analysis of the new code was built while it was emitted
+		self._emit(self.cfg.tail)
 		self.raw_text = self.instrumented_code    
-		self.raw_text.extend(self.cfg.tail)
+		self.analysis = self.instrumented_analysis
+		self.instrumented_analysis = None
 		self._fix_larger_if_offsets()
+
+
+	def _emit(self, lines):
+		# appends lines to the instrumented code
+		self.instrumented_code.extend(lines)
+		self.instrumented_analysis.extend(lines)
 		
 		
 
@@ -584,7 +615,7 @@ class SmaliMethodDef:
 		first_line = code_unit[0]
 		#print("\t_do_instrumentation_plugins(" + str(first_line).lstrip().rstrip() + ")")
 		if not self.is_relevant(first_line, node):
-			self.instrumented_code.extend(code_unit)
+			self._emit(code_unit)
 			return
 		
 		opcode = StigmaStringParsingLib.extract_opcode(first_line)     
@@ -616,7 +647,16 @@ class SmaliMethodDef:
 				new_block = code_unit
 			
 		else:
+			start_time = time.perf_counter()
 			new_block = bundle.handler(self.scd, self, code_unit, regs) # case 1 and 2
+			metrics.add_handler_call(opcode, bundle.handler, time.perf_counter() - start_time)
+			
+			# the handler added nothing (e.g., an invoke of an external method
+			# without a move-result), the registers were freed for nothing
+			num_original = SmaliMethodDef._count_instructions(code_unit) if bundle.handler_reinserts_original_lines else 0
+			if SmaliMethodDef._count_instructions(new_block) <= num_original:
+				self.moves_before = []
+				self.moves_after = []
 		
 		#invoke foo()
 		#move-result vx
@@ -631,12 +671,12 @@ class SmaliMethodDef:
 			#2)Internal Functions, -> new code comes before and after the original lines (invoke,move-result)
 			#3)External Functions, -> new code comes before/after the original line
 		#Note: No valid code can come in between an invoke and a move result!!
-		self.instrumented_code.extend(self.moves_before)
-		self.instrumented_code.extend(new_block)
-		self.instrumented_code.extend(self.moves_after)
+		self._emit(self.moves_before)
+		self._emit(new_block)
+		self._emit(self.moves_after)
 		
 		if(not bundle.handler_reinserts_original_lines): # case 2
-			self.instrumented_code.extend(code_unit)
+			self._emit(code_unit)
 			
 			
 	def _gen_safe_register_collection(self, cur_type_map, code_unit, num_regs_needed):
@@ -687,7 +727,7 @@ class SmaliMethodDef:
 				self.moves_before.append(move_instr(str(dest_reg), str(r)))
 				self.moves_after.append(move_instr(str(r), str(dest_reg)))
 				if(safe_regs.add_reg_if_safe(r)):
-					if(cur_type_map[r] == "64-bit"):
+					if(cur_type_map[r].get_generic_type() == "64-bit"):
 						dest_reg+=2
 						safe_regs.add_reg_if_safe(r + 1)
 					else:
@@ -730,11 +770,19 @@ class SmaliMethodDef:
 		return SafeRegisterCollection(0) # return empty collection
 		
 		
+	@staticmethod
+	def _count_instructions(lines):
+		count = 0
+		for line in lines:
+			if StigmaStringParsingLib.lex_line(str(line)).kind == StigmaStringParsingLib.KIND_INSTRUCTION:
+				count += 1
+		return count
+	
 	@staticmethod
 	def _get_v_regs_from_map(cur_type_map):
 		regs_list = []
 		for reg in cur_type_map.keys():
-			if(reg.letter == "v"):
+			if(reg.letter() == "v"):
 				regs_list.append(reg)
 		return regs_list
 	
@@ -746,15 +794,17 @@ class SmaliMethodDef:
 		#print("second part of wide dest: " + str(dest_reg + 1))
 		if reg in safe_regs:
 			return False
-		if type_map[reg] == "?":
+		# compared by generic type, the type of a long is "J", not "64-bit"
+		generic_type = type_map[reg].get_generic_type()
+		if generic_type == "?":
 			return False
-		if type_map[reg] == "64-bit-2":
+		if generic_type == "64-bit-2":
 			return False
-		if type_map[reg] == "64-bit" and ( (dest_reg + 1) >= self.get_num_registers() ):
+		if generic_type == "64-bit" and ( (dest_reg + 1) >= self.get_num_registers() ):
 			return False
-		if reg[0] == "p":
+		if reg.letter() == "p":
 			return False
-		if int(reg[1:]) >= 16:
+		if reg.number() >= 16:
 			return False
 		if reg in code_unit_regs:
 			# We definitely cannot use registers from the current line 
@@ -810,41 +860,19 @@ class SmaliMethodDef:
 	
 	def _fix_larger_if_offsets(self):
 		table = []
-		label_map = {} #this stores the label and the line number corresponding
+		analysis = self.get_analysis()
 		
-		for idx in range(len(self.raw_text)):
+		#for every if statement or goto statement, find the line number of its label (from the label index of the analysis)
+		for idx in analysis.get_branches():
 			line = str(self.raw_text[idx])
 			tokens = StigmaStringParsingLib.break_into_tokens(line)
+			label = tokens[-1]
 			
-			#store the label of :cond and :goto in a map with their corresponding line number
-			if(re.search(StigmaStringParsingLib.BEGINS_WITH_COND, line) is not None or re.search(StigmaStringParsingLib.BEGINS_WITH_GOTO_LABEL, line) is not None):
-				 label_map[tokens[0]] = idx
-			
-			#when you see an if statement or a goto statement, there are two options
-			elif re.search(StigmaStringParsingLib.BEGINS_WITH_IF, line) is not None or re.search(StigmaStringParsingLib.BEGINS_WITH_GOTO, line) is not None:
-				
-				row = [line, tokens[0], idx]                
-				label = tokens[-1]
-				
-				#1) if the label was already seen, retreive it from existing map and fill all details for the row
-				if label in label_map:
-					label_idx = label_map[label]
-					label_offset = label_idx - idx
-					row.extend([label, label_idx, label_offset])
-					table.append(row)
-				
-				#2) if the label was not seen before, we can safetly loop from the current index to till the end and whenever u see a label fill the row and break the loop
-				else:
-					for label_idx in range(idx, len(self.raw_text)):
-						new_line = str(self.raw_text[label_idx])
-						if re.search(StigmaStringParsingLib.BEGINS_WITH_COLON, new_line) is not None:     
-							label_tokens = StigmaStringParsingLib.break_into_tokens(new_line)
-							if label_tokens[0] == label:
-								label_offset = label_idx-idx
-								row.extend([label, label_idx, label_offset])
-								table.append(row)
-								break
-							
+			#labels before the branch only count if they are :cond or :goto labels
+			label_idx = analysis.find_target(label, idx)
+			if label_idx is not None:
+				label_offset = label_idx - idx
+				table.append([line, tokens[0], idx, label, label_idx, label_offset])
 					
 		#5461 is 1/6th of 32767
 		#This checks for any if statements which have a jump to the label line greater than 5461, because Stigma causes can error
@@ -870,7 +898,7 @@ class SmaliMethodDef:
 
 				old_label = row[3]
 				
-				if(re.search(StigmaStringParsingLib.BEGINS_WITH_GOTO, row[1]) is not None):
+				if(StigmaStringParsingLib.begins_with(row[1], StigmaStringParsingLib.BEGINS_WITH_GOTO)):
 					block.append(new_instr(old_label))
 					block.append(smali.BLANK_LINE())
 					idx_offset += len(block)-1
@@ -894,6 +922,15 @@ class SmaliMethodDef:
 					self.embed_block_with_replace(idx, block)
 					
 	
+	def release(self):
+		# see SmaliClassDef.release()
+		self.scd = None
+		self.cfg = None
+		self.tsc = None
+		self.analysis = None
+		self.raw_text = []
+
+
 	def __repr__(self):
 		return self.get_signature()
 
@@ -915,6 +952,113 @@ class SmaliMethodDef:
 			
 
 
+# (opcodes, compiled pattern) for needs_instrumentation_in(), built again
+# when the plugins sign up for other opcodes
+_opcode_pattern = (None, None)
+
+def _get_opcode_pattern():
+	global _opcode_pattern
+	opcodes, pattern = _opcode_pattern
+	if opcodes != Instrumenter.instrumentation_map.keys():
+		opcodes = frozenset(Instrumenter.instrumentation_map)
+		if len(opcodes) == 0:
+			pattern = re.compile(rb"(?!)") # matches nothing
+		else:
+			alternatives = b"|".join(re.escape(opcode.encode("utf-8")) for opcode in sorted(opcodes))
+			pattern = re.compile(rb"^[ \t]*(?:" + alternatives + rb")(?=\s|$)", re.M)
+		_opcode_pattern = (opcodes, pattern)
+	return pattern
+
+
+
+class VerbatimMethodDef(SmaliMethodDef):
+	# A method that instrumentation leaves alone (see
+	# SmaliMethodDef.needs_instrumentation()).  It is kept as the slice of
+	# lines from the class file: it is not parsed (the signature is only
+	# parsed if someone asks for it), grow_locals() does not add registers
+	# or parameter moves and does not rename the p registers, and the
+	# lines are written back exactly as they were read.
+	#
+	# A method of a ClassFileIO.MappedClassFile (text is None) is not even
+	# decoded until raw_text is asked for, get_view() gives its bytes.
+
+	verbatim = True
+
+	def __init__(self, text, scd, mapped_file=None, start=0, end=0):
+		if(text == [] or (text is None and start == end)):
+			raise ValueError("Attempting to instantiate method with no code!")
+
+		self._raw_text = text
+		self.mapped_file = mapped_file
+		self.start = start
+		self.end = end
+		self.scd = scd
+		self._signature = None
+
+		self.not_enough_free_registers_count = 0
+		self.has_grown = 0
+		self.top_regs = []
+		self.cfg = None
+		self.tsc = None
+		self.analysis = None
+		self.byte_analysis = None # see get_reference_counts()
+
+	@property
+	def signature(self):
+		if self._signature is None:
+			class_name = "Lunknownclass;"
+			if(self.scd != None):
+				class_name = self.scd.class_name
+			if self._raw_text is None:
+				line_end = self.mapped_file.data.find(b"\n", self.start, self.end)
+				first_line = self.mapped_file.get_lines(self.start, self.end if line_end == -1 else line_end + 1)[0]
+			else:
+				first_line = self._raw_text[0]
+			self._signature = SmaliMethodSignature(first_line, class_name)
+		return self._signature
+
+	@property
+	def raw_text(self):
+		if self._raw_text is None:
+			self._raw_text = self.mapped_file.get_lines(self.start, self.end)
+		return self._raw_text
+
+	@raw_text.setter
+	def raw_text(self, text):
+		self._raw_text = text
+		self.mapped_file = None
+		self.analysis = None
+
+	def get_view(self):
+		# the bytes of the method in the mapped file, None if it was decoded
+		if self._raw_text is not None:
+			return None
+		return self.mapped_file.get_view(self.start, self.end)
+
+	def get_reference_counts(self):
+		# counted from the bytes while the method is not decoded
+		if self._raw_text is not None:
+			return self.get_analysis()
+		if self.byte_analysis is None:
+			view = self.get_view()
+			self.byte_analysis = ByteAnalysis(view)
+			view.release()
+		return self.byte_analysis
+
+	def grow_locals(self, n):
+		if(n < 0):
+			raise ValueError("Cannot grow locals by a negative amount: " + str(n))
+		return []
+
+	def instrument(self):
+		return []
+
+	def parse(self):
+		# the full SmaliMethodDef, e.g., to instrument it after all
+		return SmaliMethodDef(self.raw_text, self.scd)
+
+
+
 def tests():
 	print("Testing SmaliMethodDef")
 	
@@ -989,8 +1133,65 @@ def tests():
 	
 	
 	print("\t_move_reg_conditions...")
-	assert(smd._move_reg_conditions("v3", "v0", [], ["v0", "v3", "v13"], {"v0": "32-bit"}) == False)
+	v0, v1, v2, v3, v4, v5, v10, v16, p1 = [SmaliRegister(r) for r in ["v0", "v1", "v2", "v3", "v4", "v5", "v10", "v16", "p1"]]
+	type_map = {v0: SmaliTypes.Int(), v1: SmaliTypes.Int(), v2: SmaliTypes.UnknownType(), 
+		v4: SmaliTypes.Long(), v5: SmaliTypes.Long_2(), v16: SmaliTypes.Int(), p1: SmaliTypes.Int()}
+	assert(smd._move_reg_conditions(v3, v0, [], [v0, v3], type_map) == False)
+	assert(smd._move_reg_conditions(v3, v1, [], [v0, v3], type_map) == True)
+	assert(smd._move_reg_conditions(v3, v1, [v1], [v0, v3], type_map) == False)
+	assert(smd._move_reg_conditions(v3, v2, [], [v0, v3], type_map) == False)
+	assert(smd._move_reg_conditions(v3, v4, [], [v0, v3], type_map) == True)
+	# v10, v11 would be needed for the wide value (11 registers)
+	assert(smd._move_reg_conditions(v10, v4, [], [v0, v3], type_map) == False)
+	assert(smd._move_reg_conditions(v3, v5, [], [v0, v3], type_map) == False)
+	assert(smd._move_reg_conditions(v3, v16, [], [v0, v3], type_map) == False)
+	assert(smd._move_reg_conditions(v3, p1, [], [v0, v3], type_map) == False)
+	assert(SmaliMethodDef._get_v_regs_from_map(type_map) == [v0, v1, v2, v4, v5, v16])
+	
+	
+	
+	print("\tverbatim methods...")
+	saved_map = dict(Instrumenter.instrumentation_map)
+	Instrumenter.instrumentation_map.clear()
+	data = "".join(text).encode("utf-8")
+	try:
+		assert(not SmaliMethodDef.needs_instrumentation(text))
+		assert(not SmaliMethodDef.needs_instrumentation_in(data, 0, len(data)))
+		Instrumenter.instrumentation_map["throw"] = None
+		Instrumenter.instrumentation_map["if-eq"] = None
+		assert(not SmaliMethodDef.needs_instrumentation(text))
+		assert(not SmaliMethodDef.needs_instrumentation_in(data, 0, len(data)))
+		Instrumenter.instrumentation_map["if-eqz"] = None
+		assert(SmaliMethodDef.needs_instrumentation(text))
+		assert(SmaliMethodDef.needs_instrumentation_in(data, 0, len(data)))
+		assert(not SmaliMethodDef.needs_instrumentation_in(data, 0, data.find(b"if-eqz")))
+	finally:
+		Instrumenter.instrumentation_map.clear()
+		Instrumenter.instrumentation_map.update(saved_map)
+
+	text = open("./test/leakPasswd.smali").readlines()
+	vmd = VerbatimMethodDef(list(text), None)
+	assert(vmd.grow_locals(4) == [])
+	assert(vmd.instrument() == [])
+	assert(vmd.raw_text == text)
+	assert(vmd.get_name() == "leakPasswd")
+	assert(vmd.get_num_comparison_instructions() == smd.get_num_comparison_instructions())
+	assert(vmd.parse().get_locals_directive_num() == 9)
+	assert(vmd.get_view() is None)
 	
+	import tempfile, ClassFileIO
+	with tempfile.NamedTemporaryFile("w", suffix=".smali") as fh:
+		fh.write("".join(text))
+		fh.flush()
+		with ClassFileIO.MappedClassFile(fh.name) as mapped:
+			start, end = mapped.method_index[0]
+			vmd = VerbatimMethodDef(None, None, mapped, start, end)
+			assert(vmd.get_name() == "leakPasswd")
+			view = vmd.get_view()
+			assert(bytes(view) == data)
+			view.release()
+			assert(vmd.raw_text == text)
+			assert(vmd.get_view() is None)
 	
 	
 	print("ALL SmaliMethodDef TESTS PASSED!")
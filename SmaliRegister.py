@@ -1,29 +1,74 @@
-
 class SmaliRegister():
 
-	def __init__(self, reg):
+	# Registers are interned (flyweights): SmaliRegister("v2") always
+	# returns the same object, so the type maps, register sets etc. all
+	# over the program share one object per register.  A register never
+	# changes after it is made.
+	#
+	# Every register also has an integer code, number * 2 (+1 for p
+	# registers).
+	# == and hash() are O(1), hash(reg) == hash(str(reg)) so registers
+	# and register names can be used as the same dict key.
+
+	__slots__ = ["_letter", "_number", "_code", "_name", "_hash"]
+
+	# register name (as given, e.g., "v2" but also "v02") => SmaliRegister
+	_interned = {}
+	# code => SmaliRegister
+	_by_code = {}
+
+	def __new__(cls, reg):
+		if(isinstance(reg, SmaliRegister)):
+			return reg
+			
 		if(isinstance(reg, str)):
+			ans = SmaliRegister._interned.get(reg)
+			if ans is not None:
+				return ans
+				
 			letter = reg[0]
 			number = int(reg[1:])
 			
 			if(letter != "v" and letter != "p"):
 				SmaliRegister._raise_invalid_exception(reg)
-				
-			self._letter = letter
-			self._number = number
-			
-		elif(isinstance(reg, SmaliRegister)):
-			self._letter = reg._letter
-			self._number = reg._number
-			
-		else:
-			SmaliRegister._raise_invalid_exception(reg)
 			
+			ans = SmaliRegister._from_code(number * 2 + (letter == "p"))
+			SmaliRegister._interned[reg] = ans
+			return ans
 			
+		SmaliRegister._raise_invalid_exception(reg)
+		
+		
+	@staticmethod
+	def _from_code(code):
+		ans = SmaliRegister._by_code.get(code)
+		if ans is None:
+			ans = object.__new__(SmaliRegister)
+			ans._letter = "p" if code & 1 else "v"
+			ans._number = code >> 1
+			ans._code = code
+			ans._name = ans._letter + str(ans._number)
+			ans._hash = hash(ans._name)
+			SmaliRegister._by_code[code] = ans
+			SmaliRegister._interned[ans._name] = ans
+		return ans
+		
+		
+	@staticmethod
+	def from_code(code):
+		# 6 => v3, 7 => p3
+		return SmaliRegister._from_code(code)
+		
+		
 	@staticmethod
 	def from_components(letter, number):
-		s = str(letter) + str(number)
-		return SmaliRegister(s)
+		if(letter != "v" and letter != "p"):
+			SmaliRegister._raise_invalid_exception(str(letter) + str(number))
+		return SmaliRegister._from_code(int(number) * 2 + (letter == "p"))
+		
+	
+	def code(self):
+		return self._code
 		
 	
 	def letter(self):
@@ -34,7 +79,7 @@ class SmaliRegister():
 		
 		
 	def __str__(self):
-		return self._letter + str(self._number)
+		return self._name
 		
 		
 	def __repr__(self):
@@ -43,23 +88,22 @@ class SmaliRegister():
 		
 	def __add__(self, other):
 		if(isinstance(other, int)):
-			new_number = other + self._number
-			return SmaliRegister(self._letter + str(new_number))
+			return SmaliRegister._from_code(self._code + other * 2)
 		raise ValueError("Invalid addition:", self, "+", other)
 		
 		
 	def __eq__(self, other):
 		if(isinstance(other, SmaliRegister)):
-			return self._letter == other._letter and self._number == other._number
+			return self._code == other._code
 		elif(isinstance(other, str)):
-			return str(self) == other
+			return self._name == other
 		else:
 			raise ValueError("Invalid == operation:", self, "==", other)
 			
 			
 	def __ge__(self, other):
 		if(isinstance(other, SmaliRegister)):
-			if(self.letter != "v"):
+			if(self._letter != "v"):
 				raise ValueError("Comparison cannot be made: ", self, ">=", other)
 			return (self._number >= other._number)
 			
@@ -82,7 +126,12 @@ class SmaliRegister():
 		
 	
 	def __hash__(self):
-		return hash(str(self))
+		return self._hash
+		
+		
+	def __reduce__(self):
+		# (for pickle and copy) there is no empty constructor
+		return (SmaliRegister, (self._name,))
 		
 		
 	def is_high_numbered(self):
@@ -149,6 +198,23 @@ def tests():
 	assert(hash(sr18) == hash("v18"))
 	
 	
+	print("\ttesting interning...")
+	assert(SmaliRegister("v18") is sr18)
+	assert(SmaliRegister(sr18) is sr18)
+	assert(sr18 + 1 is SmaliRegister("v19"))
+	assert(SmaliRegister.from_components("p", 3) is SmaliRegister("p3"))
+	assert(SmaliRegister("v02") is sr)
+	assert(str(SmaliRegister("v02")) == "v2")
+	assert(SmaliRegister("p3").code() == 7)
+	assert(SmaliRegister.from_code(6) == "v3")
+	assert(SmaliRegister("v0") + -1 == "v-1")
+	assert(SmaliRegister("v0") + -1 + 1 is SmaliRegister("v0"))
+	assert({sr18: 1}["v18"] == 1)
+	
+	import pickle
+	assert(pickle.loads(pickle.dumps(sr18)) is sr18)
+	
+	
 	print("ALL SmaliRegister TESTS PASSED!")
 	
 
@@ -3,14 +3,43 @@ import SmaliAssemblyInstructions
 
 
 
+# Types are interned (flyweights): Int(), from_string("I") etc. always
+# return the same object and ObjectReference("Ljava/lang/String;") (or
+# from_string("Ljava/lang/String;")) one object per descriptor, so the
+# type maps of the TypeSafetyChecker share them instead of making new
+# ones for every instruction and every merge.  A type never changes after
+# it is made.
+#
+# Every type also has an integer code, its place in the type lattice:
+# the lowest GENERIC_BITS are its generic type (GENERIC_*, what
+# get_generic_type() names) and for objects and arrays the bits above
+# number the descriptor.  Types which are == have the same code (all the
+# 32-bit types are ==, objects are == if their descriptors are), so
+# comparing and joining types (join()) are int operations.
+
+GENERIC_UNKNOWN = 0
+GENERIC_32_BIT = 1
+GENERIC_64_BIT = 2
+GENERIC_64_BIT_2 = 3
+GENERIC_OBJECT = 4
+
+GENERIC_BITS = 3
+GENERIC_MASK = (1 << GENERIC_BITS) - 1
+
+# GENERIC_* => get_generic_type()
+GENERIC_NAMES = ["?", "32-bit", "64-bit", "64-bit-2", "object"]
+
+# raw type string => SmaliType, the ones from_string() parsed before
+_parsed = {}
+
+
 def from_string(raw_type_string):
-	constructor_map = {"32-bit": ThirtyTwoBit, "Z": Boolean, "B": Byte,
-		"S": Short, "C": Char, "I": Int, "F": Float, 
-		"64-bit": SixtyFourBit, "64-bit-2": SixtyFourBit_2, 
-		"J": Long, "D": Double, "J2": Long_2, "D2": Double_2}
+	obj = _parsed.get(raw_type_string)
+	if obj is not None:
+		return obj
 		
-	if raw_type_string in constructor_map:
-		obj = constructor_map[raw_type_string]()
+	if raw_type_string in _constructor_map:
+		obj = _constructor_map[raw_type_string]()
 	
 	elif raw_type_string[0] == "[":
 		obj = Array(raw_type_string)
@@ -24,73 +53,98 @@ def from_string(raw_type_string):
 	else:
 		raise Exception("Invalid type string: " + str(raw_type_string))
 		
+	_parsed[raw_type_string] = obj
 	return obj
+	
+	
+def join(type1, type2):
+	# the type of a register where two paths with these types meet, the
+	# type they agree on, otherwise unknown
+	if type1.code == type2.code:
+		return type1
+	return UnknownType()
+	
+	
 
 class SmaliType:
+
+	# (class, raw type string or None) => SmaliType
+	_interned = {}
+	# raw type string of an object or array => code
+	_descriptor_codes = {}
+	
+	def __new__(cls):
+		return SmaliType._intern(cls, None)
+		
+	@staticmethod
+	def _intern(cls, raw_type_string):
+		key = (cls, raw_type_string)
+		ans = SmaliType._interned.get(key)
+		if ans is None:
+			ans = object.__new__(cls)
+			if raw_type_string is not None:
+				ans.raw_type_string = raw_type_string
+				code = SmaliType._descriptor_codes.get(raw_type_string)
+				if code is None:
+					code = ((len(SmaliType._descriptor_codes) + 1) << GENERIC_BITS) | GENERIC_OBJECT
+					SmaliType._descriptor_codes[raw_type_string] = code
+				ans.code = code
+			SmaliType._interned[key] = ans
+		return ans
+		
+	def __reduce__(self):
+		# (for pickle and copy) there is no empty constructor
+		return (type(self), ())
 	
 	def get_move_instr(self):
 		return self.move_instr
 		
+	def get_generic_type(self):
+		# it can be called on ANY "SmaliType" object
+		# which is convenient to figure out the generic type
+		return GENERIC_NAMES[self.code & GENERIC_MASK]
+		
+	def __eq__(self, other):
+		if(isinstance(other, SmaliType)):
+			return self.code == other.code
+			
+		if(isinstance(other, str)):
+			# maybe instead do this:
+			# return other == self.get_generic_type()
+			return other == str(self)
+			
+		return False
+		
 	def __repr__(self):
 		return str(self)
 		
 		
 		
 class UnknownType(SmaliType):
-	def __init__(self):
-		self.raw_type_string = "?"
-		self.specificity_level = 0
+	raw_type_string = "?"
+	specificity_level = 0
+	code = GENERIC_UNKNOWN
 	
 	def __str__(self):
 		return self.raw_type_string
 		
-	def __eq__(self, other):
-		if(isinstance(other, str)):
-			return other == self.raw_type_string
-			
-		if(isinstance(other, UnknownType)):
-			return True
-			
-		return False
-		
-	def get_generic_type(self):
-		# the children inherit this method
-		# it can be called on ANY "SmaliType" object
-		# which is convenient to figure out the generic type
-		return "?"
-		
 	def unwrap_layer(self):
 		return UnknownType()
 		
 		
 		
 class ThirtyTwoBit(SmaliType):
-	def __init__(self):
-		self.move_instr = SmaliAssemblyInstructions.MOVE_16
-		self.specificity_level = 2
+	specificity_level = 2
+	code = GENERIC_32_BIT
+	
+	# not a class attribute, SmaliAssemblyInstructions imports this module
+	@property
+	def move_instr(self):
+		return SmaliAssemblyInstructions.MOVE_16
 	
 	def __str__(self):
 		return "32-bit"
 		
-	def __eq__(self, other):
-		if(isinstance(other, str)):
-			# maybe instead do this:
-			# return other == self.get_generic_type()
-			#print("comparing" + other + "  and " + str(self))
-			return other == str(self)
-			
-		if(isinstance(other, ThirtyTwoBit)):
-			# I'm not sure about this!
-			return True
-			
-		return False
-		
-	def get_generic_type(self):
-		# the children inherit this method
-		# it can be called on ANY "SmaliType" object
-		# which is convenient to figure out the generic type
-		return "32-bit"
-		
 		
 class Boolean(ThirtyTwoBit):
 	def __str__(self):
@@ -121,30 +175,16 @@ class Float(ThirtyTwoBit):
 		
 class SixtyFourBit(SmaliType):
 	# A.K.A. "wide"
-	def __init__(self):
-		self.move_instr = SmaliAssemblyInstructions.MOVE_WIDE_16
-		self.specificity_level = 2
+	specificity_level = 2
+	code = GENERIC_64_BIT
+	
+	@property
+	def move_instr(self):
+		return SmaliAssemblyInstructions.MOVE_WIDE_16
 		
 	def __str__(self):
 		return "64-bit"
 		
-	def __eq__(self, other):
-		if(isinstance(other, str)):
-			# maybe instead do this:
-			# return other == self.get_generic_type()
-			return other == str(self)
-			
-		if(isinstance(other, SixtyFourBit)):
-			return True
-			
-		return False
-	
-	def get_generic_type(self):
-		# the children inherit this method
-		# it can be called on ANY "SmaliType" object
-		# which is convenient to figure out the generic type
-		return "64-bit"
-		
 class Long(SixtyFourBit):
 	def __str__(self):
 		return "J"
@@ -156,30 +196,15 @@ class Double(SixtyFourBit):
 		
 		
 class SixtyFourBit_2(SmaliType):
-	def __init__(self):
-		self.move_instr = None
-		self.specificity_level = 2
+	move_instr = None
+	specificity_level = 2
+	code = GENERIC_64_BIT_2
 		
 	def __str__(self):
 		return "64-bit-2"
 		
-	def __eq__(self, other):
-		if(isinstance(other, str)):
-			# maybe instead do this:
-			# return other == self.get_generic_type()
-			return other == str(self)
-			
-		if(isinstance(other, SixtyFourBit_2)):
-			return True
-	
-	def get_generic_type(self):
-		# the children inherit this method
-		# it can be called on ANY "SmaliType" object
-		# which is convenient to figure out the generic type
-		return "64-bit-2"
-		
 	def get_move_instr(self):
-		raise Exception("No valid move instruction for 64-bit-2: " + str(raw_line_string))
+		raise Exception("No valid move instruction for 64-bit-2: " + str(self))
 	
 class Long_2(SixtyFourBit_2):
 	def __str__(self):
@@ -193,41 +218,37 @@ class Double_2(SixtyFourBit_2):
 		
 
 class ObjectReference(SmaliType):
-	def __init__(self, new_raw_type_string):
-		self.specificity_level = 2
-		self.move_instr = SmaliAssemblyInstructions.MOVE_OBJECT_16
-		
+	specificity_level = 2
+	
+	@property
+	def move_instr(self):
+		return SmaliAssemblyInstructions.MOVE_OBJECT_16
+	
+	def __new__(cls, new_raw_type_string):
+		ans = SmaliType._interned.get((cls, new_raw_type_string))
+		if ans is not None:
+			return ans
+			
 		if(new_raw_type_string[0] != "[" and new_raw_type_string[0] != "L" and new_raw_type_string != "?"):
 			raise Exception("Invalid specification of object: " + str(new_raw_type_string))
 		
 		if("->" in new_raw_type_string):
 			raise Exception("Invalid specification of object: " + str(new_raw_type_string))
 			
-		self.raw_type_string = new_raw_type_string
+		return SmaliType._intern(cls, new_raw_type_string)
+		
+	def __reduce__(self):
+		return (type(self), (self.raw_type_string,))
 		
 	def __str__(self):
 		return self.raw_type_string
 		
-	def __eq__(self, other):
-		if(isinstance(other, str)):
-			# maybe instead do this:
-			# return other == self.get_generic_type()
-			return other == str(self)
-		if(isinstance(other, ObjectReference)):
-			return str(other) == str(self)
-		
-	def get_generic_type(self):
-		# the children inherit this method
-		# it can be called on ANY "SmaliType" object
-		# which is convenient to figure out the generic type
-		return "object"
-		
 
 class NonSpecificObjectReference(ObjectReference):
-	def __init__(self):
-		self.move_instr = SmaliAssemblyInstructions.MOVE_OBJECT_16
-		self.raw_type_string = "Non Specific Object"
-		self.specificity_level = 1
+	specificity_level = 1
+	
+	def __new__(cls, new_raw_type_string="Non Specific Object"):
+		return SmaliType._intern(cls, new_raw_type_string)
 		
 		
 class Array(ObjectReference):
@@ -263,13 +284,20 @@ class Array(ObjectReference):
 		
 		
 class NonSpecificArray(ObjectReference):
-	def __init__(self):
-		self.move_instr = SmaliAssemblyInstructions.MOVE_OBJECT_16
-		self.raw_type_string = "Non Specific Array"
-		self.specificity_level = 1
+	specificity_level = 1
+	
+	def __new__(cls, new_raw_type_string="Non Specific Array"):
+		return SmaliType._intern(cls, new_raw_type_string)
 		
 	def unwrap_layer(self):
 		return UnknownType()
+		
+		
+		
+_constructor_map = {"32-bit": ThirtyTwoBit, "Z": Boolean, "B": Byte,
+	"S": Short, "C": Char, "I": Int, "F": Float, 
+	"64-bit": SixtyFourBit, "64-bit-2": SixtyFourBit_2, 
+	"J": Long, "D": Double, "J2": Long_2, "D2": Double_2}
 
 
 def main():
@@ -335,6 +363,50 @@ def main():
 	assert(obj == obj2)
 	assert(obj == "Ljava/lang/String;")
 	
+	
+	print("\ttesting interning...")
+	assert(Int() is from_string("I"))
+	assert(UnknownType() is from_string("?"))
+	assert(obj is obj2 and arr2 is Array("[[I"))
+	assert(arr2.unwrap_layer() is from_string("[I"))
+	assert(Array("[[I") is from_string("[[I"))
+	assert(NonSpecificObjectReference() is NonSpecificObjectReference())
+	assert(ObjectReference("[I") is not Array("[I"))
+	try:
+		ObjectReference("Ljava/lang/String;->length()I")
+		assert(False)
+	except Exception as e:
+		assert("Invalid specification" in str(e))
+		
+	import pickle
+	assert(pickle.loads(pickle.dumps(obj)) is obj)
+	assert(pickle.loads(pickle.dumps(Long_2())) is Long_2())
+	assert(pickle.loads(pickle.dumps(NonSpecificArray())) is NonSpecificArray())
+	
+	
+	print("\ttesting the lattice...")
+	# == is the same code
+	assert(Int().code == Float().code == ThirtyTwoBit().code)
+	assert(Int() == Float() and Long() == Double() and Long_2() == Double_2())
+	assert(ObjectReference("[I") == Array("[I"))
+	assert(ObjectReference("[I").code == Array("[I").code)
+	assert(obj != NonSpecificObjectReference() and obj != Array("[I"))
+	assert(Int() != Long() and Long() != Long_2() and Int() != UnknownType())
+	assert(ObjectReference("?") != UnknownType())
+	
+	for t in [UnknownType(), Int(), Long(), Double_2(), obj, arr, NonSpecificArray()]:
+		assert(GENERIC_NAMES[t.code & GENERIC_MASK] == t.get_generic_type())
+	assert(Boolean().get_generic_type() == "32-bit")
+	assert(Long_2().get_generic_type() == "64-bit-2")
+	assert(arr.get_generic_type() == "object")
+	assert(NonSpecificObjectReference().get_generic_type() == "object")
+	
+	assert(join(Int(), Float()) is Int())
+	assert(join(obj, from_string("Ljava/lang/String;")) is obj)
+	assert(join(obj, NonSpecificObjectReference()) is UnknownType())
+	assert(join(Long(), Long_2()) is UnknownType())
+	assert(join(UnknownType(), UnknownType()) is UnknownType())
+	
 	print("ALL SmaliType TESTS PASSED!")
 
 
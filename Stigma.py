@@ -10,35 +10,127 @@ import tempfile
 
 import SmaliClassDef
 import Instrumenter
+import InstrumentationWorker
+import ClassFileIO
+import InstrumentedClassCache
+import DecodedApkCache
+import PackageFilter
+import StigmaMetrics
 import TaintStorageHandler
 import TaintTrackingInstrumentationPlugin
+from StringPool import StringPool
 
 # https://docs.python.org/3/library/tempfile.html
 temp_file = tempfile.TemporaryDirectory(prefix="apkOutput_")
 
+# key: path of a smali file, value: (fields, methods) counted
+# while the file was instrumented / written, used by splitSmali()
+constant_pool_counts = {}
+
+metrics = StigmaMetrics.StigmaMetrics.get_instance()
+
 def getOriginalAPKPath():
     if(not os.path.exists(sys.argv[1])):
         raise ValueError("Input file (" + sys.argv[1] + ") was not found or was not readable.")
     return sys.argv[1]
 
 
-def getNewAPKName():
-    name = os.path.basename(getOriginalAPKPath())
+def getArgValue(flag, default):
+    # accepts both "--flag value" and "--flag=value" after the apk path
+    args = sys.argv[2:]
+    for idx, arg in enumerate(args):
+        if(arg == flag and idx + 1 < len(args)):
+            return args[idx + 1]
+        if(arg.startswith(flag + "=")):
+            return arg[len(flag) + 1:]
+    return default
+
+
+def getNumJobs():
+    # --jobs N instruments the class files in N worker processes
+    # --jobs 0 means one worker per core
+    jobs = int(getArgValue("--jobs", "1"))
+    if(jobs <= 0):
+        jobs = os.cpu_count()
+    return jobs
+
+
+def getClassCache():
+    # --class-cache DIR re-uses instrumented classes from earlier runs
+    # --class-cache-size MB limits the size of DIR (default 2048)
+    # must be called after importPlugins() (see compute_fingerprint())
+    cache_dir = getArgValue("--class-cache", None)
+    if(cache_dir is None):
+        return None
+    max_bytes = int(getArgValue("--class-cache-size", "2048")) * 1024 * 1024
+    return InstrumentedClassCache.InstrumentedClassCache(cache_dir, max_bytes)
+
+
+def getPackageFilter():
+    # --include PATTERNS only instrument these packages / classes
+    # --exclude PATTERNS never instrument these packages / classes
+    # --exclude-libraries never instrument well-known libraries (androidx, kotlin, ...)
+    # PATTERNS is a comma separated list, e.g., com.example,com.other.*
+    return PackageFilter.PackageFilter.from_strings(getArgValue("--include", None),
+        getArgValue("--exclude", None), "--exclude-libraries" in sys.argv[2:])
+
+
+def getNewAPKName(apk_path=None):
+    if(apk_path is None):
+        apk_path = getOriginalAPKPath()
+    name = os.path.basename(apk_path)
     return "Tracked_" + name
 
 
-def dumpApk():
-    #dump apk files
-    start_time = time.time()
-    # -f is necessary since temp_file already exists (apktool doesn't like that) 
+def decodeApk(apk_path, output_dir):
+    # -f is necessary since output_dir already exists (apktool doesn't like that) 
     # -f means "force"
-    cmd = ["apktool", "d", getOriginalAPKPath(), "-o", temp_file.name, "-f"]
+    cmd = ["apktool", "d", apk_path, "-o", output_dir, "-f"]
     completed_process = subprocess.run(cmd)
     completed_process.check_returncode()
+
+
+def getDecodeCache():
+    # --decode-cache DIR re-uses "apktool d" results of earlier runs
+    # --decode-cache-size MB limits the size of DIR (default 4096)
+    cache_dir = getArgValue("--decode-cache", None)
+    if(cache_dir is None):
+        return None
+    max_bytes = int(getArgValue("--decode-cache-size", "4096")) * 1024 * 1024
+    return DecodedApkCache.DecodedApkCache(cache_dir, max_bytes)
+
+
+def dumpApk(decode_cache=None, apk_path=None, work_dir=None):
+    #dump apk files
+    # apk_path and work_dir default to the apk given on the command line
+    # and the temporary directory of this run
+    start_time = time.time()
+    if(apk_path is None):
+        apk_path = getOriginalAPKPath()
+    if(work_dir is None):
+        work_dir = temp_file.name
+        
+    if(decode_cache is None):
+        decodeApk(apk_path, work_dir)
+        
+    else:
+        key = decode_cache.key(apk_path)
+        entry_dir = decode_cache.lookup(key)
+        if(entry_dir is None):
+            entry_dir = decode_cache.add(key, lambda output_dir: decodeApk(apk_path, output_dir))
+        else:
+            print("Found decoded apk in cache: " + entry_dir)
+        decode_cache.clone(entry_dir, work_dir)
+        decode_cache.evict()
+        
     print("Apk unpacked in %.1f seconds" % (time.time() - start_time))
 
 
 def importPlugins():
+    # once per process, a job forked from a warm process (StigmaDaemon,
+    # StigmaBatch) already has the plugins registered
+    if(Instrumenter.instrumentation_map != {}):
+        return
     TaintTrackingInstrumentationPlugin.main()
     
     
@@ -57,7 +149,9 @@ def importPlugins():
     # print("Plugins loaded in %.1f seconds" % (time.time() - start_time))
 
 
-def getFiles():
+def getFiles(work_dir=None):
+    if(work_dir is None):
+        work_dir = temp_file.name
 
     #find relevant files (strong assumptions here!)
     # This first chunk basically is hard-coded to 
@@ -89,7 +183,7 @@ def getFiles():
     # This gets all the files that end in ".smali" from the entire
     # application.  This assumes all of the framework files
     # as well as any files authored by the app developer.
-    relevantFilePaths = glob.glob(temp_file.name + '/**/*.smali', recursive=True)
+    relevantFilePaths = glob.glob(work_dir + '/**/*.smali', recursive=True)
     #print(relevantFilePaths)
     # end of second chunk
 
@@ -104,8 +198,8 @@ def getFiles():
 
     return relevantFilePaths
 
-def count_non_blank_lines_of_code():
-    paths = getFiles()
+def count_non_blank_lines_of_code(work_dir=None):
+    paths = getFiles(work_dir)
     num = 0
     for path in paths:
         fh = open(path, "r")
@@ -118,62 +212,101 @@ def wrapString(string, wrapper):
     return wrapper + str(string) + wrapper
 
 
-def runStigma():
+def runStigma(jobs=1, class_cache=None, work_dir=None, new_apk_name=None, package_filter=None, streaming=False):
     print("Running Stigma")
     start_time = time.time()
-    relevantFilePaths = getFiles()
+    if(work_dir is None):
+        work_dir = temp_file.name
+    if(new_apk_name is None):
+        new_apk_name = getNewAPKName()
+    
+    # left-overs from a previous app (e.g., in batch mode)
+    TaintStorageHandler.TaintStorageHandler.get_instance().erase()
+    constant_pool_counts.clear()
     
     # getting list of all classes in this project
-    class_names = []
-    for path in relevantFilePaths:
-        class_names.append(SmaliClassDef.SmaliClassDef.extract_class_name(path))
+    with metrics.stage("scan", True):
+        relevantFilePaths = []
+        class_names = []
+        excluded_count = 0
+        for path in getFiles(work_dir):
+            class_name = SmaliClassDef.SmaliClassDef.extract_class_name(path)
+            # excluded classes are not touched at all and are
+            # "external" to the classes that are instrumented
+            if(package_filter is not None and not package_filter.should_instrument(class_name)):
+                excluded_count += 1
+                continue
+            relevantFilePaths.append(path)
+            class_names.append(class_name)
+    if(package_filter is not None and package_filter.is_active()):
+        print("...Excluded " + str(excluded_count) + " class files (" + str(package_filter) + ")")
     
     print("...Instrumenting class files")
+    if(jobs > 1):
+        print("...using " + str(jobs) + " worker processes")
     counter = 1
     comparison_instruction_count = 0
     not_enough_registers_count = 0
     total_files = len(class_names)
-    for path in relevantFilePaths:
-        #print("cur file path: " + str(name))
-        # parse file
-        scd = SmaliClassDef.SmaliClassDef(path)
-        scd.internal_class_names.extend(class_names)
-        
-        # analytics stuff
-        comparison_instruction_count = comparison_instruction_count + scd.get_num_comparison_instructions()    
-        for every_method in scd.methods:
-            not_enough_registers_count += every_method.not_enough_free_registers_count
+    
+    # parsing, growing and instrumenting happens in InstrumentationWorker
+    # results come back in the order of relevantFilePaths 
+    # (even with several jobs) so the output is always the same
+    # streaming=True (--stream) bounds the memory used with several jobs
+    results = InstrumentationWorker.instrument_classes(relevantFilePaths, class_names, jobs, importPlugins, class_cache, streaming)
+    # classes are written by a background thread while the next ones are instrumented
+    with ClassFileIO.WriteBehind() as writer:
+        for result, text in results:
+            # analytics stuff
+            comparison_instruction_count = comparison_instruction_count + result.comparison_count
+            not_enough_registers_count += result.not_enough_registers_count
         
-        #Progress bar
-        print(f'...{str(counter)}/{str(total_files)}', end = '\r')
-        counter += 1
+            #Progress bar
+            print(f'...{str(counter)}/{str(total_files)}', end = '\r')
+            counter += 1
         
-        # actual instrumentation
-        scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
-        scd.instrument()
-        scd.overwrite_to_file()
+            # the file might be a hard link into the decode cache
+            # so it is replaced, not written in place (write_class_file)
+            writer.write(result.path, text)
+            constant_pool_counts[result.path] = result.constant_pool_counts
+    
+    # for files / lines per second in the metrics report
+    metrics.add_count("instrument_wall_seconds", time.time() - start_time)
         
-    analytics_path = os.path.join(temp_file.name, getNewAPKName() + "_analytics.dat")
+    analytics_path = os.path.join(work_dir, new_apk_name + "_analytics.dat")
     fh = open(analytics_path, "w")
     fh.write("Number of Comparisons: " + str(comparison_instruction_count) + "\n")
     fh.write("Number of instructions in which there were not enough registers to properly instrument: " + str(comparison_instruction_count))
     fh.close()
+    
+    if(class_cache is not None):
+        print("Class cache: " + str(class_cache))
+        class_cache.evict()
 
     print("Stigma ran in %.1f seconds" % (time.time() - start_time))
     
+    return {"comparisons": comparison_instruction_count, 
+        "not_enough_registers": not_enough_registers_count, 
+        "classes": total_files, "excluded_classes": excluded_count}
+    
     
 
-def writeStorageClasses():
+def writeStorageClasses(work_dir=None):
+    if(work_dir is None):
+        work_dir = temp_file.name
     storage_handler = TaintStorageHandler.TaintStorageHandler.get_instance()
     #print(storage_handler)
     print("Creating Taint Storage Locations")
-    path = os.path.join(temp_file.name, "smali", "net", "stigmastorage")
+    path = os.path.join(work_dir, "smali", "net", "stigmastorage")
     os.makedirs(path, exist_ok=True)
     for storage_class in storage_handler.storage_classes:
         #print(path + storage_class.get_storage_class_name() + ".smali")
         full_path = os.path.join(path, storage_class.get_storage_class_name() + ".smali")
         with open(full_path , "w") as f:
             f.write(storage_class.generate_smali_class_text())
+        # one field per location, one method (<init>) which
+        # references one other method (Object.<init>)
+        constant_pool_counts[full_path] = (storage_class.get_locations_len(), 2)
 
 def extractPathParts(path, begin, end):
     # This crazy line does three things.
@@ -192,7 +325,9 @@ def extractPathParts(path, begin, end):
     ans = "/".join(path.split("/")[begin:end])
     return ans
 
-def splitSmali():
+def splitSmali(work_dir=None):
+    if(work_dir is None):
+        work_dir = temp_file.name
     print("Accounting For Constant Pool Limits")
     # There are separately enumerated and indexed constant pools for references to strings, types, fields, and methods. 
     # https://source.android.com/devices/tech/dalvik/dalvik-bytecode
@@ -230,7 +365,7 @@ def splitSmali():
     # max signed byte: 127
 
 
-    smaliFiles = getFiles()
+    smaliFiles = getFiles(work_dir)
 
     # see the instructions that correspond to the 4 different 
     # countable things: type_id, string_id, field_id,
@@ -246,9 +381,13 @@ def splitSmali():
     e = 0
     for idx, smaliFile in enumerate(smaliFiles):
         #print("file: " + str(smaliFile))
-        scd = SmaliClassDef.SmaliClassDef(smaliFile)
-        field_num = scd.get_num_field_declarations() + scd.get_num_field_references()
-        method_num = scd.get_num_method_declarations() + scd.get_num_method_references()
+        # the counts were collected when the file was written,
+        # only files stigma did not write (e.g., excluded classes) are scanned here
+        if(smaliFile in constant_pool_counts):
+            field_num, method_num = constant_pool_counts[smaliFile]
+        else:
+            with open(smaliFile, "r") as fh:
+                field_num, method_num = SmaliClassDef.SmaliClassDef.count_constant_pools(fh.readlines())
         
         
         if(method_num > THRESH):
@@ -286,13 +425,14 @@ def splitSmali():
     print("...Re-arranging files")
     #print(str(len(resultLists)) + " groups")
     for idx, group in enumerate(resultLists):
-        path = os.path.join(temp_file.name, "smali/")
+        path = os.path.join(work_dir, "smali/")
         if(idx > 0):
-            path = os.path.join(temp_file.name, "smali_classes" + str(idx+1) + "/")
+            path = os.path.join(work_dir, "smali_classes" + str(idx+1) + "/")
             os.makedirs(path, exist_ok=True)
 
         for smaliFile in group:
-            newFolderPath = path + extractPathParts(smaliFile, 4, -1)
+            # drop the smali_classesX folder and the file name
+            newFolderPath = path + extractPathParts(os.path.relpath(smaliFile, work_dir), 1, -1)
             #print("newFolderPath: " + str(newFolderPath))
             #print("newFolderPath: " + newFolderPath)
             os.makedirs(newFolderPath, exist_ok=True)
@@ -319,40 +459,50 @@ def splitSmali():
                 os.rename(smaliFile, newFileAbsPath)
 
 #rebuild apk
-def rebuildApk():
+def rebuildApk(work_dir=None, output_apk=None, use_aapt2=None, interactive=True):
     # rebuilds the apk 
+    # work_dir, output_apk and use_aapt2 default to this run's temporary
+    # directory, getNewAPKName() and the command line flag
+    # interactive=False raises an error if apktool fails instead of asking
     start_time = time.time()
-    newName = getNewAPKName()
+    if(work_dir is None):
+        work_dir = temp_file.name
+    if(output_apk is None):
+        output_apk = getNewAPKName()
     
     # --use-aapt2
     # was found to be necessary in order to re-build myfitnesspal
     # to avoid error: invalid resource directory name: ...\res navigation
     # https://github.com/iBotPeaches/Apktool/issues/2219
-    use_aapt2 = "--use-aapt2" in sys.argv[2:]
+    if(use_aapt2 is None):
+        use_aapt2 = "--use-aapt2" in sys.argv[2:]
     if(use_aapt2):
-        rebuildCMD = ["apktool", "b", temp_file.name, "--use-aapt2", "-o", getNewAPKName()]
+        rebuildCMD = ["apktool", "b", work_dir, "--use-aapt2", "-o", output_apk]
     else:
-        rebuildCMD = ["apktool", "b", temp_file.name, "-o", getNewAPKName()]
+        rebuildCMD = ["apktool", "b", work_dir, "-o", output_apk]
         
     print("Rebuilding:", rebuildCMD)
     completedProcess = subprocess.run(rebuildCMD)
     try:
         completedProcess.check_returncode()
     except:
+        if(not interactive):
+            raise
         input("continue?")
     print("Apk packed in %.1f seconds" % (time.time() - start_time))
 
 
-def signApk():
-    password = "MzJiY2ZjNjY5Z"
-    password_bytes = (password+"\n").encode("utf-8")
+KEYSTORE_NAME = "stigma-keys.keystore"
+KEYSTORE_PASSWORD = "MzJiY2ZjNjY5Z"
+KEYSTORE_ALIAS = "stigma_keystore_alias"
+
+def createKeystore():
+    password_bytes = (KEYSTORE_PASSWORD+"\n").encode("utf-8")
     #print(password_bytes)
-    keystore_name = "stigma-keys.keystore"
-    stigma_alias = "stigma_keystore_alias"
     
-    if(not os.path.exists(keystore_name)):
+    if(not os.path.exists(KEYSTORE_NAME)):
         # keytool -genkey -v -keystore my-release-key.keystore -alias alias_name -keyalg RSA -validity 10000
-        cmd = ["keytool", "-genkey", "-keystore", keystore_name, "-alias", stigma_alias, "-keyalg", "RSA", "-validity", "10000"]
+        cmd = ["keytool", "-genkey", "-keystore", KEYSTORE_NAME, "-alias", KEYSTORE_ALIAS, "-keyalg", "RSA", "-validity", "10000"]
         proc = subprocess.Popen(" ".join(cmd), stdin=subprocess.PIPE, shell=True)
         
         proc.stdin.write(password_bytes)
@@ -366,50 +516,91 @@ def signApk():
         proc.stdin.write(b"y\n")
         proc.communicate(b"\n")
 
+
+def signApk(apk_path=None):
+    createKeystore()
+
     #print("Signing...")
-    newAppName = getNewAPKName()
+    if(apk_path is None):
+        apk_path = getNewAPKName()
     #jarsigner -keystore stigma-keys.keystore -storepass MzJiY2ZjNjY5Z ./leak_detect_test/Tracked_StigmaTest.apk stigma_keystore_alias
-    cmd = ["jarsigner", "-keystore", keystore_name, "-storepass", password, newAppName, stigma_alias]
+    cmd = ["jarsigner", "-keystore", KEYSTORE_NAME, "-storepass", KEYSTORE_PASSWORD, apk_path, KEYSTORE_ALIAS]
     completedProcess = subprocess.run(cmd)
     completedProcess.check_returncode()
 
 
+def getMetricsPath(work_dir=None, new_apk_name=None):
+    # --metrics PATH, by default next to the analytics file
+    if(work_dir is None):
+        work_dir = temp_file.name
+    if(new_apk_name is None):
+        new_apk_name = getNewAPKName()
+    return getArgValue("--metrics", os.path.join(work_dir, new_apk_name + "_metrics.json"))
+
+
+def writeMetrics(path, extra=None):
+    # stage times, handler times and throughput as json (see StigmaMetrics)
+    metrics.write_report(path, Instrumenter.instrumentation_map, extra)
+    print("Metrics: " + os.path.abspath(path))
+
+
 def deleteFiles():
     temp_file.cleanup()
 
 
 
 
-if __name__ == '__main__':
-    # we need a better interface haha!
-    # Also ./apk should be a sys.argv param to the location of an APK file
-    
+def main(work_dir=None, interactive=True):
+    # the whole pipeline for the apk and options in sys.argv
+    # work_dir defaults to the temporary directory of this run
+    # interactive=False never waits for input (e.g., in StigmaDaemon)
+    # returns the path of the new apk, the analytics and the metrics report path
+    if(work_dir is None):
+        work_dir = temp_file.name
+    new_apk_name = getNewAPKName()
+
     if(len(sys.argv) >= 3):
         dry_run = "--dry-run" in sys.argv[2:]
     else:
         dry_run = False
 
     start = time.time()
-    print("Working In: " + str(temp_file.name))
-    dumpApk()
-    
+    print("Working In: " + str(work_dir))
     if(not dry_run):
         importPlugins()
-        runStigma()
-        writeStorageClasses()
-        splitSmali()
+    with metrics.stage("decode", True):
+        dumpApk(getDecodeCache(), None, work_dir)
+    
+    analytics = {}
+    if(not dry_run):
+        analytics = runStigma(getNumJobs(), getClassCache(), work_dir, new_apk_name, getPackageFilter(), "--stream" in sys.argv[2:])
+        with metrics.stage("storage_class_write", True):
+            writeStorageClasses(work_dir)
+        with metrics.stage("split", True):
+            splitSmali(work_dir)
         
-    rebuildApk()
-    signApk()
+    with metrics.stage("rebuild", True):
+        rebuildApk(work_dir, new_apk_name, None, interactive)
+    with metrics.stage("sign", True):
+        signApk(new_apk_name)
     end = time.time()
     
+    metrics_path = getMetricsPath(work_dir, new_apk_name)
+    writeMetrics(metrics_path, {"apk": getOriginalAPKPath(), "total_seconds": end - start, "analytics": analytics,
+        "string_pool": StringPool.get_instance().get_stats()})
     print("Finished in %.1f seconds" % (end - start))
-    print("Result: " + os.path.abspath(getNewAPKName()))
+    print("Result: " + os.path.abspath(new_apk_name))
     
+    return {"output": os.path.abspath(new_apk_name), "analytics": analytics,
+        "metrics": os.path.abspath(metrics_path), "seconds": end - start}
+
+
+if __name__ == '__main__':
+    # we need a better interface haha!
+    # Also ./apk should be a sys.argv param to the location of an APK file
+    main()
     
     # this input is here because it is helpful to keep the temporary files
     # around for debugging purposes.  In final release maybe remove it.
     input("Press Enter to Delete Temporary Files: ")
     deleteFiles()
-
-
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import traceback
+import multiprocessing
+import concurrent.futures
+
+import Stigma
+import Instrumenter
+import InstrumentedClassCache
+import DecodedApkCache
+import PackageFilter
+import StigmaMetrics
+
+
+# Runs stigma on many APKs.  Every APK goes through three stages
+#
+#   decode      apktool d                  (external process)
+#   instrument  runStigma, storage classes (python, in a worker process)
+#   rebuild     apktool b, jarsigner       (external processes)
+#
+# and every stage has its own pool with a fixed number of slots.  So while
+# one app is being instrumented other apps are being decoded or rebuilt,
+# instead of the whole run waiting on one subprocess at a time.
+#
+# The number of APKs "in flight" (started but not finished) is bounded too
+# so decoded apps don't pile up on disk when decoding outpaces instrumenting.
+#
+# A manifest (json) with one entry per APK (result, error, stage times,
+# analytics) is re-written every time an APK finishes.
+#
+# usage: python3 StigmaBatch.py folder_or_apk [folder_or_apk ...] [options]
+
+
+class BatchJob:
+    def __init__(self, apk_path, output_dir):
+        self.apk_path = os.path.abspath(apk_path)
+        self.output_apk = os.path.join(output_dir, Stigma.getNewAPKName(self.apk_path))
+        self.work_dir = None
+
+        self.status = "pending" # pending -> ok / failed
+        self.failed_stage = None
+        self.error = None
+        self.stage_seconds = {}
+        self.analytics = {}
+        self.metrics = None # StigmaMetrics report of the instrument stage
+
+        self.done = threading.Event()
+
+    def to_manifest_entry(self):
+        entry = {"apk": self.apk_path, "status": self.status,
+            "stage_seconds": self.stage_seconds, "analytics": self.analytics}
+        if self.metrics is not None:
+            entry["metrics"] = self.metrics
+        if self.status == "ok" and os.path.exists(self.output_apk):
+            entry["output"] = self.output_apk
+        if self.failed_stage is not None:
+            entry["failed_stage"] = self.failed_stage
+            entry["error"] = self.error
+        return entry
+
+
+def find_apks(paths):
+    # folders are searched recursively
+    apks = []
+    for path in paths:
+        if os.path.isdir(path):
+            apks.extend(sorted(glob.glob(path + '/**/*.apk', recursive=True)))
+        else:
+            apks.append(path)
+    return apks
+
+
+def write_manifest(jobs, manifest_path):
+    entries = [job.to_manifest_entry() for job in jobs]
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(entries, fh, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+# instrument stage (runs in the worker processes)
+_class_cache = None
+_package_filter = None
+
+def _init_instrument_worker(options):
+    global _class_cache, _package_filter
+    Stigma.importPlugins()
+    _package_filter = PackageFilter.PackageFilter.from_strings(options.include,
+        options.exclude, options.exclude_libraries)
+    if options.class_cache is not None:
+        _class_cache = InstrumentedClassCache.InstrumentedClassCache(options.class_cache,
+            options.class_cache_size * 1024 * 1024)
+
+
+def _instrument(work_dir, new_apk_name, count_loc):
+    # never raises, errors are returned so the parent can put them in the manifest
+    start_time = time.time()
+    metrics = StigmaMetrics.StigmaMetrics.get_instance()
+    metrics.erase()
+    try:
+        ans = {}
+        if count_loc:
+            ans["loc_before"] = Stigma.count_non_blank_lines_of_code(work_dir)
+
+        ans.update(Stigma.runStigma(1, _class_cache, work_dir, new_apk_name, _package_filter))
+        with metrics.stage("storage_class_write", True):
+            Stigma.writeStorageClasses(work_dir)
+        with metrics.stage("split", True):
+            Stigma.splitSmali(work_dir)
+
+        if count_loc:
+            ans["loc_after"] = Stigma.count_non_blank_lines_of_code(work_dir)
+        return {"analytics": ans, "seconds": time.time() - start_time,
+            "metrics": metrics.get_report(Instrumenter.instrumentation_map)}
+
+    except BaseException:
+        # e.g., exit() in Stigma.getFiles(), a SystemExit would end the
+        # worker process and the result would never come back
+        return {"error": traceback.format_exc(), "seconds": time.time() - start_time}
+
+
+def instrument_async(pool, work_dir, new_apk_name, count_loc, callback):
+    # instruments work_dir in pool, callback(result) is called exactly
+    # once (in the result handler thread of pool), with the result of
+    # _instrument() or an error if the task itself failed (it could not
+    # be pickled, the worker raised ...)
+    start_time = time.time()
+    def failed(exception):
+        callback({"error": "".join(traceback.format_exception(exception)), "seconds": time.time() - start_time})
+    pool.apply_async(_instrument, (work_dir, new_apk_name, count_loc),
+        callback=callback, error_callback=failed)
+
+
+def run_batch(apk_paths, options):
+    os.makedirs(options.output_dir, exist_ok=True)
+    jobs = [BatchJob(apk_path, options.output_dir) for apk_path in apk_paths]
+    manifest_lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(options.max_in_flight)
+
+    decode_cache = None
+    if options.decode_cache is not None:
+        decode_cache = DecodedApkCache.DecodedApkCache(options.decode_cache, options.decode_cache_size * 1024 * 1024)
+
+    if options.rebuild:
+        # before any jarsigner runs, so they don't race to create it
+        Stigma.createKeystore()
+
+    # the worker processes are forked here, before any threads exist
+    instrument_pool = None
+    if not options.dry_run:
+        instrument_pool = multiprocessing.Pool(options.instrumenters, _init_instrument_worker, (options,))
+    decoders = concurrent.futures.ThreadPoolExecutor(options.decoders)
+    rebuilders = concurrent.futures.ThreadPoolExecutor(options.rebuilders)
+
+
+    def finish(job, failed_stage=None, error=None):
+        if failed_stage is None:
+            job.status = "ok"
+        else:
+            job.status = "failed"
+            job.failed_stage = failed_stage
+            job.error = error
+            print("Error processing " + job.apk_path + " (" + failed_stage + ")\n" + error)
+
+        if job.work_dir is not None and not options.keep_work_dirs:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+
+        with manifest_lock:
+            write_manifest(jobs, options.manifest)
+        print("Finished " + job.apk_path + ": " + job.status)
+        job.done.set()
+        in_flight.release()
+
+
+    def timed(job, stage, function, *args):
+        start_time = time.time()
+        try:
+            function(*args)
+        finally:
+            job.stage_seconds[stage] = time.time() - start_time
+
+
+    def decode(job):
+        job.work_dir = tempfile.mkdtemp(prefix="apkOutput_", dir=options.work_root)
+        timed(job, "decode", Stigma.dumpApk, decode_cache, job.apk_path, job.work_dir)
+
+    def after_decode(job, future):
+        if future.exception() is not None:
+            finish(job, "decode", "".join(traceback.format_exception(future.exception())))
+        elif options.dry_run:
+            start_rebuild(job)
+        else:
+            new_apk_name = os.path.basename(job.output_apk)
+            instrument_async(instrument_pool, job.work_dir, new_apk_name, options.count_loc,
+                lambda result: after_instrument(job, result))
+
+    def after_instrument(job, result):
+        # runs in the result handler thread of instrument_pool
+        job.stage_seconds["instrument"] = result["seconds"]
+        if "error" in result:
+            finish(job, "instrument", result["error"])
+        else:
+            job.analytics = result["analytics"]
+            job.metrics = result["metrics"]
+            start_rebuild(job)
+
+    def start_rebuild(job):
+        if not options.rebuild:
+            finish(job)
+            return
+        future = rebuilders.submit(rebuild, job)
+        future.add_done_callback(lambda future: after_rebuild(job, future))
+
+    def rebuild(job):
+        timed(job, "rebuild", Stigma.rebuildApk, job.work_dir, job.output_apk, options.use_aapt2, False)
+        timed(job, "sign", Stigma.signApk, job.output_apk)
+
+    def after_rebuild(job, future):
+        if future.exception() is not None:
+            finish(job, "rebuild", "".join(traceback.format_exception(future.exception())))
+        else:
+            finish(job)
+
+
+    start_time = time.time()
+    for job in jobs:
+        in_flight.acquire()
+        print("Starting " + job.apk_path)
+        future = decoders.submit(decode, job)
+        future.add_done_callback(lambda future, job=job: after_decode(job, future))
+
+    for job in jobs:
+        job.done.wait()
+
+    decoders.shutdown()
+    rebuilders.shutdown()
+    if instrument_pool is not None:
+        instrument_pool.close()
+        instrument_pool.join()
+
+    if options.class_cache is not None:
+        InstrumentedClassCache.InstrumentedClassCache(options.class_cache,
+            options.class_cache_size * 1024 * 1024, "").evict()
+
+    write_manifest(jobs, options.manifest)
+    num_ok = len([job for job in jobs if job.status == "ok"])
+    print("Batch finished in %.1f seconds, %d/%d apks ok" % (time.time() - start_time, num_ok, len(jobs)))
+    print("Manifest: " + os.path.abspath(options.manifest))
+    return jobs
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Run stigma on many APKs")
+    parser.add_argument("paths", nargs="+", help="APK files or folders containing APK files")
+    parser.add_argument("--output-dir", default=".", help="where the Tracked_*.apk files go")
+    parser.add_argument("--manifest", default=None, help="default: OUTPUT_DIR/stigma_batch_manifest.json")
+    parser.add_argument("--work-root", default=None, help="where the temporary apkOutput_ folders go")
+    parser.add_argument("--keep-work-dirs", action="store_true")
+
+    parser.add_argument("--decoders", type=int, default=2, help="apktool d at the same time")
+    parser.add_argument("--instrumenters", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="apps instrumented at the same time")
+    parser.add_argument("--rebuilders", type=int, default=2, help="apktool b / jarsigner at the same time")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="default: sum of the three above")
+
+    parser.add_argument("--dry-run", action="store_true", help="decode and rebuild only")
+    parser.add_argument("--no-rebuild", dest="rebuild", action="store_false", help="stop after instrumenting")
+    parser.add_argument("--count-loc", action="store_true", help="count lines of code before and after")
+    parser.add_argument("--use-aapt2", action="store_true")
+
+    parser.add_argument("--include", default=None, help="only instrument these packages (comma separated, prefix or glob)")
+    parser.add_argument("--exclude", default=None, help="never instrument these packages (comma separated, prefix or glob)")
+    parser.add_argument("--exclude-libraries", action="store_true", help="never instrument well-known libraries (androidx, kotlin, ...)")
+
+    parser.add_argument("--class-cache", default=None)
+    parser.add_argument("--class-cache-size", type=int, default=2048, help="MB")
+    parser.add_argument("--decode-cache", default=None)
+    parser.add_argument("--decode-cache-size", type=int, default=4096, help="MB")
+
+    options = parser.parse_args(args)
+    if options.manifest is None:
+        options.manifest = os.path.join(options.output_dir, "stigma_batch_manifest.json")
+    if options.max_in_flight is None:
+        options.max_in_flight = options.decoders + options.instrumenters + options.rebuilders
+    return options
+
+
+def main():
+    options = parse_args(sys.argv[1:])
+    apk_paths = find_apks(options.paths)
+    print("APKS: " + str(apk_paths))
+    jobs = run_batch(apk_paths, options)
+    if any(job.status != "ok" for job in jobs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import socket
+import tempfile
+import argparse
+import selectors
+import traceback
+
+import Stigma
+
+
+# Keeps stigma loaded (python modules, registered instrumentation
+# plugins) and runs instrumentation jobs sent over a Unix socket, so a job
+# does not pay for interpreter start up and imports every time.
+#
+#   python3 StigmaDaemon.py serve [--socket PATH] [--max-jobs N]
+#   python3 StigmaDaemon.py submit app.apk [Stigma.py options ...]
+#   python3 StigmaDaemon.py stop
+#
+# submit --keep-work-dir keeps the decoded / instrumented app (for debugging)
+#
+# Every job runs in its own process forked from the daemon, so it starts
+# with the warm state of the daemon but its TaintStorageHandler,
+# instrumentation map, metrics etc. are its own and are thrown away when
+# the job ends.  Nothing a job does can leak into the next one.
+#
+# Protocol: one json object per line, in both directions.
+#   client -> daemon  {"apk": ..., "args": [...], "cwd": ...}  or  {"command": "stop"}
+#   daemon -> client  {"type": "accepted", "job": N}
+#                     {"type": "progress", "line": ...}   (everything the job prints)
+#                     {"type": "result", "status": "ok" | "failed", ...}
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "stigma-" + str(os.getuid()) + ".sock")
+
+# seconds a client has to send its request after connecting, the request
+# is read in the accept loop, a client that sends nothing must not hold
+# up everyone else
+REQUEST_TIMEOUT = 5.0
+
+
+def send_message(sock, message):
+    sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def read_messages(sock):
+    # generator, yields the json messages sent on sock until it is closed
+    buffer = b""
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        buffer += data
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            if line.strip():
+                yield json.loads(line)
+
+
+class StigmaDaemon:
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, max_jobs=None):
+        self.socket_path = socket_path
+        self.max_jobs = max_jobs or os.cpu_count()
+        self.running_jobs = set() # pids of the connection handlers
+        self.job_counter = 0
+        self.server = None
+
+
+    def warm_up(self):
+        # everything a job would otherwise do first
+        start_time = time.time()
+        Stigma.importPlugins()
+        print("Warmed up in %.1f seconds" % (time.time() - start_time))
+
+
+    def serve(self):
+        self.warm_up()
+        if os.path.exists(self.socket_path):
+            # left over from a daemon that was killed
+            os.remove(self.socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        self.server.listen()
+        self.server.settimeout(1.0)
+        print("Listening on " + self.socket_path)
+
+        try:
+            while True:
+                self._reap_jobs(block=len(self.running_jobs) >= self.max_jobs)
+                try:
+                    conn, address = self.server.accept()
+                except socket.timeout:
+                    continue
+                if not self._handle_connection(conn):
+                    break
+        finally:
+            self.server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            print("Stopped")
+
+
+    def _reap_jobs(self, block=False):
+        while self.running_jobs:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self.running_jobs.clear()
+                return
+            if pid == 0:
+                return
+            self.running_jobs.discard(pid)
+            block = False
+
+
+    def _handle_connection(self, conn):
+        # returns False if the daemon should stop
+        try:
+            conn.settimeout(REQUEST_TIMEOUT)
+            request = next(read_messages(conn))
+            conn.settimeout(None)
+        except (StopIteration, ValueError, OSError):
+            # socket.timeout is an OSError
+            conn.close()
+            return True
+
+        if request.get("command") == "stop":
+            send_message(conn, {"type": "result", "status": "ok"})
+            conn.close()
+            return False
+
+        self.job_counter += 1
+        pid = os.fork()
+        if pid == 0:
+            # connection handler process
+            self.server.close()
+            exit_code = 1
+            try:
+                send_message(conn, {"type": "accepted", "job": self.job_counter})
+                exit_code = run_job(conn, request)
+            except OSError:
+                pass # client went away
+            finally:
+                os._exit(exit_code)
+
+        self.running_jobs.add(pid)
+        conn.close()
+        return True
+
+
+
+def run_job(conn, request, job_function=None):
+    # runs in the connection handler process, forks the job process and
+    # relays its output to the client.  Returns an exit code
+    # job_function(request) returns the result, _job() by default
+    if job_function is None:
+        job_function = _job
+    output_read, output_write = os.pipe()
+    result_read, result_write = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        # job process, everything it (and apktool etc.) prints goes to the client
+        os.close(output_read)
+        os.close(result_read)
+        os.dup2(output_write, 1)
+        os.dup2(output_write, 2)
+        os.close(output_write)
+        sys.stdout = os.fdopen(1, "w", buffering=1)
+        sys.stderr = os.fdopen(2, "w", buffering=1)
+        result = job_function(request)
+        with os.fdopen(result_write, "w") as fh:
+            json.dump(result, fh)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+
+    os.close(output_write)
+    os.close(result_write)
+    try:
+        result_text = _relay_output(conn, output_read, result_read)
+        os.waitpid(pid, 0)
+        if result_text == "":
+            result = {"status": "failed", "error": "job process died"}
+        else:
+            result = json.loads(result_text)
+        result["type"] = "result"
+        send_message(conn, result)
+        return 0 if result["status"] == "ok" else 1
+
+    except OSError:
+        # the client disconnected, there is no one to give the result to
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+        raise
+
+
+def _relay_output(conn, output_read, result_read):
+    # sends what the job prints to the client, line by line, until the job
+    # closes both pipes and returns the result text.  Both pipes are read
+    # as data comes in: a result larger than the pipe buffer (e.g., with
+    # the metrics report) would otherwise block the job before it exits
+    selector = selectors.DefaultSelector()
+    selector.register(output_read, selectors.EVENT_READ)
+    selector.register(result_read, selectors.EVENT_READ)
+    partial = b""
+    result_chunks = []
+    try:
+        while selector.get_map():
+            for key, events in selector.select():
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fd)
+                    os.close(key.fd)
+                elif key.fd == result_read:
+                    result_chunks.append(data)
+                else:
+                    # progress bars end in \r, not \n
+                    lines = (partial + data).replace(b"\r", b"\n").split(b"\n")
+                    partial = lines.pop()
+                    for line in lines:
+                        if line:
+                            send_message(conn, {"type": "progress", "line": line.decode("utf-8", "replace")})
+        if partial:
+            send_message(conn, {"type": "progress", "line": partial.decode("utf-8", "replace")})
+    finally:
+        for key in list(selector.get_map().values()):
+            os.close(key.fd)
+        selector.close()
+    return b"".join(result_chunks).decode("utf-8")
+
+
+def _job(request):
+    # runs in the job process
+    start_time = time.time()
+    work_dir = tempfile.mkdtemp(prefix="apkOutput_")
+    try:
+        os.chdir(request["cwd"])
+        sys.argv = ["Stigma.py", request["apk"]] + request.get("args", [])
+        result = Stigma.main(work_dir, False)
+        result["status"] = "ok"
+        # the report itself, the work dir is removed below
+        with open(result["metrics"], "r") as fh:
+            result["metrics"] = json.load(fh)
+        return result
+    except BaseException:
+        return {"status": "failed", "error": traceback.format_exc(), "seconds": time.time() - start_time}
+    finally:
+        if "--keep-work-dir" not in request.get("args", []):
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+
+def submit(apk_path, args, socket_path=DEFAULT_SOCKET_PATH, quiet=False):
+    # sends one job to the daemon, prints its progress and returns the result
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    try:
+        send_message(client, {"apk": os.path.abspath(apk_path), "args": args, "cwd": os.getcwd()})
+        for message in read_messages(client):
+            if message["type"] == "progress" and not quiet:
+                print(message["line"])
+            elif message["type"] == "result":
+                return message
+    finally:
+        client.close()
+    return {"type": "result", "status": "failed", "error": "connection to the daemon was lost"}
+
+
+def stop(socket_path=DEFAULT_SOCKET_PATH):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    try:
+        send_message(client, {"command": "stop"})
+        next(read_messages(client))
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep stigma loaded and run jobs sent over a Unix socket")
+    parser.add_argument("action", choices=["serve", "submit", "stop"])
+    parser.add_argument("apk", nargs="?", help="(submit) the apk to instrument")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("--max-jobs", type=int, default=None, help="(serve) jobs at the same time, default: one per core")
+    parser.add_argument("--quiet", action="store_true", help="(submit) only print the result")
+    options, stigma_args = parser.parse_known_args()
+
+    if options.action == "serve":
+        StigmaDaemon(options.socket, options.max_jobs).serve()
+
+    elif options.action == "stop":
+        stop(options.socket)
+
+    else:
+        if options.apk is None:
+            parser.error("submit needs an apk")
+        result = submit(options.apk, stigma_args, options.socket, options.quiet)
+        if result["status"] == "ok":
+            print("Result: " + result["output"])
+        else:
+            print(result.get("error", ""))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+
+
+# Wall / CPU time per pipeline stage, time and number of calls per
+# instrumentation handler, and throughput (files and lines per second).
+#
+# Stages can be nested, the time of a stage does NOT include the time of
+# the stages nested inside it (e.g., "instrumentation" does not include
+# the "cfg" and "type_checking" time of the methods being instrumented).
+# So the stage times add up to (roughly) the total time of the run.
+# Stages are tracked per thread (StigmaBatch runs stages in threads).
+#
+# With several worker processes (--jobs) each worker collects its own
+# numbers and they are added up by the parent, so for the per class stages
+# (parse, cfg, type_checking, instrumentation) and the handlers the times
+# are the sum over all workers, which can be more than the wall time.
+#
+# Usage:
+#     metrics = StigmaMetrics.get_instance()
+#     with metrics.stage("parse"):
+#         ...
+#     metrics.add_handler_call("iget", handler_function, seconds)
+#
+# Memory: stage(name, True) samples the resident set size (RSS) of the
+# process when the stage ends and keeps the highest value per stage
+# ("rss_at_end_bytes", NOT the peak during the stage, memory freed before
+# the stage ends is not seen).  Only worth it for coarse stages (reading
+# /proc for every line that is type checked would be slow).  With worker
+# processes it is the highest RSS of any single worker.  The real peaks
+# are "max_rss_bytes" (this process) and "max_child_rss_bytes" (the
+# largest of the finished child processes, e.g., pool workers), both
+# from getrusage() and for the whole run.
+
+class StigmaMetrics:
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        #method to access StigmaMetrics Singleton
+        if StigmaMetrics.__instance == None:
+            StigmaMetrics()
+        return StigmaMetrics.__instance
+
+    def __init__(self):
+        #Virtually private constructor
+        if StigmaMetrics.__instance != None:
+            raise Exception("This class is a singleton!")
+        else:
+            StigmaMetrics.__instance = self
+            self._build()
+
+    def erase(self):
+        self._build()
+
+    def _build(self):
+        # key: stage name, value: [wall seconds, cpu seconds, count]
+        self.stages = {}
+
+        # key: opcode, value: [handler name, calls, seconds]
+        self.handlers = {}
+
+        # key: name, value: number (e.g., files, lines)
+        self.counters = {}
+
+        # key: stage name, value: highest RSS (bytes) seen at the end of the stage
+        self.memory = {}
+
+        # stages currently running in each thread: [name, wall start, cpu start]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _get_stage_stack(self):
+        if not hasattr(self._local, "stage_stack"):
+            self._local.stage_stack = []
+        return self._local.stage_stack
+
+    def stage(self, name, sample_memory=False):
+        return _Stage(self, name, sample_memory)
+
+    @staticmethod
+    def get_rss_bytes():
+        # current resident set size, falls back to the peak where
+        # /proc is not available (e.g., MacOS)
+        try:
+            with open("/proc/self/statm", "r") as fh:
+                return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return StigmaMetrics.get_max_rss_bytes()
+
+    @staticmethod
+    def get_max_rss_bytes(who=resource.RUSAGE_SELF):
+        # ru_maxrss is in KB on Linux and in bytes on MacOS
+        max_rss = resource.getrusage(who).ru_maxrss
+        if sys.platform != "darwin":
+            max_rss *= 1024
+        return max_rss
+
+    def sample_memory(self, name):
+        rss = StigmaMetrics.get_rss_bytes()
+        with self._lock:
+            if rss > self.memory.get(name, 0):
+                self.memory[name] = rss
+
+    def _start_stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        stage_stack = self._get_stage_stack()
+        if stage_stack:
+            # pause the enclosing stage
+            self._add_stage_time(stage_stack[-1], wall, cpu, 0)
+        stage_stack.append([name, wall, cpu])
+
+    def _stop_stage(self):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        stage_stack = self._get_stage_stack()
+        self._add_stage_time(stage_stack.pop(), wall, cpu, 1)
+        if stage_stack:
+            # resume the enclosing stage
+            stage_stack[-1][1] = wall
+            stage_stack[-1][2] = cpu
+
+    def _add_stage_time(self, running_stage, wall, cpu, count):
+        name, wall_start, cpu_start = running_stage
+        self.add_stage_time(name, wall - wall_start, cpu - cpu_start, count)
+
+    def add_stage_time(self, name, wall_seconds, cpu_seconds, count=1):
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = [0.0, 0.0, 0]
+            times = self.stages[name]
+            times[0] += wall_seconds
+            times[1] += cpu_seconds
+            times[2] += count
+
+    def add_handler_call(self, opcode, handler, seconds):
+        if opcode not in self.handlers:
+            self.handlers[opcode] = [handler.__name__, 0, 0.0]
+        entry = self.handlers[opcode]
+        entry[1] += 1
+        entry[2] += seconds
+
+    def add_count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def take_snapshot(self):
+        # returns the numbers collected so far and starts over
+        # (used by worker processes to send their numbers to the parent)
+        ans = {"stages": self.stages, "handlers": self.handlers, "counters": self.counters, "memory": self.memory}
+        self.stages = {}
+        self.handlers = {}
+        self.counters = {}
+        self.memory = {}
+        return ans
+
+    def merge(self, snapshot):
+        for name, times in snapshot["stages"].items():
+            self.add_stage_time(name, times[0], times[1], times[2])
+        for opcode, entry in snapshot["handlers"].items():
+            if opcode not in self.handlers:
+                self.handlers[opcode] = [entry[0], 0, 0.0]
+            self.handlers[opcode][1] += entry[1]
+            self.handlers[opcode][2] += entry[2]
+        for name, amount in snapshot["counters"].items():
+            self.add_count(name, amount)
+        for name, rss in snapshot["memory"].items():
+            if rss > self.memory.get(name, 0):
+                self.memory[name] = rss
+
+    def get_report(self, instrumentation_map=None, extra=None):
+        # instrumentation_map (Instrumenter.instrumentation_map) makes sure
+        # every registered handler shows up, even the ones never called
+        stages = {}
+        for name, times in self.stages.items():
+            stages[name] = {"wall_seconds": times[0], "cpu_seconds": times[1], "count": times[2]}
+        for name, rss in self.memory.items():
+            if name in stages:
+                stages[name]["rss_at_end_bytes"] = rss
+
+        handlers = {}
+        if instrumentation_map is not None:
+            for opcode, bundle in instrumentation_map.items():
+                handlers[opcode] = {"handler": bundle.handler.__name__, "calls": 0, "seconds": 0.0}
+        for opcode, entry in self.handlers.items():
+            handlers[opcode] = {"handler": entry[0], "calls": entry[1], "seconds": entry[2]}
+        # hottest handlers first
+        handlers = dict(sorted(handlers.items(), key=lambda item: item[1]["seconds"], reverse=True))
+
+        report = {"stages": stages, "handlers": handlers, "counters": dict(self.counters),
+            "max_rss_bytes": StigmaMetrics.get_max_rss_bytes(),
+            "max_child_rss_bytes": StigmaMetrics.get_max_rss_bytes(resource.RUSAGE_CHILDREN)}
+
+        # throughput of the instrumentation (see Stigma.runStigma)
+        if self.counters.get("instrument_wall_seconds", 0) > 0:
+            seconds = self.counters["instrument_wall_seconds"]
+            report["files_per_second"] = self.counters.get("files", 0) / seconds
+            report["lines_per_second"] = self.counters.get("lines", 0) / seconds
+
+        if extra is not None:
+            report.update(extra)
+        return report
+
+    def write_report(self, path, instrumentation_map=None, extra=None):
+        with open(path, "w") as fh:
+            json.dump(self.get_report(instrumentation_map, extra), fh, indent=2)
+
+
+class _Stage:
+    # context manager returned by StigmaMetrics.stage()
+    # (a plain class is cheaper than contextlib, stages are entered
+    # for every line that is type checked)
+    __slots__ = ["metrics", "name", "sample_memory"]
+
+    def __init__(self, metrics, name, sample_memory):
+        self.metrics = metrics
+        self.name = name
+        self.sample_memory = sample_memory
+
+    def __enter__(self):
+        self.metrics._start_stage(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics._stop_stage()
+        if self.sample_memory:
+            self.metrics.sample_memory(self.name)
+        return False
+
+
+
+def main():
+    print("Testing StigmaMetrics...")
+
+    print("\tstage tests...")
+    metrics = StigmaMetrics.get_instance()
+    assert(metrics is StigmaMetrics.get_instance())
+    with metrics.stage("outer"):
+        time.sleep(0.02)
+        with metrics.stage("inner"):
+            time.sleep(0.05)
+        with metrics.stage("inner", True):
+            time.sleep(0.05)
+
+    report = metrics.get_report()
+    assert(report["stages"]["inner"]["count"] == 2)
+    assert(report["stages"]["outer"]["count"] == 1)
+    # nested time is not counted twice
+    assert(report["stages"]["inner"]["wall_seconds"] >= 0.1)
+    assert(report["stages"]["outer"]["wall_seconds"] < 0.09)
+    assert(report["stages"]["inner"]["rss_at_end_bytes"] > 0)
+    assert("rss_at_end_bytes" not in report["stages"]["outer"])
+    assert(report["max_rss_bytes"] >= report["stages"]["inner"]["rss_at_end_bytes"])
+
+    print("\thandler and merge tests...")
+    def FAKE_instrumentation():
+        pass
+    metrics.add_handler_call("iget", FAKE_instrumentation, 0.5)
+    metrics.add_count("files", 2)
+    snapshot = metrics.take_snapshot()
+    assert(metrics.get_report()["stages"] == {})
+
+    metrics.merge(snapshot)
+    metrics.merge(snapshot)
+    metrics.add_count("instrument_wall_seconds", 2)
+    report = metrics.get_report()
+    assert(report["handlers"]["iget"] == {"handler": "FAKE_instrumentation", "calls": 2, "seconds": 1.0})
+    assert(report["stages"]["inner"]["count"] == 4)
+    assert(report["files_per_second"] == 2)
+
+    metrics.erase()
+    assert(metrics.get_report()["handlers"] == {})
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
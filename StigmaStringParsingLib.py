@@ -1,5 +1,6 @@
 import re
 import ValidSmaliInstructions
+from StringPool import StringPool
 
 BEGINS_WITH_DOT = r"^\s*\."  # oat "assembler" directives begin with a .dot
 BEGINS_WITH_HASHTAG = r"^\s*\#"
@@ -77,6 +78,193 @@ BEGINS_WITH_COMMENT = r"^\s*#"
 
     
 
+# Lexer
+# Every line is split and classified once, lex_line() remembers the result
+# for the most recently seen lines (the same lines, e.g., "    .line 36" or
+# "    return-void", show up over and over).  Most helper functions below
+# are lookups on the LexedLine instead of another regex search / split.
+
+KIND_BLANK = 0
+KIND_COMMENT = 1 # "# ..."
+KIND_LABEL = 2 # ":cond_0"
+KIND_DIRECTIVE = 3 # ".line 36", ".end method"
+KIND_INSTRUCTION = 4 # a valid smali opcode
+KIND_OTHER = 5 # e.g., the contents of an .array-data or .sparse-switch block
+
+# opcode name => small int, in the order of ValidSmaliInstructions.LIST
+OPCODE_IDS = {opcode: idx for idx, opcode in enumerate(ValidSmaliInstructions.LIST)}
+
+LEX_CACHE_SIZE = 65536
+_lex_cache = {}
+
+
+class LexedLine:
+    __slots__ = ["kind", "tokens", "opcode", "opcode_id"]
+
+    def __init__(self, kind, tokens, opcode, opcode_id):
+        self.kind = kind
+        self.tokens = tokens # tuple of the whitespace separated tokens
+        self.opcode = opcode # the first token, "" for blank lines
+        self.opcode_id = opcode_id # OPCODE_IDS[opcode] or -1 if not an instruction
+
+    def __repr__(self):
+        return "LexedLine(" + str(self.kind) + ", " + str(self.tokens) + ")"
+
+
+def _lex(line):
+    tokens = tuple(line.split())
+    if not tokens:
+        return LexedLine(KIND_BLANK, tokens, "", -1)
+
+    opcode = tokens[0]
+    first_char = opcode[0]
+    if first_char == "#":
+        kind = KIND_COMMENT
+    elif first_char == ":":
+        kind = KIND_LABEL
+    elif first_char == ".":
+        kind = KIND_DIRECTIVE
+    elif opcode in OPCODE_IDS:
+        return LexedLine(KIND_INSTRUCTION, tokens, opcode, OPCODE_IDS[opcode])
+    else:
+        kind = KIND_OTHER
+    return LexedLine(kind, tokens, opcode, -1)
+
+
+def lex_line(line):
+    # line must be a str (use str() on SmaliAssemblyInstruction objects)
+    ans = _lex_cache.get(line)
+    if ans is None:
+        ans = _lex(line)
+        if len(_lex_cache) >= LEX_CACHE_SIZE:
+            _lex_cache.clear()
+        _lex_cache[line] = ans
+        parse_counts["lexed"] += 1
+    else:
+        parse_counts["lex_reused"] += 1
+    return ans
+
+
+
+# Parsed lines
+# parse_line() goes one step further than lex_line(): the register
+# operands, the label an instruction jumps to and the type / field /
+# method it refers to.  The ParsedLine is remembered per line like the
+# LexedLine, so the type checker, SafeRegisterCollection and every plugin
+# handler asking about the same line (get_v_and_p_numbers() etc.) share
+# one parse of it.
+#
+# parse_counts counts the lines actually lexed / parsed and the times an
+# earlier result was reused instead (the parses saved), see
+# take_parse_counts()
+
+PARSE_CACHE_SIZE = 65536
+_parse_cache = {}
+parse_counts = {"lexed": 0, "lex_reused": 0, "parsed": 0, "parse_reused": 0}
+
+# opcodes whose last operand is a type, field or method reference
+_REFERENCE_OPCODE_PREFIXES = ("sget", "sput", "iget", "iput", "invoke-", "new-instance", "new-array",
+    "filled-new-array", "check-cast", "const-class", "instance-of")
+
+# opcodes whose last operand is a label
+_TARGET_OPCODE_PREFIXES = ("if-", "goto", "packed-switch", "sparse-switch", "fill-array-data")
+
+
+class ParsedLine:
+    __slots__ = ["lexed", "registers", "register_error", "target", "reference"]
+
+    def __init__(self, lexed, registers, register_error, target, reference):
+        self.lexed = lexed
+        self.registers = registers # tuple of register names, None if they cannot be determined
+        self.register_error = register_error # then, the exception get_v_and_p_numbers() raises
+        self.target = target # e.g., ":cond_0" for branches and switches, otherwise None
+        self.reference = reference # e.g., "Lfoo;->bar()V" for invokes (from the StringPool), otherwise None
+
+    @property
+    def opcode(self):
+        return self.lexed.opcode
+
+    def get_registers(self):
+        # a new list every time, the callers may change it
+        if self.registers is None:
+            error = self.register_error
+            raise type(error)(*error.args)
+        return list(self.registers)
+
+    def __repr__(self):
+        return "ParsedLine(" + str(self.lexed.tokens) + ", " + str(self.registers) + ")"
+
+
+def _parse(line):
+    lexed = lex_line(line)
+    registers = None
+    register_error = None
+    try:
+        registers = tuple(_get_v_and_p_numbers(line, lexed.tokens))
+    except Exception as e:
+        register_error = e
+
+    target = None
+    reference = None
+    if lexed.kind == KIND_INSTRUCTION:
+        last_token = lexed.tokens[-1]
+        if lexed.opcode.startswith(_TARGET_OPCODE_PREFIXES) and last_token.startswith(":"):
+            target = last_token
+        elif lexed.opcode.startswith(_REFERENCE_OPCODE_PREFIXES):
+            reference = StringPool.get_instance().canonical(last_token)
+    return ParsedLine(lexed, registers, register_error, target, reference)
+
+
+def parse_line(line):
+    # line must be a str (use str() on SmaliAssemblyInstruction objects)
+    ans = _parse_cache.get(line)
+    if ans is None:
+        ans = _parse(line)
+        if len(_parse_cache) >= PARSE_CACHE_SIZE:
+            _parse_cache.clear()
+        _parse_cache[line] = ans
+        parse_counts["parsed"] += 1
+    else:
+        parse_counts["parse_reused"] += 1
+    return ans
+
+
+def take_parse_counts():
+    # returns parse_counts and starts over
+    ans = dict(parse_counts)
+    for key in parse_counts:
+        parse_counts[key] = 0
+    return ans
+
+
+# pattern => (literal prefix, skips leading white space) or (None, compiled pattern)
+_begins_with_prefixes = {}
+
+def _compile_begins_with(pattern):
+    # r"^\s*\.end method" => (".end method", True)
+    # r"^\.method" => (".method", False)
+    match_object = re.fullmatch(r"\^(\\s\*)?((?:\\[.#\[:]|[^\\^$*+?()\[\]{}|.])*)", pattern)
+    if match_object is None:
+        return (None, re.compile(pattern))
+    prefix = re.sub(r"\\(.)", r"\1", match_object.group(2))
+    return (prefix, match_object.group(1) is not None)
+
+
+def begins_with(line, pattern):
+    # the same as (re.search(pattern, line) is not None) for the 
+    # BEGINS_WITH_* patterns above, but without the regex engine
+    entry = _begins_with_prefixes.get(pattern)
+    if entry is None:
+        entry = _compile_begins_with(pattern)
+        _begins_with_prefixes[pattern] = entry
+    prefix, skip_space = entry
+    if prefix is None:
+        return skip_space.search(line) is not None
+    if skip_space:
+        return line.lstrip().startswith(prefix)
+    return line.startswith(prefix)
+
+
 
 
 def get_num_registers(line):
@@ -108,8 +296,11 @@ def get_v_and_p_numbers(line):
     # extracts and builds SmaliRegister objects
     # from an instruction (like this one but returning
     # a list of objects instead of a list of strings)
+    return parse_line(line).get_registers()
 
-    tokens = break_into_tokens(line)
+
+def _get_v_and_p_numbers(line, tokens):
+    # see get_v_and_p_numbers(), only called by _parse()
     if "range" in tokens[0]:
         start, end = get_range_start_and_end(line)
         
@@ -170,53 +361,30 @@ def register_addition_deprecated(reg_name, num):
 
 def break_into_tokens(line):
     #print("calling break into tokens on: " + line)
-    line = line.strip()
-    tokens = line.split()
-    return tokens
+    # a new list, for callers that change it, the ones that only read the
+    # tokens use lex_line(line).tokens (the tuple every caller shares)
+    return list(lex_line(line).tokens)
 
 def extract_opcode(line):
-    tokens = break_into_tokens(line)
-    if(tokens == []):
-        return ""
-    return tokens[0]
+    return lex_line(line).opcode
     
 def is_valid_instruction(line):        
-    opcode = extract_opcode(line)
-    return opcode in ValidSmaliInstructions.SET
+    return lex_line(line).kind == KIND_INSTRUCTION
     
 def is_comment(line):
-    return line.strip().startswith("#")
+    return lex_line(line).kind == KIND_COMMENT
     
 def is_field_instruction(line):
-    search_object = re.search(BEGINS_WITH_SPUT, line)
-    if search_object is not None:
-        return True
-        
-    search_object = re.search(BEGINS_WITH_SGET, line)
-    if search_object is not None:
-        return True
-        
-    search_object = re.search(BEGINS_WITH_IPUT, line)
-    if search_object is not None:
-        return True
-        
-    search_object = re.search(BEGINS_WITH_IGET, line)
-    if search_object is not None:
-        return True
-
-        
-    return False
+    # sput, sget, iput, iget (and all their variants)
+    return lex_line(line).opcode[:4] in ("sput", "sget", "iput", "iget")
     
 def is_method_call_instruction(line):
-    search_object = re.search(BEGINS_WITH_INVOKE, line)
-    if search_object is not None:
-        return True
-    return False
+    return lex_line(line).opcode.startswith("invoke-")
     
 
 def could_have_a_subsequent_move_result(line):
-    ans = (re.search(BEGINS_WITH_INVOKE, line) is not None) or (re.search(BEGINS_WITH_FILLED_NEW_ARRAY, line) is not None)
-    return ans
+    opcode = lex_line(line).opcode
+    return opcode.startswith("invoke-") or opcode.startswith("filled-new-array")
 
 
 def get_num_register_parameters(instr):
@@ -419,6 +587,35 @@ def main():
     instr = '    invoke-virtual {v8, v1}, Lorg/mozilla/javascript/ScriptableObject;->setPrototype(Lorg/mozilla/javascript/Scriptable;)V\n'
     assert(is_valid_instruction(instr))
     
+    print("\tparsed line tests...")
+    _parse_cache.clear()
+    take_parse_counts()
+    line = "    invoke-virtual {p0, v1}, Lfoo/Bar;->baz(I)V\n"
+    parsed = parse_line(line)
+    assert(parse_line(line) is parsed)
+    assert(parsed.opcode == "invoke-virtual")
+    assert(parsed.registers == ("p0", "v1"))
+    assert(parsed.reference == "Lfoo/Bar;->baz(I)V")
+    assert(parsed.target is None)
+    registers = get_v_and_p_numbers(line)
+    registers.append("v9") # a copy
+    assert(get_v_and_p_numbers(line) == ["p0", "v1"])
+    assert(parse_line("    if-ge v5, v6, :cond_f\n").target == ":cond_f")
+    assert(parse_line("    goto :goto_0\n").registers == ())
+    assert(parse_line("    sget-object v0, Lfoo;->x:I\n").reference == "Lfoo;->x:I")
+    counts = take_parse_counts()
+    assert(counts["parsed"] == 4)
+    assert(counts["parse_reused"] == 3)
+    assert(take_parse_counts()["parsed"] == 0)
+
+    # the same errors as before, every time
+    for i in range(2):
+        try:
+            get_v_and_p_numbers("invoke-static/range {v3 .. p1}, Lcom/example/class1;->foo()Z;")
+            assert(False)
+        except ValueError:
+            pass
+
     print("ALL StringParsingLib TESTS PASSED")
 
 if __name__ == "__main__":
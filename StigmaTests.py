@@ -3,13 +3,31 @@ import SmaliMethodDef
 import SmaliClassDef
 import StigmaStringParsingLib
 import ControlFlowGraph
+import MethodAnalysis
 import TypeSafetyChecker
 import TaintTrackingInstrumentationPlugin
 import Instrumenter
+import InstrumentationWorker
+import InstrumentedClassCache
+import ClassFileIO
+import StigmaMetrics
+import PackageFilter
+import Stigma
+import StigmaDaemon
+import StigmaBatch
+from TaintStorageHandler import TaintStorageHandler
 
 import sys
 import re
 import subprocess
+import tempfile
+import os
+import shutil
+import time
+import signal
+import socket
+import threading
+import multiprocessing
 
 
 
@@ -45,6 +63,23 @@ def type_safety_checker_control_flow_test():
 	adjlist_result = str(list(cfg.generate_adjlist()))
 	assert(adjlist_result == adjlist_soln)
 	
+	# the predecessors are the edges the other way around
+	for node_counter in range(len(cfg)):
+		assert(cfg[node_counter]["node_counter"] == node_counter)
+		for successor in cfg.neighbors(node_counter):
+			assert(node_counter in list(cfg.predecessors(successor)))
+	assert("type_list" not in cfg[1])
+	cfg[1]["type_list"] = []
+	assert("type_list" in cfg[1])
+
+	# every node once, after its predecessors (other than the ones jumping back to it)
+	order = cfg.visit_order()
+	assert(sorted(order) == list(range(len(cfg))))
+	position = {node_counter: idx for idx, node_counter in enumerate(order)}
+	for source, destination in cfg.edges():
+		if(position[source] > position[destination]):
+			assert(destination <= source) # a back edge (e.g., a loop)
+
 	#cfg.show()
 
 
@@ -270,6 +305,31 @@ def type_saftey_checker_tests():
 	assert(cfg.node_counter == 4)
 	print("passed!")
 
+
+def type_safety_checker_loop_test():
+	print("\nRunning type safety checker loop test")
+	method_text = [".method public static f(I)I\n", "    .locals 3\n", "\n", "    const/4 v0, 0x0\n", "\n",
+		"    :goto_0\n", "    add-int/lit8 v0, v0, 0x1\n", "\n", "    const-string v2, \"a\"\n", "\n",
+		"    if-nez p0, :goto_0\n", "\n", "    return v0\n", ".end method\n"]
+	smd = SmaliMethodDef.SmaliMethodDef(method_text, None)
+	cfg = ControlFlowGraph.ControlFlowGraph(smd.raw_text)
+	tsc = TypeSafetyChecker.TypeSafetyChecker(smd.signature, cfg)
+	tsc.solve([None] + [list(SmaliMethodDef.SmaliCodeIterator(node["text"])) for node in cfg.blocks[1:]])
+	
+	# the types set before the loop are still known at its start (the 
+	# if-nez jumping back there comes later), they used to be cleared
+	loop_start = [node_counter for node_counter in range(len(cfg)) if cfg[node_counter]["text"][0].strip() == ":goto_0"][0]
+	type_map = cfg[loop_start]["type_list"][0]
+	assert(type_map["v0"] == "32-bit")
+	assert(type_map["p0"] == "I")
+	# v2 is only set inside of the loop
+	assert("v2" not in type_map)
+	assert(cfg[len(cfg) - 1]["type_list"][-1]["v2"] == "Ljava/lang/String;")
+	for node_counter in range(len(cfg)):
+		assert(cfg[node_counter]["visited"])
+	
+	print("passed!")
+
 def grow_locals_test_1():
 	print("\nRunning grow locals test")
 	print("\ttest/random_method1.smali")
@@ -500,6 +560,117 @@ def register_shuffling_test():
 	
 	
 	
+SHUFFLE_MARKER = "# IFT INSTRUCTIONS ADDED BY STIGMA to free up low numbered registers"
+SHUFFLE_MOVE = re.compile(r"^\s*(move(?:-object|-wide)?/16) (v\d+), (v\d+)\s*$")
+
+def register_numbers_in(line, num_locals):
+	# every register an instruction names, as v numbers (pN is
+	# v(num_locals + N)), {vA .. vB} counts every register in between
+	operands = line.split("\"")[0].split(None, 1)
+	if len(operands) < 2 or operands[0].startswith((".", ":", "#")):
+		return set()
+	numbers = set()
+	for letter, number in re.findall(r"\b([vp])(\d+)\b", operands[1]):
+		numbers.add(int(number) + (num_locals if letter == "p" else 0))
+	if " .. " in operands[1] and len(numbers) == 2:
+		numbers = set(range(min(numbers), max(numbers) + 1))
+	return numbers
+
+
+def check_register_shuffles(text, class_name):
+	# Checks every "free up low numbered registers" shuffle of an
+	# instrumented class on its own (not against a solution file):
+	# the registers saved right after the first marker are restored
+	# right before the second one, with the same kind of move, the
+	# registers they were saved in exist and are not used by anything
+	# in between.  Returns the number of shuffles.
+	lines = text.splitlines()
+	num_shuffles = 0
+	num_locals = num_registers = 0
+	idx = 0
+	while idx < len(lines):
+		line = lines[idx]
+		if line.startswith(".method"):
+			signature = SmaliMethodDef.SmaliMethodSignature(line, class_name)
+			num_params = signature.num_of_parameter_registers
+		elif line.strip().startswith(".locals"):
+			num_locals = int(line.split()[1])
+			num_registers = num_locals + num_params
+		elif line.strip().startswith(".registers"):
+			num_registers = int(line.split()[1])
+			num_locals = num_registers - num_params
+		elif line.strip() == SHUFFLE_MARKER:
+			end = idx + 1
+			while lines[end].strip() != SHUFFLE_MARKER:
+				end += 1
+			saves = []
+			pos = idx + 1
+			while SHUFFLE_MOVE.match(lines[pos]):
+				saves.append(SHUFFLE_MOVE.match(lines[pos]).groups())
+				pos += 1
+			restores = []
+			restore_start = end
+			while SHUFFLE_MOVE.match(lines[restore_start - 1]):
+				restore_start -= 1
+				restores.append(SHUFFLE_MOVE.match(lines[restore_start]).groups())
+			restores.reverse()
+			
+			assert(len(saves) > 0 and len(saves) == len(restores)), (class_name, idx)
+			saved_in = set()
+			for (opcode, dest, source), restore in zip(saves, restores):
+				assert(restore == (opcode, source, dest)), (class_name, idx)
+				width = 2 if opcode.startswith("move-wide") else 1
+				for number in range(int(dest[1:]), int(dest[1:]) + width):
+					assert(number < num_registers), (class_name, idx)
+					assert(number not in saved_in), (class_name, idx)
+					saved_in.add(number)
+			# and the freed registers are used
+			freed = set(int(source[1:]) for opcode, dest, source in saves)
+			used = set()
+			for between in lines[pos:restore_start]:
+				numbers = register_numbers_in(between, num_locals)
+				assert(not (numbers & saved_in)), (class_name, between)
+				used |= numbers
+			assert(used & freed), (class_name, idx)
+			num_shuffles += 1
+			idx = end
+		idx += 1
+	return num_shuffles
+
+
+def register_shuffle_check_test():
+	print("\nRunning register shuffle check test")
+	
+	# the solution files of the tests above
+	num_shuffles = 0
+	for f in ["./test/custom_class_soln.smali", "./test/makeOpenCloseAnimation_method_soln.smali",
+			"./test/onStartIntentSenderFromFragment_method_soln.smali", "./test/loadAnimation_method_soln.smali"]:
+		with open(f, "r") as fh:
+			text = fh.read()
+		num_shuffles += check_register_shuffles(text, SmaliClassDef.SmaliClassDef.extract_class_name(f))
+	assert(num_shuffles > 0)
+	
+	# and every class of the test files, instrumented now
+	storage_handler = TaintStorageHandler.get_instance()
+	num_shuffles = 0
+	for f in sorted(os.listdir("./test")):
+		if not f.endswith(".smali") or any(s in f for s in ["_result", "_soln", "_After", "Soln", "_grown", "_new"]):
+			continue
+		with open(os.path.join("./test", f), "r") as fh:
+			if not fh.readline().startswith(".class"):
+				continue # a method on its own
+		storage_handler.erase()
+		scd = SmaliClassDef.SmaliClassDef(os.path.join("./test", f))
+		scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+		scd.instrument()
+		num_shuffles += check_register_shuffles(scd.get_text(), scd.class_name)
+	assert(num_shuffles > 0)
+	
+	storage_handler.erase()
+	print("passed!")
+	
+	
+	
 def reversed_move_parameters_test():
 	print("\nRunning reversed move parameters test")
 	print("\ttest/supportActivity_method.smali")
@@ -777,6 +948,370 @@ def strange_insert_lines_at_beginning_placement():
 	
 	
 
+def parallel_instrumentation_test():
+	print("\nRunning parallel instrumentation test")
+	
+	class_files = ["./test/custom_class.smali", "./test/Main.smali", 
+		"./test/SupportActivity.smali", "./test/aget_test_class.smali",
+		"./test/double_move_result_line.smali", "./test/register_listeners_method.smali",
+		"./test/binarySearch_method.smali", "./test/0wH.smali"]
+	class_names = [SmaliClassDef.SmaliClassDef.extract_class_name(f) for f in class_files]
+	
+	# tiny storage classes so that the locations of these few classes
+	# are spread over many of them (the merge order matters)
+	storage_handler = TaintStorageHandler.get_instance()
+	metrics = StigmaMetrics.StigmaMetrics.get_instance()
+	old_max_fields = TaintStorageHandler.MAX_FIELDS
+	TaintStorageHandler.MAX_FIELDS = 7
+	
+	# the plain, serial way of doing it
+	storage_handler.erase()
+	serial_texts = []
+	for f in class_files:
+		scd = SmaliClassDef.SmaliClassDef(f)
+		scd.internal_class_names.extend(class_names)
+		scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+		scd.instrument()
+		serial_texts.append(scd.get_text())
+	serial_storage = str(storage_handler)
+	
+	cache_dir = tempfile.TemporaryDirectory()
+	cache = InstrumentedClassCache.InstrumentedClassCache(cache_dir.name, 10 ** 9)
+	
+	# no cache, cold cache, warm cache, streaming, a window smaller
+	# than the number of classes (largest first)
+	old_ordered_window = InstrumentationWorker.ORDERED_WINDOW
+	for jobs, class_cache, streaming, window in [(1, None, False, old_ordered_window), (3, None, False, old_ordered_window), 
+			(1, cache, False, old_ordered_window), (3, cache, False, old_ordered_window), (2, None, True, old_ordered_window), (2, None, False, 1)]:
+		print("\tjobs=" + str(jobs) + " cache=" + str(class_cache is not None) + " streaming=" + str(streaming) + " window=" + str(window))
+		storage_handler.erase()
+		metrics.erase()
+		InstrumentationWorker.ORDERED_WINDOW = window
+		results = InstrumentationWorker.instrument_classes(class_files, class_names, jobs, None, class_cache, streaming)
+		texts = []
+		for result, text in results:
+			texts.append(text)
+			
+			# counts collected during instrumentation must match
+			# what a second parse of the written class would give
+			lines = text.splitlines(keepends=True)
+			reparsed = SmaliClassDef.SmaliClassDef(result.path, lines)
+			assert(result.constant_pool_counts == reparsed.get_constant_pool_counts())
+			
+		assert(texts == serial_texts)
+		assert(str(storage_handler) == serial_storage)
+		
+		# the numbers of the worker processes are added up
+		assert(metrics.counters["files"] == len(class_files))
+		if class_cache is None:
+			assert(metrics.stages["parse"][2] == len(class_files))
+	
+	assert(cache.misses == len(class_files))
+	assert(cache.hits == len(class_files))
+	cache_dir.cleanup()
+	
+	InstrumentationWorker.ORDERED_WINDOW = old_ordered_window
+	TaintStorageHandler.MAX_FIELDS = old_max_fields
+	storage_handler.erase()
+	print("passed!")
+	
+	
+def package_filter_test():
+	print("\nRunning package filter test")
+	
+	class_files = ["./test/custom_class.smali", "./test/Main.smali", 
+		"./test/SupportActivity.smali", "./test/0wH.smali"]
+	
+	work_dir = tempfile.TemporaryDirectory()
+	os.makedirs(os.path.join(work_dir.name, "smali"))
+	for f in class_files:
+		shutil.copy(f, os.path.join(work_dir.name, "smali", os.path.basename(f)))
+	
+	# every class not in the same package as Main is left alone
+	main_class = SmaliClassDef.SmaliClassDef.extract_class_name("./test/Main.smali")
+	main_package = PackageFilter.PackageFilter.to_java_name(main_class).rsplit(".", 1)[0]
+	package_filter = PackageFilter.PackageFilter([main_package])
+	analytics = Stigma.runStigma(1, None, work_dir.name, "test.apk", package_filter)
+	assert(analytics["classes"] + analytics["excluded_classes"] == len(class_files))
+	assert(analytics["excluded_classes"] > 0)
+	
+	for f in class_files:
+		with open(f, "r") as fh:
+			original = fh.read()
+		with open(os.path.join(work_dir.name, "smali", os.path.basename(f)), "r") as fh:
+			written = fh.read()
+		class_name = SmaliClassDef.SmaliClassDef.extract_class_name(f)
+		assert((written == original) != package_filter.should_instrument(class_name))
+	
+	# the cheap scan of excluded classes matches a full parse
+	for f in class_files:
+		with open(f, "r") as fh:
+			lines = fh.readlines()
+		scd = SmaliClassDef.SmaliClassDef(f, lines)
+		assert(scd.get_constant_pool_counts() == SmaliClassDef.SmaliClassDef.count_constant_pools(lines))
+	
+	work_dir.cleanup()
+	TaintStorageHandler.get_instance().erase()
+	print("passed!")
+	
+
+
+def batch_instrument_test():
+	print("\nRunning batch instrument test")
+	
+	work_dir = tempfile.TemporaryDirectory()
+	os.makedirs(os.path.join(work_dir.name, "smali"))
+	for f in ["./test/custom_class.smali", "./test/Main.smali"]:
+		shutil.copy(f, os.path.join(work_dir.name, "smali", os.path.basename(f)))
+	
+	options = StigmaBatch.parse_args(["unused.apk"])
+	pool = multiprocessing.Pool(1, StigmaBatch._init_instrument_worker, (options,))
+	results = []
+	done = threading.Semaphore(0)
+	def callback(result):
+		results.append(result)
+		done.release()
+	
+	# every task calls back, also one that never gets to a worker
+	StigmaBatch.instrument_async(pool, work_dir.name, "test.apk", False, callback)
+	StigmaBatch.instrument_async(pool, work_dir.name, lambda: "not picklable", False, callback)
+	for i in range(2):
+		assert(done.acquire(timeout=120))
+	pool.close()
+	pool.join()
+	
+	instrumented = [result for result in results if "error" not in result]
+	failed = [result for result in results if "error" in result]
+	assert(len(instrumented) == 1 and len(failed) == 1)
+	assert(instrumented[0]["analytics"]["classes"] == 2)
+	assert("pickle" in failed[0]["error"])
+	
+	work_dir.cleanup()
+	TaintStorageHandler.get_instance().erase()
+	print("passed!")
+
+
+def daemon_test():
+	print("\nRunning daemon test")
+	
+	print("\tplugins already registered...")
+	# e.g., Stigma.main() in a job forked from the warmed up daemon
+	num_opcodes = len(Instrumenter.instrumentation_map)
+	Stigma.importPlugins()
+	assert(len(Instrumenter.instrumentation_map) == num_opcodes)
+	
+	# a hung daemon fails the test instead of hanging it
+	def timed_out(signum, frame):
+		raise TimeoutError("the daemon did not answer")
+	old_handler = signal.signal(signal.SIGALRM, timed_out)
+	
+	print("\tresults larger than a pipe...")
+	def big_job(request):
+		print("x" * 100000)
+		return {"status": "ok", "report": "y" * (1 << 20)}
+	client, handler = socket.socketpair()
+	sys.stdout.flush()
+	pid = os.fork()
+	if pid == 0:
+		client.close()
+		os._exit(StigmaDaemon.run_job(handler, {}, big_job))
+	handler.close()
+	signal.alarm(60)
+	messages = list(StigmaDaemon.read_messages(client))
+	signal.alarm(0)
+	client.close()
+	assert(os.waitpid(pid, 0)[1] == 0)
+	assert({"type": "progress", "line": "x" * 100000} in messages)
+	assert(messages[-1]["type"] == "result" and len(messages[-1]["report"]) == 1 << 20)
+	
+	print("\tserve and submit...")
+	test_dir = tempfile.TemporaryDirectory()
+	socket_path = os.path.join(test_dir.name, "stigma.sock")
+	old_timeout = StigmaDaemon.REQUEST_TIMEOUT
+	StigmaDaemon.REQUEST_TIMEOUT = 0.5
+	sys.stdout.flush()
+	pid = os.fork()
+	if pid == 0:
+		devnull = os.open(os.devnull, os.O_WRONLY)
+		os.dup2(devnull, 1)
+		os.dup2(devnull, 2)
+		try:
+			StigmaDaemon.StigmaDaemon(socket_path, 2).serve()
+		finally:
+			os._exit(0)
+	StigmaDaemon.REQUEST_TIMEOUT = old_timeout
+	for i in range(300):
+		if os.path.exists(socket_path):
+			break
+		time.sleep(0.1)
+	
+	# connects and never sends anything
+	silent_client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	silent_client.connect(socket_path)
+	
+	# a real apk (and apktool, keytool, jarsigner) runs the whole job,
+	# without one the job still runs until "apktool d" gives up on it
+	apk_path = os.environ.get("STIGMA_TEST_APK")
+	if apk_path is None:
+		apk_path = os.path.join(test_dir.name, "app.apk")
+		with open(apk_path, "wb") as fh:
+			fh.write(b"not really an apk")
+	signal.alarm(600)
+	result = StigmaDaemon.submit(apk_path, ["--metrics", os.path.join(test_dir.name, "metrics.json")], socket_path, True)
+	signal.alarm(0)
+	if "STIGMA_TEST_APK" in os.environ:
+		assert(result["status"] == "ok"), result.get("error")
+		assert(os.path.exists(result["output"]))
+		assert(result["metrics"]["stages"])
+	else:
+		assert(result["status"] == "failed")
+		assert("already registered" not in result["error"])
+		assert("apktool" in result["error"]), result["error"]
+	
+	silent_client.close()
+	signal.alarm(60)
+	StigmaDaemon.stop(socket_path)
+	os.waitpid(pid, 0)
+	signal.alarm(0)
+	signal.signal(signal.SIGALRM, old_handler)
+	test_dir.cleanup()
+	print("passed!")
+
+
+def mapped_class_file_test():
+	print("\nRunning mapped class file test")
+	
+	class_files = ["./test/custom_class.smali", "./test/Main.smali", 
+		"./test/SupportActivity.smali", "./test/0wH.smali"]
+	
+	work_dir = tempfile.TemporaryDirectory()
+	storage_handler = TaintStorageHandler.get_instance()
+	for f in class_files:
+		storage_handler.erase()
+		scd = SmaliClassDef.SmaliClassDef(f)
+		scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+		scd.instrument()
+		text = scd.get_text()
+		
+		storage_handler.erase()
+		path = os.path.join(work_dir.name, os.path.basename(f))
+		shutil.copy(f, path)
+		mapped = SmaliClassDef.SmaliClassDef.from_mapped_file(path)
+		
+		# the untouched methods are not even decoded
+		verbatim = [m for m in mapped.methods if m.verbatim]
+		assert(all(m.get_view() is not None for m in verbatim))
+		
+		mapped.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+		mapped.instrument()
+		assert(mapped.get_text() == text)
+		mapped.overwrite_to_file()
+		mapped.release()
+		with open(path, "r") as fh:
+			assert(fh.read() == text)
+	
+	work_dir.cleanup()
+	storage_handler.erase()
+	print("passed!")
+	
+
+
+def worker_mapped_class_test():
+	print("\nRunning worker mapped class test")
+	
+	# Main with a few methods no handler touches (their field and
+	# method references still count for the constant pools)
+	work_dir = tempfile.TemporaryDirectory()
+	with open("./test/Main.smali", "r") as fh:
+		text = fh.read()
+	text += "\n.method public abstract verbatim0()V\n.end method\n"
+	text += "\n.method public static verbatim1(Ljava/lang/invoke/MethodHandle;)V\n    .locals 2\n\n" + \
+		"    sget-volatile v0, LFoo;->bar:I\n\n" + \
+		"    invoke-polymorphic {p0, v0}, Ljava/lang/invoke/MethodHandle;->invoke([Ljava/lang/Object;)Ljava/lang/Object;, (I)V\n\n" + \
+		"    goto :goto_0\n\n    :goto_0\n    return-void\n.end method\n"
+	with_verbatim = os.path.join(work_dir.name, "MainWithVerbatim.smali")
+	with open(with_verbatim, "w") as fh:
+		fh.write(text)
+	
+	class_files = ["./test/custom_class.smali", "./test/Main.smali", 
+		"./test/SupportActivity.smali", "./test/0wH.smali", with_verbatim]
+	class_names = [SmaliClassDef.SmaliClassDef.extract_class_name(f) for f in class_files]
+	
+	# every get_lines() of a mapped class file, i.e., everything decoded
+	decoded = []
+	class RecordingMappedClassFile(ClassFileIO.MappedClassFile):
+		def get_lines(self, start=0, end=None):
+			decoded.append((start, end))
+			return super().get_lines(start, end)
+	
+	storage_handler = TaintStorageHandler.get_instance()
+	cache_dir = tempfile.TemporaryDirectory()
+	cache = InstrumentedClassCache.InstrumentedClassCache(cache_dir.name, 10 ** 9)
+	old_mapped_class_file = ClassFileIO.MappedClassFile
+	try:
+		for class_cache in [None, cache]:
+			InstrumentationWorker.init_worker(class_names, None, class_cache)
+			for f in class_files:
+				with open(f, "r") as fh:
+					lines = fh.readlines()
+				storage_handler.erase()
+				expected = InstrumentationWorker.instrument_class(0, f, lines)
+				
+				storage_handler.erase()
+				del decoded[:]
+				ClassFileIO.MappedClassFile = RecordingMappedClassFile
+				result = InstrumentationWorker.instrument_class(0, f)
+				ClassFileIO.MappedClassFile = old_mapped_class_file
+				
+				assert(result.text == expected.text)
+				assert(result.comparison_count == expected.comparison_count)
+				assert(result.constant_pool_counts == expected.constant_pool_counts)
+				
+				# neither the cache key nor the counting decoded
+				# the methods instrumentation left alone
+				assert((0, None) not in decoded)
+				with old_mapped_class_file(f) as mapped:
+					verbatim = [(start, end) for start, end in mapped.method_index 
+						if not SmaliMethodDef.SmaliMethodDef.needs_instrumentation_in(mapped.data, start, end)]
+				assert(len(verbatim) == (2 if f == with_verbatim else 0))
+				for start, end in verbatim:
+					assert((start, end) not in decoded)
+	finally:
+		ClassFileIO.MappedClassFile = old_mapped_class_file
+		InstrumentationWorker.init_worker([], None, None)
+	
+	cache_dir.cleanup()
+	work_dir.cleanup()
+	storage_handler.erase()
+	print("passed!")
+	
+	
+
+def method_analysis_test():
+	print("\nRunning method analysis test")
+	
+	# the analysis patched while instrumenting must be the same as one
+	# built from the instrumented lines
+	class_files = ["./test/custom_class.smali", "./test/Main.smali", 
+		"./test/SupportActivity.smali", "./test/0wH.smali"]
+	for f in class_files:
+		scd = SmaliClassDef.SmaliClassDef(f)
+		scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+		scd.instrument()
+		for m in scd.methods:
+			analysis = m.get_analysis()
+			fresh = MethodAnalysis.MethodAnalysis(m.raw_text)
+			assert(analysis.kinds == fresh.kinds)
+			assert(analysis.labels == fresh.labels)
+			assert(analysis.num_comparisons == fresh.num_comparisons)
+			assert(analysis.field_references == fresh.field_references)
+			assert(analysis.method_references == fresh.method_references)
+	
+	TaintStorageHandler.get_instance().erase()
+	print("passed!")
+	
+
+
 def internal_tests():
 	
 	print("--Running Internal Tests--")
@@ -784,7 +1319,10 @@ def internal_tests():
 	src_code_with_internal_tests = ["StigmaStringParsingLib.py", 
 		"SmaliMethodDef.py", "SmaliTypes.py", "SafeRegisterCollection.py",
 		"SmaliRegister.py", "SmaliAssemblyInstructions.py",
-		"Instrumenter.py", "TaintStorageHandler.py", "SmaliCodeIterator.py"]
+		"Instrumenter.py", "TaintStorageHandler.py", "SmaliCodeIterator.py",
+		"InstrumentedClassCache.py", "DecodedApkCache.py", "StigmaMetrics.py",
+		"PackageFilter.py", "ClassFileIO.py",
+		"StringPool.py", "MethodAnalysis.py", "TypeMap.py"]
 	
 	
 	for src in src_code_with_internal_tests:
@@ -806,6 +1344,7 @@ def main():
 	
 	types_from_parameters_test()
 	type_saftey_checker_tests()
+	type_safety_checker_loop_test()
 	
 	type_saftey_checker_test3()
 	type_safety_checker_control_flow_test()                   
@@ -841,10 +1380,19 @@ def main():
 	tried_to_get_class_from_non_reference_register_v0()
 	returning_uninitialized_object()
 	goto_tracking_bug()
+	register_shuffle_check_test()
 	
 	# star trek tests
 	strange_insert_lines_at_beginning_placement()
 	
+	parallel_instrumentation_test()
+	package_filter_test()
+	batch_instrument_test()
+	daemon_test()
+	mapped_class_file_test()
+	worker_mapped_class_test()
+	method_analysis_test()
+	
 	
 	print("\n\n")
 	print("+-------------------+")
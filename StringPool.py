@@ -0,0 +1,109 @@
+import sys
+
+
+# One copy of every class descriptor, method signature and field reference
+# of an app.
+#
+# The same references (e.g., "Landroid/telephony/TelephonyManager;->getDeviceId()Ljava/lang/String;")
+# show up in thousands of lines, every split of a line makes a new str for
+# them.  Whatever goes through canonical() is stored once and every user
+# gets that same object, which also makes dict lookups with it faster
+# (the hash is cached in the str and an equal key is found by identity).
+#
+# intern() gives the small int id of a string instead, get() turns it
+# back into the string.
+#
+# The pool lives as long as the run (erase() between apps, see
+# InstrumentationWorker.init_worker()), get_stats() tells how big it got.
+
+
+class StringPool:
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        #method to access StringPool Singleton
+        if StringPool.__instance == None:
+            StringPool()
+        return StringPool.__instance
+
+    def __init__(self):
+        #Virtually private constructor
+        if StringPool.__instance != None:
+            raise Exception("This class is a singleton!")
+        else:
+            StringPool.__instance = self
+            self._build()
+
+    def erase(self):
+        # start over (e.g., for the next app), ids of the old strings
+        # must not be used anymore
+        self._build()
+
+    def _build(self):
+        self.strings = [] # id => string
+        self.ids = {} # string => id
+        self.lookups = 0
+        self.hits = 0
+
+    def intern(self, s):
+        self.lookups += 1
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(s)
+            self.ids[s] = string_id
+        else:
+            self.hits += 1
+        return string_id
+
+    def canonical(self, s):
+        # the pooled str equal to s (s itself the first time)
+        return self.strings[self.intern(s)]
+
+    def get(self, string_id):
+        return self.strings[string_id]
+
+    def get_stats(self):
+        # "bytes": the strings themselves, "saved_bytes": the copies that
+        # were not kept because an equal string was already in the pool
+        # (estimated with the average size of a pooled string)
+        string_bytes = sum(sys.getsizeof(s) for s in self.strings)
+        average = string_bytes / len(self.strings) if self.strings else 0
+        return {"strings": len(self.strings), "bytes": string_bytes, "lookups": self.lookups,
+            "hits": self.hits, "saved_bytes": int(self.hits * average)}
+
+    def __len__(self):
+        return len(self.strings)
+
+
+
+def main():
+    print("Testing StringPool...")
+
+    pool = StringPool.get_instance()
+    pool.erase()
+
+    a = "Lfoo/Bar;->baz(I)V"
+    b = "".join(["Lfoo/Bar;", "->baz(I)V"]) # equal, but another object
+    assert(a is not b)
+    assert(pool.canonical(a) is a)
+    assert(pool.canonical(b) is a)
+    assert(pool.get(pool.intern(b)) is a)
+    assert(len(pool) == 1)
+
+    stats = pool.get_stats()
+    assert(stats["strings"] == 1)
+    assert(stats["lookups"] == 3)
+    assert(stats["hits"] == 2)
+    assert(stats["saved_bytes"] == 2 * sys.getsizeof(a))
+
+    pool.erase()
+    assert(len(pool) == 0)
+    assert(pool.get_stats()["lookups"] == 0)
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,19 @@
+import re
+
+from StringPool import StringPool
+
+
 GENERIC_STORAGE_CLASS_NAME = "net/stigmastorage/StorageClass"
 
+# Placeholder class used in accessors handed out while the handler is
+# "deferred" (see set_deferred()).  Which real StorageClassN a location
+# ends up in depends on every location added before it, so a worker
+# process instrumenting a single class cannot know it.  The parent
+# replays the recorded locations in serial order and then swaps the
+# placeholder for the real class with resolve_deferred_accessors().
+DEFERRED_STORAGE_CLASS_NAME = "net/stigmastorage/DeferredStorageClass"
+DEFERRED_ACCESSOR_REGEX = re.compile("L" + DEFERRED_STORAGE_CLASS_NAME + r";->([^\s:]+):F")
+
 
 # TODO provide a location for "return v0" tag propagation
 
@@ -56,35 +70,79 @@ class TaintStorageHandler:
 
         self.cache_locations = {}
         #key: smali location_field_name, value: storage class fq name
+        
+        # key: smali location_field_name, value: its accessor (built once,
+        # handed out for every sget / sput of the location)
+        self.accessors = {}
+        
+        # location names and accessors come from the app-wide StringPool,
+        # every handler asking for the same location gets the same str
+        self.string_pool = StringPool.get_instance()
+        
+        # when deferred, locations are only recorded (in order, including
+        # repeats) and accessors point at DEFERRED_STORAGE_CLASS_NAME
+        self.deferred = False
+        self.deferred_locations = []
             
 
     def add_taint_location(self, source_class_fqn, method_name, register_name):  
+        location_field_name = self.string_pool.canonical(TaintStorageHandler.gen_field_name(source_class_fqn, method_name, register_name))
+        
+        if self.deferred:
+            self.deferred_locations.append(location_field_name)
+            return self.string_pool.canonical("L" + DEFERRED_STORAGE_CLASS_NAME + ";->" + location_field_name + ":F")
+        
+        return self.add_taint_location_by_name(location_field_name)
+        
+    def add_taint_location_by_name(self, location_field_name):
+        # Note: the "storage class is full" check happens before the
+        # cache check, so even a repeated location can open a new
+        # storage class.  Replaying a recorded list of names through
+        # this method therefore reproduces the exact same state.
         if self.current_storage_class.get_locations_len() >= TaintStorageHandler.MAX_FIELDS:
             self.current_storage_class_num += 1
             self.current_storage_class = StorageClass(GENERIC_STORAGE_CLASS_NAME + 
                 str(self.current_storage_class_num))
             self.storage_classes.append(self.current_storage_class)
 
-        location_field_name = TaintStorageHandler.gen_field_name(source_class_fqn, method_name, register_name)
-        
-        if location_field_name in self.cache_locations:
-            return "L" + self.cache_locations[location_field_name] + ";->" + location_field_name + ":F"
+        accessor = self.accessors.get(location_field_name)
+        if accessor is not None:
+            return accessor
 
+        location_field_name = self.string_pool.canonical(location_field_name)
         self.cache_locations[location_field_name] = self.current_storage_class.get_storage_class_fqn()
         self.current_storage_class.add_taint_storage_location(location_field_name)
 
         #Returns FQ accessor in smali format of static taint location field
         #Example : sget v1, Lcom/alibaba/analytics/core/store/LogStoreMgr;->mLogChangeListeners_p0_TAINT:F
-        location_smali_accessor = "L" + self.current_storage_class.get_storage_class_fqn() + ";->" + location_field_name + ":F"
+        location_smali_accessor = self.string_pool.canonical("L" + self.current_storage_class.get_storage_class_fqn() + ";->" + location_field_name + ":F")
+        self.accessors[location_field_name] = location_smali_accessor
         return location_smali_accessor
     
+    def set_deferred(self, deferred):
+        self.deferred = deferred
+        
+    def take_deferred_locations(self):
+        # returns (and forgets) the locations recorded since the last call
+        ans = self.deferred_locations
+        self.deferred_locations = []
+        return ans
+        
+    def replay_locations(self, location_field_names):
+        for location_field_name in location_field_names:
+            self.add_taint_location_by_name(location_field_name)
+            
+    def resolve_deferred_accessors(self, text):
+        # every placeholder accessor in text must have been replayed already
+        return DEFERRED_ACCESSOR_REGEX.sub(lambda m: self.accessors[m.group(1)], text)
+
     #Try and use add_taint to immediatly get accessor. This is an expensive operation!
     def get_taint_location_accessor(self, source_class_fqn, method_name, register_name):
         location_field_name = TaintStorageHandler.gen_field_name(source_class_fqn, method_name, register_name)
         if location_field_name not in self.cache_locations:
             raise ValueError("Taint storaged accessed before created")
         
-        return "L" + self.cache_locations[location_field_name] + ";->" + location_field_name + ":F"
+        return self.accessors[location_field_name]
 
     def __repr__(self):
         all_locations = ""
@@ -200,6 +258,38 @@ def main():
     
     #print(result)
     assert(result == soln)
+    
+    
+    print("\tdeferred locations test...")
+    storageHandler.erase()
+    for i in range(1, TaintStorageHandler.MAX_FIELDS + 5):
+        storageHandler.add_taint_location("Example/com/class", "method", "v" + str(i))
+    serial_accessor = storageHandler.add_taint_location("Example/com/class", "method", "v3")
+    serial_storage = str(storageHandler)
+    
+    storageHandler.erase()
+    storageHandler.set_deferred(True)
+    recorded = []
+    for i in range(1, TaintStorageHandler.MAX_FIELDS + 5):
+        storageHandler.add_taint_location("Example/com/class", "method", "v" + str(i))
+        recorded.extend(storageHandler.take_deferred_locations())
+    deferred_accessor = storageHandler.add_taint_location("Example/com/class", "method", "v3")
+    recorded.extend(storageHandler.take_deferred_locations())
+    storageHandler.set_deferred(False)
+    
+    # nothing is stored until the locations are replayed
+    assert(storageHandler.storage_classes[0].get_locations_len() == 0)
+    assert(deferred_accessor == "Lnet/stigmastorage/DeferredStorageClass;->Example_com_class_method_v3:F")
+    storageHandler.replay_locations(recorded)
+    assert(str(storageHandler) == serial_storage)
+    assert(storageHandler.resolve_deferred_accessors("    sget v1, " + deferred_accessor + "\n") == "    sget v1, " + serial_accessor + "\n")
+    
+    print("\tpooled accessors test...")
+    # the same location gives the same str object every time
+    accessor = storageHandler.add_taint_location("Example/com/class", "method", "v3")
+    assert(accessor == serial_accessor)
+    assert(storageHandler.add_taint_location("Example/com/class", "method", "v3") is accessor)
+    assert(storageHandler.get_taint_location_accessor("Example/com/class", "method", "v3") is accessor)
 
     print("All Test Passed!")
     
@@ -201,7 +201,7 @@ def _move_result_instrumentation(scd, m, code_unit, free_reg):
     elif STRING_IMEI_FUNCTION in code_unit[0]: # short cut
         block = IMEI_instrumentation(scd, m, code_unit, free_reg)
         
-    elif re.search(StigmaStringParsingLib.BEGINS_WITH_FILLED_NEW_ARRAY, code_unit[0]) is not None: # short cut
+    elif StigmaStringParsingLib.begins_with(code_unit[0], StigmaStringParsingLib.BEGINS_WITH_FILLED_NEW_ARRAY): # short cut
         block = FILLED_NEW_ARRAY_instrumentation(scd, m, code_unit, free_reg)  
           
     else:
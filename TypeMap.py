@@ -0,0 +1,184 @@
+import sys
+
+
+# The types of the registers at one line of a method (register => SmaliType),
+# what TypeSafetyChecker keeps for every line, e.g.,
+#     {p0: Lcom/foo/Bar;, v0: 32-bit, v1: ?}
+#
+# Most lines don't change any type (.line, blank lines, labels) and the
+# others change one or two registers, but the TypeSafetyChecker used to
+# keep a full dict copy for every line: lines x live registers.  A TypeMap
+# only keeps the registers set at its line (changes) and a link to the map
+# it was copied from (parent).  Every SNAPSHOT_DEPTH links the whole map
+# is stored again (a snapshot), so a lookup never walks more than that.
+#
+# It reads like the dict it replaces (in, [], get, keys, items, values,
+# len, iteration, ==, str) with the registers in the same order: a copy()
+# followed by [] = gives the same map as dict.copy() followed by [] = did.
+# Writes are only for the map being built (the copy() of the line before),
+# once a map is handed out (TypeSafetyChecker.node_type_list) it doesn't
+# change anymore.  keys(), items(), iteration and len() of a snapshot use
+# its dict as is, only the maps that link to one build the whole map.
+
+# how many parent links a map may have before it is a snapshot again
+SNAPSHOT_DEPTH = 8
+
+
+class TypeMap:
+    __slots__ = ["parent", "changes", "depth"]
+
+    def __init__(self, types=None):
+        # a snapshot of types (a dict or a TypeMap)
+        self.parent = None
+        self.changes = {} if types is None else dict(types.items())
+        self.depth = 0
+
+    def copy(self):
+        # copy on write, the registers set on the copy go into its changes
+        child = TypeMap.__new__(TypeMap)
+        # a linked map that sets nothing is skipped, the copy links to the
+        # same map, one link less to walk
+        source = self if self.changes or self.parent is None else self.parent
+        if source.depth + 1 >= SNAPSHOT_DEPTH:
+            child.parent = None
+            child.changes = source.to_dict()
+            child.depth = 0
+        else:
+            child.parent = source
+            child.changes = {}
+            child.depth = source.depth + 1
+        return child
+
+    def to_dict(self):
+        # the whole map as a (new) dict
+        if self.parent is None:
+            return self.changes.copy()
+        chain = []
+        type_map = self
+        while type_map.parent is not None:
+            if type_map.changes:
+                chain.append(type_map.changes)
+            type_map = type_map.parent
+        ans = type_map.changes.copy()
+        while chain:
+            ans.update(chain.pop())
+        return ans
+
+    def get(self, reg, default=None):
+        type_map = self
+        while type_map is not None:
+            if reg in type_map.changes:
+                return type_map.changes[reg]
+            type_map = type_map.parent
+        return default
+
+    def get_num_bytes(self):
+        # what this map adds to the ones it links to
+        return sys.getsizeof(self) + sys.getsizeof(self.changes)
+
+    def keys(self):
+        if self.parent is None:
+            return self.changes.keys()
+        return self.to_dict().keys()
+
+    def values(self):
+        if self.parent is None:
+            return self.changes.values()
+        return self.to_dict().values()
+
+    def items(self):
+        if self.parent is None:
+            return self.changes.items()
+        return self.to_dict().items()
+
+    def __getitem__(self, reg):
+        type_map = self
+        while type_map is not None:
+            if reg in type_map.changes:
+                return type_map.changes[reg]
+            type_map = type_map.parent
+        raise KeyError(reg)
+
+    def __setitem__(self, reg, new_type):
+        self.changes[reg] = new_type
+
+    def __contains__(self, reg):
+        type_map = self
+        while type_map is not None:
+            if reg in type_map.changes:
+                return True
+            type_map = type_map.parent
+        return False
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        if self.parent is None:
+            return len(self.changes)
+        return len(self.to_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, TypeMap):
+            return self is other or self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __str__(self):
+        return str(self.to_dict())
+
+    def __repr__(self):
+        return str(self)
+
+
+
+def main():
+    print("Testing TypeMap...")
+
+    print("\tdict tests...")
+    types = {"p0": "LFoo;", "v0": "I"}
+    type_map = TypeMap(types)
+    assert(type_map == types and types == type_map)
+    types["v1"] = "J"
+    assert("v1" not in type_map) # a snapshot, not the dict itself
+
+    # the same as copying dicts, order and all
+    maps = [type_map]
+    dicts = [{"p0": "LFoo;", "v0": "I"}]
+    for i in range(3 * SNAPSHOT_DEPTH):
+        new_map = maps[-1].copy()
+        new_dict = dicts[-1].copy()
+        if i % 3 != 0:
+            new_map["v" + str(i % 5)] = str(i)
+            new_dict["v" + str(i % 5)] = str(i)
+        maps.append(new_map)
+        dicts.append(new_dict)
+    for type_map, d in zip(maps, dicts):
+        assert(type_map == d)
+        assert(str(type_map) == str(d))
+        assert(list(type_map.items()) == list(d.items()))
+        assert(list(type_map.keys()) == list(d.keys()) and list(type_map.values()) == list(d.values()))
+        assert(len(type_map) == len(d) and list(type_map) == list(d))
+        assert(type_map.depth < SNAPSHOT_DEPTH)
+        for reg in ["p0", "v0", "v3", "v9"]:
+            assert((reg in type_map) == (reg in d))
+            assert(type_map.get(reg) == d.get(reg))
+    assert(maps[1].parent is maps[0] and maps[1].changes == {})
+    assert(maps[2].parent is maps[0]) # maps[1] sets nothing
+    try:
+        maps[0]["v9"]
+        assert(False)
+    except KeyError:
+        pass
+
+    print("\tmemory tests...")
+    # a map that changes nothing costs the same no matter how many registers
+    big = TypeMap({"v" + str(i): "I" for i in range(200)})
+    assert(big.copy().get_num_bytes() < big.get_num_bytes() / 10)
+
+    print("All Test Passed!")
+
+
+if __name__ == "__main__":
+    main()
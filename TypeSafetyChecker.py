@@ -11,11 +11,20 @@ import SmaliAssemblyInstructions as smali
 import SmaliTypes
 
 from SmaliRegister import SmaliRegister
+from TypeMap import TypeMap
 
 import re
+import array
+import heapq
 
 
 
+# how often solve() type checks a label before the label gives up on its
+# predecessors and clears its map (every type "?"), so the fixpoint is
+# reached even if merging somehow kept changing the types
+MAX_LABEL_VISITS = 16
+
+
 class TypeSafetyChecker:
 
     def __init__(self, signature, cfg):
@@ -27,9 +36,11 @@ class TypeSafetyChecker:
         self.signature = signature        #method object stored in smd, used for parameter types of signature
        
         self.cfg = cfg          #instance of the control flow graph object for this method 
-        self.visited_nodes = [] #list of all nodes in the cfg that have already been visited        if(len(cfg.G)) == 0:
+        self.visited_nodes = [] #list of all nodes in the cfg that have already been visited        if(len(cfg)) == 0:
+        self.visits = array.array("i", [0]) * len(cfg) #how often solve() type checked each node
+        self.position = None #where each node is in the order solve() visits them
         
-        if(len(cfg.G)) == 1:
+        if(len(cfg)) == 1:
             return        
 
 
@@ -37,11 +48,11 @@ class TypeSafetyChecker:
         self.node_type_list = []
 
         # create a the first "types" hashmap for the types of parameters from the first line
-        self.most_recent_type_map = self.signature.parameter_type_map.copy()
+        self.most_recent_type_map = TypeMap(self.signature.parameter_type_map)
         
         self.node_type_list.append(self.most_recent_type_map)
-        self.cfg.G.nodes[0]["visited"] = True
-        self.cfg.G.nodes[0]["type_list"] = self.node_type_list
+        self.cfg[0]["visited"] = True
+        self.cfg[0]["type_list"] = self.node_type_list
     
                                             
   
@@ -65,12 +76,14 @@ class TypeSafetyChecker:
         # we use .copy()  This is a SHALLOW COPY!
         # a shallow copy seems adequate for our purposes
         #https://stackoverflow.com/questions/2465921/how-to-copy-a-dictionary-and-only-edit-the-copy
+        # the maps are TypeMaps (TypeMap.py), a copy only stores the registers 
+        # set on it, and a line that sets none shares the map of the line before
         '''
         
         line = str(code_unit[0])
         #print("\ttype_update(" + str(code_unit) + ")")
         
-        if(re.search(StigmaStringParsingLib.BEGINS_WITH_COLON, line) is not None):
+        if(StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_COLON)):
             new_map = self._type_update_colon(line, node_counter)
             
             
@@ -79,7 +92,7 @@ class TypeSafetyChecker:
             
             
         else: #.line 15, .locals 5, .end_method, etc.
-            new_map = self.most_recent_type_map.copy()
+            new_map = self.most_recent_type_map
                
         #print("updating most recent type map:", new_map)
         self.most_recent_type_map = new_map
@@ -91,41 +104,36 @@ class TypeSafetyChecker:
 
         #if the current line is a start of a label, check if there is 
         # a correlating if or goto statement that we have seen before this condition
-        if(re.search(StigmaStringParsingLib.BEGINS_WITH_PSWITCH_LABEL, line) is not None \
-        or re.search(StigmaStringParsingLib.BEGINS_WITH_SSWITCH_LABEL, line) is not None):
-            map_list = self.get_relevant_maps_to_merge(node_counter)        
-            line_type_map_new = self._merge_maps(map_list)
+        if(StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_PSWITCH_LABEL) \
+        or StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_SSWITCH_LABEL)):
+            line_type_map_new = self._merge_predecessor_maps(node_counter)
         
         
         #if the current line is a :catch label, reset everything because 
         # we dont know which line has caused the catch 
-        elif(re.search(StigmaStringParsingLib.BEGINS_WITH_CATCH_LABEL, line) is not None):
+        elif(StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_CATCH_LABEL)):
             cur_map = self.most_recent_type_map.copy()
             line_type_map_new = self._clear_map(cur_map)
             
         # if the current line is a start of a label for an if or a goto
-        elif(re.search(StigmaStringParsingLib.BEGINS_WITH_COLON, line) is not None):
-            tokens = StigmaStringParsingLib.break_into_tokens(line)
+        elif(StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_COLON)):
+            tokens = StigmaStringParsingLib.lex_line(line).tokens
             label = tokens[0]
             
             # check if there is a correlating if or goto statement 
-            # that we have seen before this condition / label
-            if(not self.has_matching_visited_label_parent(label, node_counter)):
-                # this is a situation where (:cond_x) statement has no instr
-                # (if-eqz :cond_4) preceding, (probably a loop)
-                #
-                # we have not yet type-analyzed whatever block(s) is /are
-                # the parent(s) of this block, so we can no longer 
-                # assume the type of any reg.  Some optimization
-                # is probably possible here!
+            # for this condition / label
+            if(not self.has_matching_label_parent(label, node_counter)):
+                # nothing jumps here (e.g., :try_start_0), we don't
+                # assume the type of any reg, like we always did
                 cur_map = self.most_recent_type_map.copy()
                 line_type_map_new = self._clear_map(cur_map)
 
 
             else:
                 #print("found preceeding if statement matching!")
-                map_list = self.get_relevant_maps_to_merge(node_counter)        
-                line_type_map_new = self._merge_maps(map_list)
+                # the if / goto might not have been type-analyzed yet
+                # (probably a loop), solve() comes back here once it is
+                line_type_map_new = self._merge_predecessor_maps(node_counter)
                 
 
         else:
@@ -133,6 +141,28 @@ class TypeSafetyChecker:
             
         
         return line_type_map_new
+    
+    
+    def _merge_predecessor_maps(self, node_counter):
+        # the merged maps of the predecessors type checked so far, or, if
+        # there are none or solve() gave up on this label, a cleared map
+        map_list = self.get_relevant_maps_to_merge(node_counter)
+        if(len(map_list) == 0 or self.visits[node_counter] > MAX_LABEL_VISITS):
+            cur_map = self.most_recent_type_map.copy()
+            return self._clear_map(cur_map)
+        new_map = self._merge_maps(map_list)
+        
+        # a register that only comes in through a back edge (it is first set
+        # inside of the loop) has no value when the loop is entered, so the
+        # code must set it again before using it and it stays free, like it
+        # was when the back edges were not merged at all
+        if(self.position is not None):
+            forward_maps = [self.cfg[parent]["type_list"][-1] for parent in self.cfg.predecessors(node_counter)
+                if "type_list" in self.cfg[parent] and self.position[parent] < self.position[node_counter]]
+            if(len(forward_maps) != 0):
+                forward_regs = set().union(*(m.keys() for m in forward_maps))
+                new_map = TypeMap({reg: reg_type for reg, reg_type in new_map.items() if reg in forward_regs})
+        return new_map
             
             
             
@@ -140,7 +170,7 @@ class TypeSafetyChecker:
     def _type_update_instruction(self, code_unit, is_first_line_of_method, node_counter):
         #print("type_update_instruction", code_unit)
         first_line = str(code_unit[0])
-        first_line_tokens = StigmaStringParsingLib.break_into_tokens(first_line)
+        first_line_tokens = StigmaStringParsingLib.lex_line(first_line).tokens
         first_instr = first_line_tokens[0]
         registers = [SmaliRegister(r) for r in StigmaStringParsingLib.get_v_and_p_numbers(first_line)]
         
@@ -168,7 +198,7 @@ class TypeSafetyChecker:
         
         last_line = str(code_unit[-1])
         if(len(code_unit) > 1 and \
-        re.search(StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT, last_line) is not None):
+        StigmaStringParsingLib.begins_with(last_line, StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT)):
             # an invoke-* instruction
             # or a filled-new-array instruction
             self._type_update_two_line_instruction(code_unit, line_type_map_new)
@@ -199,7 +229,7 @@ class TypeSafetyChecker:
                     input("Continue?")
                 TypeSafetyChecker._set_new_type_for_reg(line_type_map_new, dest_reg, return_type)
                       
-            elif(re.search(StigmaStringParsingLib.BEGINS_WITH_MOVE_OBJECT, first_instr) is not None):
+            elif(StigmaStringParsingLib.begins_with(first_instr, StigmaStringParsingLib.BEGINS_WITH_MOVE_OBJECT)):
                 dest_reg = registers[0]
                 src_reg = registers[1]
                 if src_reg in line_type_map_new:
@@ -222,7 +252,7 @@ class TypeSafetyChecker:
         last_line = code_unit[-1]
         dest_reg = SmaliRegister(StigmaStringParsingLib.get_v_and_p_numbers(last_line)[0])
         
-        if(re.search(StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT_OBJECT, last_line) is not None):
+        if(StigmaStringParsingLib.begins_with(last_line, StigmaStringParsingLib.BEGINS_WITH_MOVE_RESULT_OBJECT)):
             # this is a very special case.   move-result-object vx
             # may cause vx to be (a) an Object (b) an Array
             # if it is an array we need to know the type of that array
@@ -230,14 +260,14 @@ class TypeSafetyChecker:
             # in order to properly handle subsequent instructions
             # such as aget vy, vx
                             
-            if(re.search(StigmaStringParsingLib.BEGINS_WITH_INVOKE, first_line) is not None):
+            if(StigmaStringParsingLib.begins_with(first_line, StigmaStringParsingLib.BEGINS_WITH_INVOKE)):
                 type_start_index = first_line.rfind(")")
                 tmp = first_line[type_start_index+1:].strip() 
                 # note: .strip() removes the \n at the end of the line
                 # e.g., if the return type is: [I\n   we need only [I
                     
-            elif(re.search(StigmaStringParsingLib.BEGINS_WITH_FILLED_NEW_ARRAY, first_line) is not None):
-                first_line_tokens = StigmaStringParsingLib.break_into_tokens(first_line)
+            elif(StigmaStringParsingLib.begins_with(first_line, StigmaStringParsingLib.BEGINS_WITH_FILLED_NEW_ARRAY)):
+                first_line_tokens = StigmaStringParsingLib.lex_line(first_line).tokens
                 tmp = first_line_tokens[-1]
 
             # missing a check on the specificity level?
@@ -264,11 +294,13 @@ class TypeSafetyChecker:
 
     @staticmethod
     def _set_new_type_for_reg(type_map, dest_reg, new_type):
-        if dest_reg in type_map:
-            existing_reg_type = type_map[dest_reg]
+        # get() rather than in and [], each walks the TypeMap's links
+        existing_reg_type = type_map.get(dest_reg)
+        if existing_reg_type is not None:
             #print("existing", existing_reg_type, type(existing_reg_type))
             #print("new", new_type, type(new_type))
-            if existing_reg_type.get_generic_type() == new_type.get_generic_type():
+            # the same generic type (get_generic_type())
+            if (existing_reg_type.code ^ new_type.code) & SmaliTypes.GENERIC_MASK == 0:
                 if new_type.specificity_level < existing_reg_type.specificity_level:
                     return
                     
@@ -279,9 +311,8 @@ class TypeSafetyChecker:
         if(not isinstance(new_type, SmaliTypes.SixtyFourBit_2)):
             try:
                 prev_adj_reg = dest_reg + -1
-                if(prev_adj_reg in type_map):
-                    if(isinstance(type_map[prev_adj_reg], SmaliTypes.SixtyFourBit)):
-                        type_map[prev_adj_reg] = SmaliTypes.UnknownType() 
+                if(isinstance(type_map.get(prev_adj_reg), SmaliTypes.SixtyFourBit)):
+                    type_map[prev_adj_reg] = SmaliTypes.UnknownType() 
                         
             except ValueError:
                 # exception means the prev_adj_reg is "v-1" (dest reg is v0)
@@ -289,43 +320,101 @@ class TypeSafetyChecker:
             
     
     def get_relevant_maps_to_merge(self,node_counter):
-        '''This gets all maps from the predecessor nodes to merge'''
+        '''This gets the maps from the predecessor nodes to merge, the ones that have not been visited yet are left out'''
         revelant_maps = []
-        predecessors = list(self.cfg.G.predecessors(node_counter))
+        predecessors = list(self.cfg.predecessors(node_counter))
         #print("predecessors:", predecessors)
         for parent in predecessors:
-            if "type_list" not in self.cfg.G.nodes[parent]:
-                raise Exception("The parent node has not been visited yet.", self.cfg.G.nodes[parent]["text"])
-            parent_node_map = self.cfg.G.nodes[parent]["type_list"][-1]
+            if "type_list" not in self.cfg[parent]:
+                continue
+            parent_node_map = self.cfg[parent]["type_list"][-1]
             #print("map of", parent, ": ", parent_node_map)
             revelant_maps.append(parent_node_map)
         return revelant_maps
     
     
-    def has_matching_visited_label_parent(self, label, node_counter):
-        '''This checks if the preceding node has a matching label'''
-        predecessors = self.cfg.G.predecessors(node_counter)
+    def has_matching_label_parent(self, label, node_counter):
+        '''This checks if a preceding node (visited or not) jumps to the label'''
+        predecessors = self.cfg.predecessors(node_counter)
         for parent in predecessors:
-            parent_node = str(self.cfg.G.nodes[parent]["text"][0])
-            parent_node_tokens = StigmaStringParsingLib.break_into_tokens(parent_node)
-            if(len(parent_node_tokens) != 0) and label == parent_node_tokens[-1] and self.cfg.G.nodes[parent]["visited"] == True:
+            parent_node = str(self.cfg[parent]["text"][0])
+            parent_node_tokens = StigmaStringParsingLib.lex_line(parent_node).tokens
+            if(len(parent_node_tokens) != 0) and label == parent_node_tokens[-1]:
                 return True
         return False
     
     
+    def solve(self, block_units):
+        '''
+        Type checks every node of the cfg, over and over, until the types don't change anymore (a fixpoint)
+        @params block_units = the code units (SmaliCodeIterator) of each node, by node counter
+        
+        The nodes are taken in ControlFlowGraph.visit_order(), so a node comes after its predecessors except
+        the ones jumping back to it (e.g., at the end of a loop).  A label merges the maps of the predecessors
+        visited so far, and when the map at the end of a node changes, the visited nodes that depend on it (its
+        successors and the node after it, which starts from most_recent_type_map) are type checked again.  
+        Merging turns types into "?" and never back, so this ends, MAX_LABEL_VISITS makes sure it does.
+        Afterwards every node has a type_list with the map after each of its code units.
+        '''
+        order = self.cfg.visit_order()
+        position = array.array("i", [0]) * len(order)
+        for idx, node_counter in enumerate(order):
+            position[node_counter] = idx
+        self.position = position
+        
+        # positions in order, the worklist is a heap so the order is kept
+        worklist = [position[node_counter] for node_counter in order if not self.cfg[node_counter]["visited"]]
+        queued = bytearray(len(order))
+        for idx in worklist:
+            queued[order[idx]] = 1
+        
+        # node 0 keeps the type_list it got in __init__ (the map of the signature line)
+        self.node_type_list = []
+        while worklist:
+            node_counter = order[heapq.heappop(worklist)]
+            queued[node_counter] = 0
+            node = self.cfg[node_counter]
+            node["visited"] = True
+            self.visits[node_counter] += 1
+            
+            # a node continues from the types at the end of the node above it
+            # (if that one was visited already), like when walking in ascending order
+            if("type_list" in self.cfg[node_counter-1]):
+                self.most_recent_type_map = self.cfg[node_counter-1]["type_list"][-1]
+            
+            is_first_line = True
+            for unit in block_units[node_counter]:
+                self.type_update(unit, is_first_line, node_counter)
+                is_first_line = False
+            
+            old_type_list = node["type_list"] if "type_list" in node else None
+            node["type_list"] = self.node_type_list
+            self.node_type_list = []
+            if(old_type_list is not None and old_type_list[-1] == node["type_list"][-1]):
+                continue
+            
+            dependents = list(self.cfg.neighbors(node_counter))
+            if(node_counter + 1 < len(order)):
+                dependents.append(node_counter + 1)
+            for dependent in dependents:
+                if(not queued[dependent] and "type_list" in self.cfg[dependent]):
+                    queued[dependent] = 1
+                    heapq.heappush(worklist, position[dependent])
+    
+    
     def get_most_recent_type_map(self, node_counter):
-        predecessors_iterator = self.cfg.G.predecessors(node_counter) #this should always be just one node, call this on a block of code
+        predecessors_iterator = self.cfg.predecessors(node_counter) #this should always be just one node, call this on a block of code
         predecessors_list = list(predecessors_iterator)
         if(len(predecessors_list) > 1):
             raise ValueError("There are multiple predecessors? ", str(list(predecessors_iterator)))
             
         pred_num = predecessors_list[0]
         #print("\ncur: ", node_counter)
-        #print("cur code: ", self.cfg.G.nodes[node_counter]["text"])
+        #print("cur code: ", self.cfg[node_counter]["text"])
         #print("pred:", pred_num)
-        #print("pred code: ", self.cfg.G.nodes[pred_num]["text"])
-        #print("pred type list: ", self.cfg.G.nodes[pred_num]["type_list"])
-        return self.cfg.G.nodes[pred_num]["type_list"][-1]
+        #print("pred code: ", self.cfg[pred_num]["text"])
+        #print("pred type list: ", self.cfg[pred_num]["type_list"])
+        return self.cfg[pred_num]["type_list"][-1]
 
 
         
@@ -333,8 +422,8 @@ class TypeSafetyChecker:
         #this loops over the each line of text in each line and tries to find which node contains
         #the relevent line for query
         line = line.strip()
-        for node_counter in range(len(self.cfg.G)):
-            node = self.cfg.G.nodes[node_counter]
+        for node_counter in range(len(self.cfg)):
+            node = self.cfg[node_counter]
             node_text = node["text"]
             for line_index in range(len(node_text)):
                 if(node_text[line_index].strip() == line):
@@ -392,7 +481,7 @@ class TypeSafetyChecker:
         #this method takes in a node counter which is the current node we are looking at, so we can extract the text of that node and look 
         #for the last valid instruction to return
         
-        text = self.cfg.G.nodes[node_counter]["text"]
+        text = self.cfg[node_counter]["text"]
         cur_line = text[start]
         while(not StigmaStringParsingLib.is_valid_instruction(cur_line)):
             start = start-1
@@ -413,6 +502,9 @@ class TypeSafetyChecker:
         '''
         
         
+        # each map as a dict once, the lookups below would walk the links
+        # of a TypeMap for every register
+        map_list = [dict(m.items()) for m in map_list]
         new_map = {}
         register_set = set([])
         for m in map_list:
@@ -420,28 +512,26 @@ class TypeSafetyChecker:
             register_set.update(set(register_list))
         
 
+        unknown_type = SmaliTypes.UnknownType()
         for reg in register_set:
-            presumed_type = TypeSafetyChecker.get_register_presumed_type(reg,map_list)
+            # the join of the types (SmaliTypes.join(), int compares)
+            joined_type = TypeSafetyChecker.get_register_presumed_type(reg,map_list)
             for m in map_list:
-                if(reg not in m):
-                    new_map[reg] = SmaliTypes.UnknownType()
+                t = m.get(reg)
+                if(t is None or t.code != joined_type.code):
+                    joined_type = unknown_type
                     break
-                else:
-                    t = m[reg]
-                    if(t != presumed_type):
-                        new_map[reg] = SmaliTypes.UnknownType()
-                        break
             
-            if reg not in new_map:
-                new_map[reg] = presumed_type
+            new_map[reg] = joined_type
 
         #print("\nmerged map", new_map)
-        return new_map
+        return TypeMap(new_map)
         
     @staticmethod    
     def _clear_map(line_type_map_new):
+        unknown_type = SmaliTypes.UnknownType()
         for key, value in line_type_map_new.items():
-            line_type_map_new[key] = SmaliTypes.UnknownType() 
+            line_type_map_new[key] = unknown_type
         return line_type_map_new
         
     
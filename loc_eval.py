@@ -6,7 +6,7 @@ import sys
 import csv
 import os
 import glob
-import Stigma
+import StigmaBatch
 import numpy as np
 
 
@@ -26,28 +26,15 @@ def main():
     
     
     if(loc_befores == [] and loc_afters == []):
-        for apk in APKS:
-            apk_path = str(os.path.abspath(apk))
-            print("apk: " + apk_path)
-            sys.argv[1] = apk_path
-            
-            try:
-                Stigma.dumpApk()
-                loc_befores.append(Stigma.count_non_blank_lines_of_code())
-                
-                Stigma.runStigma()
-                Stigma.writeStorageClasses()
-                Stigma.splitSmali()
-                #Stigma.rebuildApk()   # not necessary for this eval
-                #StigmaExecutor.signApk() # not necessary for this eval
-                loc_afters.append(Stigma.count_non_blank_lines_of_code())
-                
-                
-                Stigma.deleteFiles()
-            except:
-                print("    Error processing this apk!")
-                loc_befores.append(0)
-                loc_afters.append(0)
+        # decode / instrument the apps in parallel, no need to rebuild
+        # or sign them for this eval
+        options = StigmaBatch.parse_args(APKS + ["--no-rebuild", "--count-loc"])
+        jobs = StigmaBatch.run_batch(APKS, options)
+        for job in jobs:
+            if(job.status != "ok"):
+                print("    Error processing this apk! " + job.apk_path)
+            loc_befores.append(job.analytics.get("loc_before", 0))
+            loc_afters.append(job.analytics.get("loc_after", 0))
 
     print("befores: " + str(loc_befores))
     print("afters: " + str(loc_afters))
@@ -0,0 +1,800 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import glob
+import time
+import tempfile
+import contextlib
+import tracemalloc
+
+import StigmaStringParsingLib
+import ControlFlowGraph
+import SmaliAssemblyInstructions
+import SmaliTypes
+from SmaliRegister import SmaliRegister
+from StringPool import StringPool
+import SmaliClassDef
+import Instrumenter
+import InstrumentationWorker
+import InstrumentedClassCache
+import ClassFileIO
+import TaintTrackingInstrumentationPlugin
+import TypeSafetyChecker
+import SmaliMethodDef
+import StigmaMetrics
+from TaintStorageHandler import TaintStorageHandler
+from SmaliCodeIterator import SmaliCodeIterator
+
+
+# Microbenchmarks for the smali parsing code, run on every line of the
+# .smali files in test/ (or the folder given as the first argument)
+#
+#     python3 parsing_eval.py [folder]
+#
+# Every benchmark compares the old way of doing something (re-implemented
+# here) with the current code, checks that both give the same answers and
+# prints the time of both and the speedup.
+
+REPEAT = 5
+
+
+def load_lines(folder):
+    lines = []
+    for path in sorted(glob.glob(folder + "/**/*.smali", recursive=True)):
+        with open(path, "r") as fh:
+            lines.extend(fh.readlines())
+    return lines
+
+
+def best_time(function, lines):
+    # best of REPEAT runs, returns (seconds, answers)
+    best = None
+    for i in range(REPEAT):
+        # the lexer cache must not carry over from the previous run
+        StigmaStringParsingLib._lex_cache.clear()
+        start_time = time.perf_counter()
+        ans = function(lines)
+        seconds = time.perf_counter() - start_time
+        if best is None or seconds < best:
+            best = seconds
+    return best, ans
+
+
+def report(name, old_function, new_function, lines):
+    old_seconds, old_ans = best_time(old_function, lines)
+    new_seconds, new_ans = best_time(new_function, lines)
+    assert(old_ans == new_ans), name + ": different answers"
+    print("%-28s old: %8.1f ms   new: %8.1f ms   speedup: %5.1fx" %
+        (name, old_seconds * 1000, new_seconds * 1000, old_seconds / new_seconds))
+
+
+
+# the regex based helpers, as they were before the lexer
+
+def old_is_not_branching(line):
+    for pattern in [StigmaStringParsingLib.BEGINS_WITH_IF, StigmaStringParsingLib.BEGINS_WITH_CMP,
+        StigmaStringParsingLib.BEGINS_WITH_COLON, StigmaStringParsingLib.BEGINS_WITH_RETURN,
+        StigmaStringParsingLib.BEGINS_WITH_GOTO, StigmaStringParsingLib.BEGINS_WITH_PACKED_SWITCH,
+        StigmaStringParsingLib.BEGINS_WITH_SPARSE_SWITCH]:
+        if (re.search(pattern, line) is not None):
+            return False
+    return True
+
+def old_break_into_tokens(line):
+    line = line.strip()
+    return line.split()
+
+def old_is_valid_instruction(line):
+    tokens = old_break_into_tokens(line)
+    opcode = "" if tokens == [] else tokens[0]
+    return opcode in StigmaStringParsingLib.ValidSmaliInstructions.SET
+
+def old_is_field_instruction(line):
+    for pattern in [StigmaStringParsingLib.BEGINS_WITH_SPUT, StigmaStringParsingLib.BEGINS_WITH_SGET,
+        StigmaStringParsingLib.BEGINS_WITH_IPUT, StigmaStringParsingLib.BEGINS_WITH_IGET]:
+        if re.search(pattern, line) is not None:
+            return True
+    return False
+
+def old_is_method_call_instruction(line):
+    return re.search(StigmaStringParsingLib.BEGINS_WITH_INVOKE, line) is not None
+
+
+# what a typical pass over a method asks about every line
+
+def old_line_queries(lines):
+    return [(old_is_not_branching(line), old_is_valid_instruction(line), old_is_field_instruction(line),
+        old_is_method_call_instruction(line), old_break_into_tokens(line)) for line in lines]
+
+def new_line_queries(lines):
+    return [(ControlFlowGraph.ControlFlowGraph.is_not_branching(line), StigmaStringParsingLib.is_valid_instruction(line),
+        StigmaStringParsingLib.is_field_instruction(line), StigmaStringParsingLib.is_method_call_instruction(line),
+        StigmaStringParsingLib.break_into_tokens(line)) for line in lines]
+
+
+def lexer_benchmark(lines):
+    print("Lexer (" + str(len(lines)) + " lines, best of " + str(REPEAT) + ")")
+    report("is_not_branching", lambda ls: [old_is_not_branching(l) for l in ls],
+        lambda ls: [ControlFlowGraph.ControlFlowGraph.is_not_branching(l) for l in ls], lines)
+    report("break_into_tokens", lambda ls: [old_break_into_tokens(l) for l in ls],
+        lambda ls: [StigmaStringParsingLib.break_into_tokens(l) for l in ls], lines)
+    report("is_field_instruction", lambda ls: [old_is_field_instruction(l) for l in ls],
+        lambda ls: [StigmaStringParsingLib.is_field_instruction(l) for l in ls], lines)
+    report("begins_with (.end method)",
+        lambda ls: [re.search(StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD, l) is not None for l in ls],
+        lambda ls: [StigmaStringParsingLib.begins_with(l, StigmaStringParsingLib.BEGINS_WITH_DOT_END_METHOD) for l in ls], lines)
+    report("all of the above per line", old_line_queries, new_line_queries, lines)
+
+
+
+# SmaliAssemblyInstruction.from_line() as it was, building a constructor
+# call as a string and eval()-ing it
+
+def old_from_line(raw_line_string):
+    line = raw_line_string.strip("\n")
+    if(StigmaStringParsingLib.is_comment(line)):
+        return SmaliAssemblyInstructions.COMMENT(line)
+    hash_pos = line.find("#")
+    if hash_pos != -1:
+        line = line[:hash_pos]
+    tokens = old_break_into_tokens(line)
+    if(len(tokens) == 0):
+        return SmaliAssemblyInstructions.BLANK_LINE()
+
+    opcode = tokens[0]
+    if(SmaliAssemblyInstructions.opcode_has_parameter_list(opcode) or SmaliAssemblyInstructions.opcode_has_parameter_range(opcode)):
+        args = line[line.index("{")+1:line.index("}")]
+        if args == "":
+            args = "[]"
+        else:
+            args = str(list(map(lambda x : x.strip(","), args.split(" "))))
+        args = [args, "\"" + tokens[-1] + "\""]
+    else:
+        args = list(map(lambda x : "\"" + str(x.strip(",")) + "\"", tokens[1:]))
+
+    opcode = opcode.upper().replace("/", "_").replace("-", "_")
+    if(opcode == "CONST_STRING" or opcode == "CONST_STRING_JUMBO"):
+        return SmaliAssemblyInstructions.SmaliAssemblyInstruction._build_const_string(opcode, line)
+    return eval(opcode + "(" + ", ".join(args) + ")", vars(SmaliAssemblyInstructions))
+
+
+def instruction_lines(lines):
+    # the lines TypeSafetyChecker builds instruction objects for
+    return [line for line in lines if StigmaStringParsingLib.is_valid_instruction(line)]
+
+
+class _PlainObject():
+    # an instruction object without __slots__
+    pass
+
+
+def from_line_benchmark(lines):
+    lines = instruction_lines(lines)
+    print("SmaliAssemblyInstruction.from_line (" + str(len(lines)) + " instructions, best of " + str(REPEAT) + ")")
+    from_line = SmaliAssemblyInstructions.SmaliAssemblyInstruction.from_line
+    report("from_line", lambda ls: [repr(old_from_line(l)) for l in ls],
+        lambda ls: [repr(from_line(l)) for l in ls], lines)
+
+    # memory of the objects, with and without __slots__ (the attributes
+    # are the same objects in both cases, only the instances are measured)
+    objects = [from_line(l) for l in lines]
+    attributes = []
+    for obj in objects:
+        names = [name for cls in type(obj).__mro__ for name in cls.__dict__.get("__slots__", [])]
+        attributes.append([(name, getattr(obj, name)) for name in names if hasattr(obj, name)])
+
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    plain_objects = []
+    for obj_attributes in attributes:
+        plain_object = _PlainObject()
+        for name, value in obj_attributes:
+            setattr(plain_object, name, value)
+        plain_objects.append(plain_object)
+    plain_bytes = tracemalloc.get_traced_memory()[0] - start_bytes
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    slotted_objects = []
+    for obj, obj_attributes in zip(objects, attributes):
+        slotted_object = object.__new__(type(obj))
+        for name, value in obj_attributes:
+            setattr(slotted_object, name, value)
+        slotted_objects.append(slotted_object)
+    slotted_bytes = tracemalloc.get_traced_memory()[0] - start_bytes
+    tracemalloc.stop()
+
+    print("%-28s old: %8.1f B    new: %8.1f B    (per object)" %
+        ("memory", plain_bytes / len(objects), slotted_bytes / len(objects)))
+
+
+
+class OldSmaliRegister():
+    # SmaliRegister as it was, parsed for every instance, hashed and
+    # compared through str()
+    def __init__(self, reg):
+        if(isinstance(reg, str)):
+            self._letter = reg[0]
+            self._number = int(reg[1:])
+        else:
+            self._letter = reg._letter
+            self._number = reg._number
+
+    def __str__(self):
+        return self._letter + str(self._number)
+
+    def __add__(self, other):
+        return OldSmaliRegister(self._letter + str(other + self._number))
+
+    def __eq__(self, other):
+        if(isinstance(other, OldSmaliRegister)):
+            return self._letter == other._letter and self._number == other._number
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+def register_work(register_class, names):
+    # what the type checker does with the registers of every line: make
+    # them, look them up in a type map and check the next register
+    type_map = {}
+    for name in names:
+        reg = register_class(name)
+        type_map[reg] = type_map.get(reg + 1, 0) + 1
+    return sorted((str(reg), count) for reg, count in type_map.items())
+
+
+def register_benchmark(lines):
+    names = []
+    for line in instruction_lines(lines):
+        try:
+            names.extend(StigmaStringParsingLib.get_v_and_p_numbers(line))
+        except Exception:
+            pass # e.g., a range
+    print("SmaliRegister (" + str(len(names)) + " register references, best of " + str(REPEAT) + ")")
+    report("construct, hash, +1", lambda ns: register_work(OldSmaliRegister, ns),
+        lambda ns: register_work(SmaliRegister, ns), names)
+
+    old_bytes, old_registers = retained_bytes(lambda: [OldSmaliRegister(name) for name in names])
+    new_bytes, new_registers = retained_bytes(lambda: [SmaliRegister(name) for name in names])
+    print("%-28s old: %8.1f KB   new: %8.1f KB" % ("memory", old_bytes / 1024, new_bytes / 1024))
+
+
+def method_bodies(lines):
+    # the lines of every method (.method ... .end method) in lines
+    methods = []
+    start = None
+    for idx, line in enumerate(lines):
+        if line.startswith(".method"):
+            start = idx
+        elif line.startswith(".end method") and start is not None:
+            methods.append(lines[start:idx+1])
+            start = None
+    return methods
+
+
+def load_method_bodies(folder):
+    # the lines of every method (.method ... .end method), as read from the files
+    methods = []
+    for path in sorted(glob.glob(folder + "/**/*.smali", recursive=True)):
+        with open(path, "r") as fh:
+            methods.extend(method_bodies(fh.readlines()))
+    return methods
+
+
+def retained_bytes(function):
+    # memory still allocated after function() returns, and its answer
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    ans = function()
+    ans_bytes = tracemalloc.get_traced_memory()[0] - start_bytes
+    tracemalloc.stop()
+    return ans_bytes, ans
+
+
+@contextlib.contextmanager
+def static_field_plugin():
+    # a plugin that only handles a few opcodes (static fields), instead of
+    # whatever signed up so far
+    saved_map = dict(Instrumenter.instrumentation_map)
+    saved_start_handler = Instrumenter.start_of_method_handler
+    saved_num_registers = Instrumenter.MAX_DESIRED_NUM_REGISTERS
+    Instrumenter.instrumentation_map.clear()
+    Instrumenter.start_of_method_handler = None
+    Instrumenter.MAX_DESIRED_NUM_REGISTERS = 1
+    for opcode in ["sget", "sget-object", "sput", "sput-object"]:
+        Instrumenter.instrumentation_map[opcode] = saved_map.get(opcode) or Instrumenter.InstrumentationSignupBundle(
+            opcode, TaintTrackingInstrumentationPlugin.SGET_instrumentation, 1, False)
+    try:
+        yield
+    finally:
+        Instrumenter.instrumentation_map.clear()
+        Instrumenter.instrumentation_map.update(saved_map)
+        Instrumenter.start_of_method_handler = saved_start_handler
+        Instrumenter.MAX_DESIRED_NUM_REGISTERS = saved_num_registers
+
+
+def verbatim_method_benchmark(folder):
+    # SmaliClassDef + grow_locals() + instrument() for the static field
+    # plugin, every method parsed and grown (old) vs. the untouched ones
+    # kept verbatim (new)
+    needs_instrumentation = SmaliClassDef.SmaliMethodDef.needs_instrumentation
+
+    def instrument_all(paths):
+        texts = []
+        for path in paths:
+            scd = SmaliClassDef.SmaliClassDef(path)
+            scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+            scd.instrument()
+            texts.append(scd.get_text())
+        return texts
+
+    def every_method_parsed(paths):
+        SmaliClassDef.SmaliMethodDef.needs_instrumentation = staticmethod(lambda text: True)
+        try:
+            return instrument_all(paths)
+        finally:
+            SmaliClassDef.SmaliMethodDef.needs_instrumentation = staticmethod(needs_instrumentation)
+
+    with static_field_plugin():
+        paths = []
+        for path in sorted(glob.glob(folder + "/**/*.smali", recursive=True)):
+            try:
+                every_method_parsed([path])
+                paths.append(path)
+            except Exception:
+                pass # not a class (e.g., a single method) or a known failure
+        old_seconds, old_texts = best_time(every_method_parsed, paths)
+        new_seconds, new_texts = best_time(instrument_all, paths)
+        verbatim = 0
+        methods = 0
+        for path in paths:
+            scd = SmaliClassDef.SmaliClassDef(path)
+            methods += len(scd.methods)
+            verbatim += sum(1 for m in scd.methods if m.verbatim)
+
+    # the untouched methods are not grown, so the texts differ
+    assert(len(old_texts) == len(new_texts))
+    print("Verbatim methods (" + str(verbatim) + " of " + str(methods) + " methods untouched, best of " + str(REPEAT) + ")")
+    print("%-28s old: %8.1f ms   new: %8.1f ms   speedup: %5.1fx" %
+        ("parse + grow + instrument", old_seconds * 1000, new_seconds * 1000, old_seconds / new_seconds))
+
+
+
+def mapped_class_benchmark(folder):
+    # read, parse, instrument and write one big class (every method of
+    # the test files, many times over) for the static field plugin:
+    # read as lines (old) vs. mapped (new)
+    methods = []
+    for method in load_method_bodies(folder):
+        if method[0].startswith(".method") and method[-1].strip() == ".end method":
+            methods.append("".join(method).rstrip("\n") + "\n")
+    text = ".class public LBig;\n.super Ljava/lang/Object;\n\n\n# direct methods\n"
+    copies = max(1, 30000 // sum(method.count("\n") for method in methods))
+    text += "\n".join(methods * copies)
+
+    def instrument(path, mapped, instrument=True):
+        TaintStorageHandler.get_instance().erase()
+        if mapped:
+            scd = SmaliClassDef.SmaliClassDef.from_mapped_file(path)
+        else:
+            scd = SmaliClassDef.SmaliClassDef(path)
+        if instrument:
+            scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+            scd.instrument()
+        scd.write_to_file(path + ".out")
+        scd.release()
+        with open(path + ".out", "r") as fh:
+            return fh.read()
+
+    with tempfile.TemporaryDirectory() as work_dir, static_field_plugin():
+        path = os.path.join(work_dir, "Big.smali")
+        with open(path, "w") as fh:
+            fh.write(text)
+        print("Mapped class files (" + str(text.count("\n")) + " lines, best of " + str(REPEAT) + ")")
+        report("read + parse + write", lambda p: instrument(p, False, False), lambda p: instrument(p, True, False), path)
+        report("read + instrument + write", lambda p: instrument(p, False), lambda p: instrument(p, True), path)
+
+        # what a worker process does with a class (--jobs N)
+        def worker_instrument(path, mapped):
+            TaintStorageHandler.get_instance().erase()
+            InstrumentationWorker.init_worker(["LBig;"])
+            lines = None if mapped else ClassFileIO.read_class_file(path)
+            return InstrumentationWorker.instrument_class(0, path, lines).text
+        report("worker instrument_class", lambda p: worker_instrument(p, False), lambda p: worker_instrument(p, True), path)
+
+        # a class cache hit: the key is made from the mapped bytes
+        cache = InstrumentedClassCache.InstrumentedClassCache(os.path.join(work_dir, "cache"), 10 ** 9)
+        def worker_cache_hit(path, mapped):
+            InstrumentationWorker.init_worker(["LBig;"], None, cache)
+            lines = None if mapped else ClassFileIO.read_class_file(path)
+            return InstrumentationWorker.instrument_class(0, path, lines).text
+        worker_cache_hit(path, False)
+        report("worker class cache hit", lambda p: worker_cache_hit(p, False), lambda p: worker_cache_hit(p, True), path)
+        InstrumentationWorker.init_worker([])
+
+
+
+def old_get_v_and_p_numbers(line):
+    # every call parsed the line again
+    try:
+        return StigmaStringParsingLib._get_v_and_p_numbers(line, StigmaStringParsingLib.break_into_tokens(line))
+    except Exception:
+        return None
+
+
+def new_get_v_and_p_numbers(line):
+    try:
+        return StigmaStringParsingLib.get_v_and_p_numbers(line)
+    except Exception:
+        return None
+
+
+def parsed_line_benchmark(folder, lines):
+    # the type checker, SafeRegisterCollection and a handler each ask
+    # for the registers of every instruction
+    print("ParsedLine (best of " + str(REPEAT) + ")")
+    def registers_3_times(get_registers, lines):
+        StigmaStringParsingLib._parse_cache.clear()
+        return [[get_registers(line) for i in range(3)] for line in lines]
+    report("registers, asked 3 times", lambda ls: registers_3_times(old_get_v_and_p_numbers, ls),
+        lambda ls: registers_3_times(new_get_v_and_p_numbers, ls), instruction_lines(lines))
+
+    # the parses saved while instrumenting the test classes
+    if Instrumenter.instrumentation_map == {}:
+        TaintTrackingInstrumentationPlugin.main()
+    StigmaStringParsingLib._lex_cache.clear()
+    StigmaStringParsingLib._parse_cache.clear()
+    StigmaStringParsingLib.take_parse_counts()
+    for path in ["test/custom_class.smali", "test/Main.smali", "test/SupportActivity.smali", "test/0wH.smali"]:
+        scd = SmaliClassDef.SmaliClassDef(path)
+        scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+        scd.instrument()
+    counts = StigmaStringParsingLib.take_parse_counts()
+    print("%-28s lexed: %6d  reused: %6d   parsed: %6d  reused: %6d" % ("instrumenting 4 classes",
+        counts["lexed"], counts["lex_reused"], counts["parsed"], counts["parse_reused"]))
+    TaintStorageHandler.get_instance().erase()
+
+
+
+def references(lines):
+    # the field / method reference of every field / method instruction,
+    # each a str of its own like the parser makes them
+    refs = []
+    for line in instruction_lines(lines):
+        if StigmaStringParsingLib.is_field_instruction(line) or StigmaStringParsingLib.is_method_call_instruction(line):
+            refs.append(StigmaStringParsingLib.break_into_tokens(line)[-1])
+    return refs
+
+
+def string_pool_benchmark(lines):
+    # references held by parsed lines / TaintStorageHandler keys, one str
+    # per occurrence vs one str per distinct reference (StringPool)
+    pool = StringPool.get_instance()
+    pool.erase()
+    StigmaStringParsingLib._lex_cache.clear()
+    refs = references(lines)
+    print("StringPool (" + str(len(refs)) + " references, " + str(len(set(refs))) + " distinct)")
+
+    old_bytes, old_refs = retained_bytes(lambda: [ref[:1] + ref[1:] for ref in refs])
+    new_bytes, new_refs = retained_bytes(lambda: [pool.canonical(ref[:1] + ref[1:]) for ref in refs])
+    assert(old_refs == new_refs)
+    print("%-28s old: %8.1f KB   new: %8.1f KB   (%.1fx less)" %
+        ("memory", old_bytes / 1024, new_bytes / 1024, old_bytes / new_bytes))
+
+    # a table keyed by the pooled strings (like TaintStorageHandler.accessors),
+    # equal strs must be compared char by char, the same str is found by identity
+    table = {ref: idx for idx, ref in enumerate(new_refs)}
+    def lookups(keys):
+        return [table[key] for i in range(10) for key in keys]
+    report("10 dict lookups / reference", lambda ks: lookups(old_refs), lambda ks: lookups(new_refs), None)
+    stats = pool.get_stats()
+    print("%-28s strings: %6d  lookups: %6d  hits: %6d  saved: %8.1f KB" % ("pool stats",
+        stats["strings"], stats["lookups"], stats["hits"], stats["saved_bytes"] / 1024))
+    pool.erase()
+
+
+
+def switch_method(cases):
+    # a method with a packed-switch of cases cases, each case an if
+    # and a goto back to a loop head, like the huge generated methods
+    # (state machines, resource tables) of some apps
+    lines = [".method public static f(I)I\n", "    .locals 2\n", "\n", "    const/4 v0, 0x0\n", "\n",
+        "    :goto_0\n", "    packed-switch p0, :pswitch_data_0\n", "\n", "    return v0\n", "\n"]
+    for case in range(cases):
+        lines += ["    :pswitch_" + str(case) + "\n", "    add-int/lit8 v0, v0, 0x1\n", "\n",
+            "    if-eqz v0, :cond_" + str(case) + "\n", "    const/4 v1, 0x1\n", "\n",
+            "    :cond_" + str(case) + "\n", "    goto :goto_0\n", "\n"]
+    lines += ["    :pswitch_data_0\n", "    .packed-switch 0x0\n"]
+    lines += ["        :pswitch_" + str(case) + "\n" for case in range(cases)]
+    lines += ["    .end packed-switch\n", ".end method\n"]
+    return lines
+
+
+def cfg_scaling_benchmark():
+    # building the ControlFlowGraph of bigger and bigger methods, the
+    # time per line should stay the same
+    print("ControlFlowGraph scaling (best of " + str(REPEAT) + ")")
+    for cases in [250, 500, 1000, 2000, 4000]:
+        method = switch_method(cases)
+        seconds, cfg = best_time(ControlFlowGraph.ControlFlowGraph, method)
+        assert(len(cfg) == 7 + 6 * cases)
+        print("%-28s %8.1f ms   %6.2f us / line" % (str(len(method)) + " lines", seconds * 1000, seconds * 1e6 / len(method)))
+
+
+
+def old_schedule(cfg):
+    # the loop SmaliMethodDef.instrument() had before the worklist, one
+    # nodes_left_to_visit() (a walk over every node) per block
+    for node_counter in range(1, len(cfg)):
+        cfg[node_counter]["visited"] = False
+    visited = 0
+    counter = 1
+    while cfg.nodes_left_to_visit():
+        node = cfg[counter]
+        if not node["visited"]:
+            node["visited"] = True
+            visited += 1
+        counter += 1
+    return visited
+
+
+def new_schedule(cfg):
+    for node_counter in range(1, len(cfg)):
+        cfg[node_counter]["visited"] = False
+    visited = 0
+    for counter in cfg.visit_order():
+        node = cfg[counter]
+        if not node["visited"]:
+            node["visited"] = True
+            visited += 1
+    return visited
+
+
+def schedule_benchmark():
+    # the order SmaliMethodDef.instrument() visits the blocks of methods
+    # with thousands of blocks in
+    print("Block scheduling (best of " + str(REPEAT) + ")")
+    for cases in [250, 500, 1000, 2000]:
+        cfg = ControlFlowGraph.ControlFlowGraph(switch_method(cases))
+        cfg[0]["visited"] = True
+        report(str(len(cfg)) + " blocks", old_schedule, new_schedule, cfg)
+
+
+
+class OldTypeSafetyChecker(TypeSafetyChecker.TypeSafetyChecker):
+    # the TypeSafetyChecker before the fixpoint: every node is type checked
+    # once and a label clears its map (every type "?") unless the if / goto
+    # jumping to it was type checked already
+
+    def solve(self, block_units):
+        self.node_type_list = []
+        for node_counter in self.cfg.visit_order():
+            node = self.cfg[node_counter]
+            if node["visited"]:
+                continue
+            node["visited"] = True
+            if "type_list" in self.cfg[node_counter - 1]:
+                self.most_recent_type_map = self.cfg[node_counter - 1]["type_list"][-1]
+            is_first_line = True
+            for unit in block_units[node_counter]:
+                self.type_update(unit, is_first_line, node_counter)
+                is_first_line = False
+            node["type_list"] = self.node_type_list
+            self.node_type_list = []
+
+    def _merge_predecessor_maps(self, node_counter):
+        line = str(self.cfg[node_counter]["text"][0])
+        label = StigmaStringParsingLib.break_into_tokens(line)[0]
+        is_switch_label = StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_PSWITCH_LABEL) or \
+            StigmaStringParsingLib.begins_with(line, StigmaStringParsingLib.BEGINS_WITH_SSWITCH_LABEL)
+        visited_parent = any(self.cfg[parent]["visited"] and
+            StigmaStringParsingLib.break_into_tokens(str(self.cfg[parent]["text"][0]))[-1:] == [label]
+            for parent in self.cfg.predecessors(node_counter))
+        if not is_switch_label and not visited_parent:
+            return self._clear_map(self.most_recent_type_map.copy())
+        return self._merge_maps(self.get_relevant_maps_to_merge(node_counter))
+
+
+@contextlib.contextmanager
+def type_checker(checker_class):
+    # SmaliMethodDef.instrument() type checks with checker_class
+    saved_class = SmaliMethodDef.TypeSafetyChecker
+    SmaliMethodDef.TypeSafetyChecker = checker_class
+    try:
+        yield
+    finally:
+        SmaliMethodDef.TypeSafetyChecker = saved_class
+
+
+def type_inference_benchmark(folder):
+    # every method of the test files instrumented, type checked in one
+    # pass (old) vs. until the types settle (new): how many instructions
+    # got instrumented, how often there were not enough free registers and
+    # how many register types were known ("?" is not known)
+    if Instrumenter.instrumentation_map == {}:
+        TaintTrackingInstrumentationPlugin.main()
+    metrics = StigmaMetrics.StigmaMetrics.get_instance()
+    methods = [method for method in load_method_bodies(folder) if method[-1].strip() == ".end method"]
+    text = ".class public LTypes;\n.super Ljava/lang/Object;\n\n\n# direct methods\n" + \
+        "\n".join("".join(method).rstrip("\n") + "\n" for method in methods)
+
+    def instrument(path, checker_class):
+        TaintStorageHandler.get_instance().erase()
+        metrics.take_snapshot()
+        with type_checker(checker_class):
+            start_time = time.perf_counter()
+            scd = SmaliClassDef.SmaliClassDef(path)
+            scd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+            scd.instrument()
+            seconds = time.perf_counter() - start_time
+        instrumented = sum(entry[1] for opcode, entry in metrics.take_snapshot()["handlers"].items() if opcode != "<method start>")
+        not_enough = sum(m.not_enough_free_registers_count for m in scd.methods)
+        known = unknown = 0
+        for m in scd.methods:
+            if m.verbatim or m.cfg is None or len(m.cfg) == 1:
+                continue
+            for node in m.cfg.blocks[1:]:
+                for type_map in node["type_list"]:
+                    num_unknown = sum(1 for t in type_map.values() if t == "?")
+                    unknown += num_unknown
+                    known += len(type_map) - num_unknown
+        return seconds, instrumented, not_enough, known, unknown
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "Types.smali")
+        with open(path, "w") as fh:
+            fh.write(text)
+        old = instrument(path, OldTypeSafetyChecker)
+        new = instrument(path, TypeSafetyChecker.TypeSafetyChecker)
+    print("Type inference (" + str(len(methods)) + " methods)")
+    print("%-28s old: %8.1f ms   new: %8.1f ms" % ("instrument", old[0] * 1000, new[0] * 1000))
+    for idx, name in [(1, "instrumented instructions"), (2, "not enough registers"), (3, "known register types"), (4, "unknown register types")]:
+        print("%-28s old: %8d      new: %8d      (%+d)" % (name, old[idx], new[idx], new[idx] - old[idx]))
+
+
+
+def type_check(methods):
+    # the type maps of every line of methods, the way
+    # SmaliMethodDef.instrument() makes them
+    type_lists = []
+    for method in methods:
+        smd = SmaliMethodDef.SmaliMethodDef(list(method), SmaliClassDef.MockSmaliClassDef())
+        smd.grow_locals(Instrumenter.MAX_DESIRED_NUM_REGISTERS)
+        cfg = ControlFlowGraph.ControlFlowGraph(smd.raw_text)
+        tsc = TypeSafetyChecker.TypeSafetyChecker(smd.signature, cfg)
+        if len(cfg) == 1:
+            continue
+        tsc.solve([None] + [list(SmaliCodeIterator(node["text"])) for node in cfg.blocks[1:]])
+        type_lists.extend(node["type_list"] for node in cfg.blocks)
+    return type_lists
+
+
+@contextlib.contextmanager
+def dict_type_maps():
+    # the TypeSafetyChecker with a dict for every map, like before TypeMap
+    saved_class = TypeSafetyChecker.TypeMap
+    TypeSafetyChecker.TypeMap = dict
+    try:
+        yield
+    finally:
+        TypeSafetyChecker.TypeMap = saved_class
+
+
+def type_map_bytes(type_lists):
+    # the memory of the type maps: a dict for every line (old) vs. the
+    # TypeMaps, each counted once, with the ones they link to (new)
+    dict_bytes = sum(sys.getsizeof(type_map.to_dict()) for type_list in type_lists for type_map in type_list)
+    linked = {}
+    for type_list in type_lists:
+        for type_map in type_list:
+            while type_map is not None and id(type_map) not in linked:
+                linked[id(type_map)] = type_map
+                type_map = type_map.parent
+    return dict_bytes, sum(type_map.get_num_bytes() for type_map in linked.values())
+
+
+def type_map_benchmark(folder):
+    # memory of the type maps the TypeSafetyChecker keeps: a full dict copy
+    # for every line (old) vs. TypeMaps, only the registers set at a line
+    # (new), for test/executeOpsTogether_method.smali and every method
+    with open(os.path.join(folder, "executeOpsTogether_method.smali"), "r") as fh:
+        inputs = [("executeOpsTogether", method_bodies(fh.readlines())), ("every method", load_method_bodies(folder))]
+    print("Type maps (kept for every line)")
+    for name, methods in inputs:
+        with dict_type_maps():
+            old_type_lists = type_check(methods)
+        new_type_lists = type_check(methods)
+        assert(old_type_lists == new_type_lists)
+        old_bytes, new_bytes = type_map_bytes(new_type_lists)
+        num_maps = sum(len(type_list) for type_list in new_type_lists)
+        print("%-28s old: %8.1f KB   new: %8.1f KB   (%.1fx less, %d maps)" %
+            (name, old_bytes / 1024, new_bytes / 1024, old_bytes / new_bytes, num_maps))
+
+    # only the type checking is timed, the maps compare as they are (a
+    # TypeMap == dict), turning every TypeMap into a dict took 20 ms
+    def old_type_check(methods):
+        with dict_type_maps():
+            return type_check(methods)
+    report("type check every method", old_type_check, type_check, inputs[1][1])
+
+
+
+class NoCache(dict):
+    # a dict which forgets everything put into it
+    def __setitem__(self, key, value):
+        pass
+
+
+@contextlib.contextmanager
+def uninterned_types():
+    # SmaliTypes making a new object for every type, like before interning
+    # (they still compare by code)
+    saved_intern = SmaliTypes.SmaliType._intern
+    saved_interned = dict(SmaliTypes.SmaliType._interned)
+    saved_parsed = SmaliTypes._parsed
+    def intern(cls, raw_type_string):
+        SmaliTypes.SmaliType._interned.clear()
+        return saved_intern(cls, raw_type_string)
+    SmaliTypes.SmaliType._intern = staticmethod(intern)
+    SmaliTypes._parsed = NoCache()
+    try:
+        yield
+    finally:
+        SmaliTypes.SmaliType._intern = saved_intern
+        SmaliTypes.SmaliType._interned.update(saved_interned)
+        SmaliTypes._parsed = saved_parsed
+
+
+def type_objects(type_lists):
+    # how many different SmaliType objects the type maps hold, and their bytes
+    types = {}
+    for type_list in type_lists:
+        for type_map in type_list:
+            for smali_type in type_map.values():
+                types[id(smali_type)] = smali_type
+    return len(types), sum(sys.getsizeof(t) + sys.getsizeof(t.__dict__) for t in types.values())
+
+
+def smali_type_benchmark(folder):
+    # the SmaliTypes of the type maps of every method, a new object for
+    # every type (old) vs. interned ones (new)
+    methods = load_method_bodies(folder)
+    with uninterned_types():
+        old_objects, old_bytes = type_objects(type_check(methods))
+    new_objects, new_bytes = type_objects(type_check(methods))
+    print("SmaliTypes (type maps of every method)")
+    print("%-28s old: %8d      new: %8d      (%.1fx less, %.1f KB -> %.1f KB)" %
+        ("type objects", old_objects, new_objects, old_objects / new_objects, old_bytes / 1024, new_bytes / 1024))
+
+    def old_type_check(methods):
+        with uninterned_types():
+            return [[type_map.to_dict() for type_map in type_list] for type_list in type_check(methods)]
+    def new_type_check(methods):
+        return [[type_map.to_dict() for type_map in type_list] for type_list in type_check(methods)]
+    report("type check every method", old_type_check, new_type_check, methods)
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else "test"
+    lines = load_lines(folder)
+    lexer_benchmark(lines)
+    from_line_benchmark(lines)
+    register_benchmark(lines)
+    parsed_line_benchmark(folder, lines)
+    verbatim_method_benchmark(folder)
+    mapped_class_benchmark(folder)
+    string_pool_benchmark(lines)
+    cfg_scaling_benchmark()
+    schedule_benchmark()
+    type_inference_benchmark(folder)
+    type_map_benchmark(folder)
+    smali_type_benchmark(folder)
+
+
+if __name__ == "__main__":
+    main()